@@ -0,0 +1,214 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import re
+import glob
+import struct
+import time
+import zlib
+
+
+## An archive holds the zlib compressed chunks one after another, then a
+## JSON index, then a footer of the index offset and length and the magic.
+Magic = b'RPA1'
+Footer = struct.Struct('>QI4s')
+Extension = '.arc'
+
+## Closed day files the archiver looks for
+DayFiles = [os.path.join('/', 'var', 'log', 'Kegerator', '[0-9]'*8+'.txt'),
+            os.path.join('/', 'home', 'joshw', 'logs', '[0-9]'*8+'_log.txt')]
+
+
+def line_timestamp(line):
+    '''Return the leading epoch microsecond timestamp of a data line, or None
+    for a header or comment line.
+    '''
+    MatchObj = re.match(r'(\d+)[ ,]', line)
+    return int(MatchObj.group(1)) if MatchObj else None
+
+
+##-------------------------------------------------------------------------
+## Write an Archive
+##-------------------------------------------------------------------------
+def write_archive(lines, filename, chunk_seconds=3600, level=9):
+    '''Pack the lines of a day file into compressed chunks of chunk_seconds
+    each.  Header lines (those without a leading timestamp, before the first
+    data line) are kept in the index; any later comment lines are dropped.
+    Returns the number of chunks written.
+    '''
+    header = []
+    chunks = []
+    for line in lines:
+        timestamp = line_timestamp(line)
+        if timestamp is None:
+            if len(chunks) == 0:
+                header.append(line)
+            continue
+        slot = timestamp // int(chunk_seconds * 1e6)
+        if len(chunks) == 0 or chunks[-1][0] != slot:
+            chunks.append([slot, timestamp, timestamp, []])
+        chunks[-1][1] = min(chunks[-1][1], timestamp)
+        chunks[-1][2] = max(chunks[-1][2], timestamp)
+        chunks[-1][3].append(line)
+    index = {'header': header, 'chunks': []}
+    with open(filename, 'wb') as FO:
+        for slot, first, last, chunk_lines in chunks:
+            data = zlib.compress(''.join(chunk_lines).encode('utf-8'), level)
+            index['chunks'].append([first, last, FO.tell(), len(data), len(chunk_lines)])
+            FO.write(data)
+        offset = FO.tell()
+        encoded = json.dumps(index).encode('utf-8')
+        FO.write(encoded)
+        FO.write(Footer.pack(offset, len(encoded), Magic))
+    return len(index['chunks'])
+
+
+##-------------------------------------------------------------------------
+## Define Archive Reader Class
+##-------------------------------------------------------------------------
+class ArchiveReader(object):
+    '''Random access to an archive.  Only the small index is read when the
+    archive is opened; lines() then reads and decompresses just the chunks
+    which overlap the requested time range.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as FO:
+            FO.seek(-Footer.size, os.SEEK_END)
+            offset, length, magic = Footer.unpack(FO.read(Footer.size))
+            assert magic == Magic, '{} is not an archive'.format(filename)
+            FO.seek(offset)
+            index = json.loads(FO.read(length).decode('utf-8'))
+        self.header = index['header']
+        self.chunks = index['chunks']
+        self.decompressed = 0
+
+    def lines(self, start=None, end=None, header=True):
+        '''Return the lines with start <= timestamp < end (microseconds, None
+        for an open end), preceded by the header lines.
+        '''
+        output = list(self.header) if header else []
+        with open(self.filename, 'rb') as FO:
+            for first, last, offset, length, count in self.chunks:
+                if (start is not None and last < start) or (end is not None and first >= end):
+                    continue
+                FO.seek(offset)
+                chunk_lines = zlib.decompress(FO.read(length)).decode('utf-8').splitlines(True)
+                self.decompressed += 1
+                if (start is None or first >= start) and (end is None or last < end):
+                    output.extend(chunk_lines)
+                else:
+                    output.extend([line for line in chunk_lines\
+                                   if (start is None or line_timestamp(line) >= start)\
+                                   and (end is None or line_timestamp(line) < end)])
+        return output
+
+
+##-------------------------------------------------------------------------
+## Transparent Reading of Day Files
+##-------------------------------------------------------------------------
+def exists(path):
+    '''True if a day file exists, either as text or archived.
+    '''
+    return os.path.exists(path) or os.path.exists(path + Extension)
+
+
+def read_lines(path, start=None, end=None):
+    '''Read the lines of a day file (header lines first) whether it is still
+    text or has been archived.  start and end optionally limit the lines to a
+    time range; for an archive only the chunks covering it are decompressed.
+    '''
+    if os.path.exists(path):
+        with open(path, 'r') as FO:
+            lines = FO.readlines()
+        if start is None and end is None:
+            return lines
+        return [line for line in lines if line_timestamp(line) is None\
+                or ((start is None or line_timestamp(line) >= start)\
+                    and (end is None or line_timestamp(line) < end))]
+    return ArchiveReader(path + Extension).lines(start, end)
+
+
+##-------------------------------------------------------------------------
+## Archive a Closed Day File
+##-------------------------------------------------------------------------
+def archive_file(path, chunk_seconds=3600, remove=True):
+    '''Archive a day file.  The archive is read back and compared with the
+    original before the original is removed.  Returns the archive name.
+    '''
+    with open(path, 'r') as FO:
+        lines = FO.readlines()
+    filename = path + Extension
+    write_archive(lines, filename+'.tmp', chunk_seconds=chunk_seconds)
+    data = [line for line in lines if line_timestamp(line) is not None]
+    header = lines[:lines.index(data[0])] if data else lines
+    if ArchiveReader(filename+'.tmp').lines() != header + data:
+        os.remove(filename+'.tmp')
+        raise ValueError('Archive of {} does not match the original'.format(path))
+    os.rename(filename+'.tmp', filename)
+    if remove:
+        os.remove(path)
+    return filename
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Pack closed daily sensor logs into compressed, chunked archives.")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--keep",
+        action="store_true", dest="keep",
+        default=False, help="Keep the text files after archiving them.")
+    ## add arguments
+    parser.add_argument("--chunk-minutes",
+        type=float, dest="chunk_minutes", default=60.,
+        help="Time span of each compressed chunk (default = 60)")
+    parser.add_argument("--days",
+        type=int, dest="days", default=1,
+        help="Archive day files at least this many days old (default = 1)")
+    parser.add_argument("files", nargs='*',
+        help="Day files to archive (default = the Kegerator and HumidityMonitor logs)")
+    args = parser.parse_args()
+
+    import LogSetup
+    logger = LogSetup.get_logger('Archive', verbose=args.verbose)
+
+    files = args.files
+    if not files:
+        files = sorted(sum([glob.glob(pattern) for pattern in DayFiles], []))
+    cutoff = time.strftime('%Y%m%d', time.localtime(time.time() - args.days*86400))
+    before = after = 0
+    for path in files:
+        date = re.match(r'(\d{8})', os.path.basename(path))
+        if not date or date.group(1) > cutoff:
+            logger.debug('Skipping {} (not closed)'.format(path))
+            continue
+        size = os.path.getsize(path)
+        try:
+            filename = archive_file(path, chunk_seconds=args.chunk_minutes*60, remove=not args.keep)
+        except (IOError, OSError, ValueError) as e:
+            logger.error('Could not archive {}: {}'.format(path, e))
+            continue
+        before += size
+        after += os.path.getsize(filename)
+        logger.info('Archived {} ({} -> {} bytes)'.format(path, size, os.path.getsize(filename)))
+    if before:
+        logger.info('Total {} -> {} bytes ({:.1f}x)'.format(before, after, before/after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import sys
+import os
+import argparse
+import math
+import time
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## Frame Analysis
+##-------------------------------------------------------------------------
+def downsample(image, step=8, binning=2):
+    '''Reduce a frame to a small integer array for analysis.
+
+    The frame is first decimated with a strided view (no copy, so only every
+    step'th pixel is ever touched) and then binned binning x binning using
+    integer sums.  Color frames are reduced to their green channel.  The
+    result stays in integer form; nothing is converted to float.
+    '''
+    if image.ndim == 3:
+        image = image[:, :, 1]
+    small = image[::step, ::step]
+    if binning > 1:
+        ny = small.shape[0] // binning * binning
+        nx = small.shape[1] // binning * binning
+        small = small[:ny, :nx].reshape(ny//binning, binning, nx//binning, binning)
+        small = small.sum(axis=(1, 3), dtype=np.uint32) // (binning*binning)
+    return small
+
+
+def frame_statistics(image, step=8, binning=2, bits=8):
+    '''Compute the histogram and median of a downsampled frame.
+
+    The median is found from the cumulative histogram (np.bincount), which is
+    linear in the number of analysed pixels rather than requiring a sort.
+    Returns the median and the median as a fraction of full scale, along with
+    the histogram itself.
+    '''
+    small = downsample(image, step=step, binning=binning)
+    histogram = np.bincount(small.ravel(), minlength=2**bits)
+    cumulative = np.cumsum(histogram)
+    median = int(np.searchsorted(cumulative, cumulative[-1]/2.))
+    return median, median / (2**bits - 1), histogram
+
+
+def read_frame(filename, step=8):
+    '''Read a JPEG frame for exposure analysis.
+
+    PIL's draft mode lets the JPEG decoder produce a 1/2, 1/4 or 1/8 scale
+    greyscale image directly from the DCT coefficients, so a full resolution
+    frame is never decoded.  The frame is already decimated, so analyse it
+    with step=1.  Returns None if the frame can not be read (for example if
+    it is a raw file).
+    '''
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        frame = Image.open(filename)
+        frame.draft('L', (frame.size[0]//step, frame.size[1]//step))
+        return np.asarray(frame.convert('L'))
+    except IOError:
+        return None
+
+
+##-------------------------------------------------------------------------
+## Exposure Value Helpers
+##-------------------------------------------------------------------------
+def exposure_seconds(value):
+    '''Convert a camera shutter speed string ('1/125', '0.3', '20') to
+    seconds.  Returns None for non-numeric entries such as 'bulb'.
+    '''
+    try:
+        if '/' in value:
+            numerator, denominator = value.split('/')
+            return float(numerator) / float(denominator)
+        return float(value)
+    except ValueError:
+        return None
+
+
+def nearest(choices, target):
+    '''Return the key from a {key: numeric value} dict closest to target in
+    log space (i.e. in stops).
+    '''
+    return min(choices.keys(),\
+               key=lambda key: abs(math.log(choices[key]/target, 2)))
+
+
+##-------------------------------------------------------------------------
+## Define Exposure Ramp Class
+##-------------------------------------------------------------------------
+class ExposureRamp(object):
+    '''Ramp shutter speed and ISO smoothly toward a target frame brightness.
+
+    Each call to update() measures the median of the last frame and moves the
+    total exposure (shutter time x ISO/100) toward the target by at most
+    max_step stops.  Changes smaller than deadband stops are ignored.  Shutter
+    time is used first, at the lowest ISO, and ISO is only raised once the
+    shutter reaches max_exposure.  The ramp keeps its own continuous exposure
+    value, so snapping to the camera's discrete settings never stalls it; the
+    value is held within what the settings can reach, so it never winds up
+    past them and takes many frames to come back.
+    '''
+    def __init__(self, exposures, ISOs, exposure='1/100', ISO='100',\
+                 target=0.4, max_step=1/3., deadband=0.1,\
+                 max_exposure=20., max_ISO=1600, bits=8, logger=None):
+        self.exposures = dict([(key, exposure_seconds(key)) for key in exposures])
+        self.exposures = dict([(key, val) for key, val in self.exposures.items()\
+                               if val and val <= max_exposure])
+        self.ISOs = dict([(key, float(key)) for key in ISOs\
+                          if key.isdigit() and int(key) <= max_ISO])
+        assert len(self.exposures) > 0
+        assert len(self.ISOs) > 0
+        self.min_exposure = min(self.exposures.values())
+        self.max_exposure = max(self.exposures.values())
+        self.min_ISO = min(self.ISOs.values())
+        self.max_ISO = max(self.ISOs.values())
+        self.target = target
+        self.max_step = max_step
+        self.deadband = deadband
+        self.bits = bits
+        self.logger = logger
+        self.exposure = nearest(self.exposures, exposure_seconds(str(exposure)))
+        self.ISO = nearest(self.ISOs, float(ISO))
+        self.value = self.exposures[self.exposure] * self.ISOs[self.ISO] / 100.
+
+    def update(self, image, step=8):
+        '''Analyse a frame and return the (exposure, ISO) settings to use for
+        the next one.  Pass step=1 for a frame from read_frame, which the
+        decoder has already reduced.
+        '''
+        start = time.time()
+        median, level, histogram = frame_statistics(image, step=step, bits=self.bits)
+        ## Treat a black frame as one count so the log stays finite
+        level = max(level, 1. / (2**self.bits - 1))
+        stops = math.log(self.target / level, 2)
+        stops = max(-self.max_step, min(self.max_step, stops))
+        if abs(stops) > self.deadband:
+            self.value *= 2**stops
+        self.value = max(self.min_exposure * self.min_ISO / 100.,\
+                         min(self.max_exposure * self.max_ISO / 100., self.value))
+        ## Spend exposure on shutter time first, then ISO
+        seconds = min(self.value * 100. / self.min_ISO, self.max_exposure)
+        self.exposure = nearest(self.exposures, seconds)
+        self.ISO = nearest(self.ISOs, self.value * 100. / self.exposures[self.exposure])
+        if self.logger:
+            self.logger.debug('Frame median {} ({:.2f}), step {:+.2f} stops, analysis took {:.3f} s'.format(\
+                              median, level, stops, time.time()-start))
+            self.logger.info('Next exposure: {} s at ISO {}'.format(self.exposure, self.ISO))
+        return self.exposure, self.ISO
+
+
+##-------------------------------------------------------------------------
+## Main Program (analysis benchmark)
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Time frame analysis on a synthetic full size frame.")
+    ## add arguments
+    parser.add_argument("--width",
+        type=int, dest="width", default=2592,
+        help="Frame width (default = 2592)")
+    parser.add_argument("--height",
+        type=int, dest="height", default=1944,
+        help="Frame height (default = 1944)")
+    parser.add_argument("--step",
+        type=int, dest="step", default=8,
+        help="Decimation step (default = 8)")
+    args = parser.parse_args()
+
+    image = np.random.randint(0, 256, size=(args.height, args.width, 3)).astype(np.uint8)
+
+    start = time.time()
+    median = np.median(image.astype(np.float64) / 255.)
+    print('Full resolution float median: {:.3f} in {:.3f} s'.format(median, time.time()-start))
+
+    start = time.time()
+    median, level, histogram = frame_statistics(image, step=args.step)
+    print('Downsampled histogram median: {:.3f} in {:.3f} s'.format(level, time.time()-start))
+
+
+if __name__ == '__main__':
+    main()
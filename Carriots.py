@@ -10,11 +10,34 @@ import datetime
 import subprocess
 import re
 
-import urllib2
+try:
+    import urllib2
+except ImportError:
+    import urllib.request as urllib2
 import time, datetime
 import json
 
 
+## API keys already read, keyed by file name: (modification time, key)
+_api_keys = {}
+
+
+##-------------------------------------------------------------------------
+## Read API Key (cached)
+##-------------------------------------------------------------------------
+def read_api_key(file=None):
+    '''Return the API key from file (default ~/.carriots_api).  The key is
+    only read again if the file has been modified since.
+    '''
+    if not file:
+        file = os.path.join(os.path.expandvars('$HOME'), '.carriots_api')
+    mtime = os.path.getmtime(file)
+    if file not in _api_keys or _api_keys[file][0] != mtime:
+        with open(file, 'r') as apikeyFO:
+            _api_keys[file] = (mtime, apikeyFO.read().split('\n')[0].strip())
+    return _api_keys[file][1]
+
+
 ##-------------------------------------------------------------------------
 ## Carriots Client
 ##-------------------------------------------------------------------------
@@ -33,7 +56,7 @@ class Client(object):
 
     def send (self, data):
         self.data = json.dumps(data)
-        request = urllib2.Request(Client.api_url, self.data, self.headers)
+        request = urllib2.Request(self.api_url, self.data.encode('utf-8'), self.headers)
         self.response = urllib2.urlopen(request)
         return self.response
 
@@ -50,22 +73,13 @@ class Client(object):
             raise
 
     def read_api_key_from_file(self, file=None):
-        if not file:
-            file = os.path.join(os.path.expandvars('$HOME'), '.carriots_api')
         try:
-            apikeyFO = open(file, 'r')
-            contents = apikeyFO.read()
-            HasEndLine = re.match('(.*)\n', contents)
-            if HasEndLine:
-                self.api_key = HasEndLine.group(1)
-            else:
-                self.api_key = contents
+            self.api_key = read_api_key(file)
             self.headers = {'User-Agent': 'Raspberry-Carriots',
                             'Content-Type': self.content_type,
                             'Accept': self.content_type,
                             'Carriots.apikey': self.api_key}
-            apikeyFO.close()
-        except:
+        except (IOError, OSError):
             print('Could not read api key from file.')
 
 
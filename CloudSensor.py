@@ -13,10 +13,10 @@ import argparse
 import serial
 import re
 import math
-import numpy
 import logging
 import time
 import datetime
+import LogSetup
 
 
 ##-------------------------------------------------------------------------
@@ -44,7 +44,7 @@ def QueryAAG(AAG, send, nResponses, logger):
     if not HSBgood:
         logger.debug("Handshaking Block Bad")
     ## Check that Response Matches Standard Pattern
-    ResponsePattern = '(\![\s\w]{2})([\s\w]{12})'*nResponses
+    ResponsePattern = '(\![\s\w]{2})([\s\w-]{12})'*nResponses
     ResponseREO = re.compile(ResponsePattern)
     ResponseMatch = ResponseREO.match(responseString[0:-15])
     if not ResponseMatch:
@@ -65,7 +65,7 @@ def AAG_GetSkyTemp(AAG):
     SkyTempF = None
     AAG.write("S!")
     response = AAG.read(30)
-    IsResponse = re.match("(\![\s\w]{2})([\s\w]{11,13})(\!.{12,15})", response)
+    IsResponse = re.match("(\![\s\w]{2})([\s\w-]{11,13})(\!.{12,15})", response)
     if IsResponse:
         if re.match("\!1", IsResponse.group(1)):
             SkyTempC = float(IsResponse.group(2))/100.
@@ -80,7 +80,7 @@ def AAG_GetAmbTemp(AAG):
     AmbTempF = None
     AAG.write("T!")
     response = AAG.read(30)
-    IsResponse = re.match("(\![\s\w]{2})([\s\w]{11,13})(\!.{12,15})", response)
+    IsResponse = re.match("(\![\s\w]{2})([\s\w-]{11,13})(\!.{12,15})", response)
     if IsResponse:
         if re.match("\!2", IsResponse.group(1)):
             AmbTempC = float(IsResponse.group(2))/100.
@@ -201,6 +201,7 @@ def AAG_GetWind(AAG):
 ##########################################################
 ##  Get All Readings
 def AAG_QueryAll(AAG, logger):
+    import numpy
     ## Get nReadings
     nReadings = 15
     ClippingSigma = 2.0
@@ -248,6 +249,7 @@ def AAG_QueryAll(AAG, logger):
 ##########################################################
 ##  Sigma Clip an Array
 def SigClip(Values, Sigma):
+    import numpy
     Values = [val for val in Values if val]
     Values = numpy.array(Values)
     Mean = numpy.median(Values)
@@ -277,28 +279,15 @@ def main():
     parser.add_argument("--input",
         type=str, dest="input",
         help="The input.")
+    parser.add_argument("--db",
+        type=str, dest="db", default=None,
+        help="Write readings to this SQLite store.")
     args = parser.parse_args()
 
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if args.verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-#     LogFileName = None
-#     LogFileHandler = logging.FileHandler(LogFileName)
-#     LogFileHandler.setLevel(logging.DEBUG)
-#     LogFileHandler.setFormatter(LogFormat)
-#     logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('CloudSensor', verbose=args.verbose)
 
     ##-------------------------------------------------------------------------
     ## Set up 
@@ -311,6 +300,8 @@ def main():
     CloudSensorLog = os.path.join("/Data", "CloudSensorLogs", CloudSensorLogFile)
     
     AAG = None
+    AmbTempF = None
+    SkyTempF = None
     SerialDevice = '/dev/ttyAMA0'
     try:
         AAG = serial.Serial(SerialDevice, 9600, timeout=2)
@@ -348,6 +339,33 @@ def main():
 
         AAG.close()
 
+    ##-------------------------------------------------------------------------
+    ## Reject Spikes Using the Rolling Median of Previous Readings
+    ##-------------------------------------------------------------------------
+    if AmbTempF is not None or SkyTempF is not None:
+        import Filters
+        filters = Filters.ChannelFilters(window=5,\
+                  state_file=os.path.join("/Data", "CloudSensorLogs", "filter_state.json"),\
+                  logger=logger)
+        values = filters.apply('AAG', dict([(name, value) for name, value in\
+                                            [('AmbTemp', AmbTempF), ('SkyTemp', SkyTempF)]\
+                                            if value is not None]))
+        AmbTempF = values.get('AmbTemp')
+        SkyTempF = values.get('SkyTemp')
+        filters.save()
+
+    ##-------------------------------------------------------------------------
+    ## Write to SQLite Store
+    ##-------------------------------------------------------------------------
+    if args.db and (AmbTempF is not None or SkyTempF is not None):
+        import SensorStore
+        logger.debug("Writing to {}".format(args.db))
+        store = SensorStore.Store(args.db)
+        store.write('cloudsensor', {'timestamp': SensorStore.now_us(),
+                                    'AmbTemp': AmbTempF,
+                                    'SkyTemp': SkyTempF})
+        store.close()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,426 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import queue
+    from socketserver import ThreadingMixIn, TCPServer, StreamRequestHandler
+except ImportError:
+    import Queue as queue
+    from SocketServer import ThreadingMixIn, TCPServer, StreamRequestHandler
+
+import SensorStore
+import LogSetup
+
+
+Port = 8765
+## Each frame is the magic, the length of the body, then the body: zlib
+## compressed JSON.  A batch is {"node": ..., "batch": n, "records": {stream:
+## [record, ...]}} and is answered by {"ack": n, "rows": rows} once the rows
+## are committed, or {"nack": n, "error": ...}.  Each node's streams are stored
+## as <node>_<stream>, so several Pis can push a stream of the same name.
+Magic = b'RPC1'
+Header = struct.Struct('>4sI')
+MaxFrame = 64*1024*1024
+
+
+##-------------------------------------------------------------------------
+## Framing
+##-------------------------------------------------------------------------
+def send_frame(sock, message, level=6):
+    body = zlib.compress(json.dumps(message).encode('utf-8'), level)
+    sock.sendall(Header.pack(Magic, len(body)) + body)
+
+
+def recv_exactly(read, size):
+    data = b''
+    while len(data) < size:
+        chunk = read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_frame(read):
+    '''Read one frame with read(n) (a socket's recv or a file's read).
+    Returns the decoded message, or None at the end of the stream.
+    '''
+    header = recv_exactly(read, Header.size)
+    if header is None:
+        return None
+    magic, length = Header.unpack(header)
+    if magic != Magic or length > MaxFrame:
+        raise ValueError('Bad frame header')
+    body = recv_exactly(read, length)
+    if body is None:
+        return None
+    return json.loads(zlib.decompress(body).decode('utf-8'))
+
+
+##-------------------------------------------------------------------------
+## Store Writer
+##-------------------------------------------------------------------------
+class StoreWriter(object):
+    '''The only thread writing to the central store.
+
+    Connection handlers queue their batches with write() and wait for the
+    commit.  The writer takes every batch waiting in the queue and commits
+    them all in one transaction, so with many nodes pushing at once the cost
+    of a commit is shared between their batches.  If the group fails, its
+    batches are written again one by one, so only a bad batch is refused.
+    '''
+    def __init__(self, db, max_group=256, logger=None):
+        self.db = db
+        self.max_group = max_group
+        self.logger = logger
+        self.queue = queue.Queue()
+        self.rows = 0
+        self.batches = 0
+        self.commits = 0
+        self.thread = threading.Thread(target=self.run, name='StoreWriter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, records):
+        '''Queue the records of one batch and wait until they are committed.
+        Raises the error if the commit failed.
+        '''
+        item = {'records': records, 'done': threading.Event(), 'error': None}
+        self.queue.put(item)
+        item['done'].wait()
+        if item['error']:
+            raise item['error']
+
+    def run(self):
+        store = SensorStore.Store(self.db)
+        while True:
+            group = [self.queue.get()]
+            while len(group) < self.max_group:
+                try:
+                    group.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            merged = {}
+            for item in group:
+                for stream, rows in item['records'].items():
+                    merged.setdefault(stream, []).extend(rows)
+            try:
+                self.commit(store, merged, len(group))
+            except Exception as e:
+                if len(group) == 1:
+                    group[0]['error'] = e
+                else:
+                    for item in group:
+                        try:
+                            self.commit(store, item['records'], 1)
+                        except Exception as e:
+                            item['error'] = e
+                for item in group:
+                    if item['error'] and self.logger:
+                        self.logger.error('Could not write batch: {}'.format(item['error']))
+            for item in group:
+                item['done'].set()
+
+    def commit(self, store, records, batches):
+        store.write_cycle(records)
+        self.commits += 1
+        self.batches += batches
+        self.rows += sum([len(rows) for rows in records.values()])
+
+
+##-------------------------------------------------------------------------
+## Collector Server
+##-------------------------------------------------------------------------
+class CollectorHandler(StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                message = recv_frame(self.rfile.read)
+            except (ValueError, zlib.error) as e:
+                if server.logger:
+                    server.logger.warning('Dropping {}: {}'.format(self.client_address[0], e))
+                return
+            if message is None:
+                return
+            batch = message.get('batch')
+            try:
+                node = message.get('node')
+                if not isinstance(node, str) or not re.match(r'^\w+$', node):
+                    raise ValueError('Invalid node name: {!r}'.format(node))
+                records = {}
+                for stream, rows in message['records'].items():
+                    if not re.match(r'^\w+$', stream):
+                        raise ValueError('Invalid stream name: {}'.format(stream))
+                    for row in rows:
+                        if not isinstance(row.get('timestamp'), int):
+                            raise ValueError('Record without an integer timestamp in {}'.format(stream))
+                        for name, value in row.items():
+                            if not re.match(r'^\w+$', name):
+                                raise ValueError('Invalid column name in {}: {!r}'.format(stream, name))
+                            if value is not None and not isinstance(value, (bool, int, float, str)):
+                                raise ValueError('{}.{} is not a number or text'.format(stream, name))
+                    records['{}_{}'.format(node, stream)] = rows
+                server.writer.write(records)
+                response = {'ack': batch, 'rows': sum([len(rows) for rows in records.values()])}
+            except Exception as e:
+                response = {'nack': batch, 'error': '{}: {}'.format(type(e).__name__, e)}
+            send_frame(self.connection, response)
+
+
+class CollectorServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+    def __init__(self, address, db, logger=None):
+        TCPServer.__init__(self, address, CollectorHandler)
+        self.logger = logger
+        self.writer = StoreWriter(db, logger=logger)
+
+
+##-------------------------------------------------------------------------
+## Push Client
+##-------------------------------------------------------------------------
+class Pusher(object):
+    '''Push the new rows of a node's local store to the collector.
+
+    The monitors already write every record to their local store (--db), so
+    the pusher just reads each stream past the last timestamp the collector
+    acknowledged, batch rows at a time.  The acknowledged position
+    of each stream is kept in state_file.  A batch whose ack is lost is sent
+    again; the collector replaces rows with the same timestamp, so that is
+    harmless.
+    '''
+    def __init__(self, db, host, port=Port, node=None, streams=None, batch=1000,\
+                 state_file=None, timeout=30., logger=None):
+        self.db = db
+        self.address = (host, port)
+        self.node = node or re.sub(r'\W', '_', socket.gethostname().split('.')[0])
+        self.streams = streams
+        self.batch = batch
+        self.state_file = db + '.pushed' if state_file is None else state_file
+        self.timeout = timeout
+        self.logger = logger
+        self.sock = None
+        self.sequence = 0
+        self.pushed = {}
+        if self.state_file and os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as FO:
+                self.pushed = json.load(FO)
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, records):
+        '''Send one batch and wait for its acknowledgement.  Returns the number
+        of rows stored.  Raises IOError if the batch was not acknowledged.
+        '''
+        self.sequence += 1
+        try:
+            sock = self.connect()
+            send_frame(sock, {'node': self.node, 'batch': self.sequence, 'records': records})
+            response = recv_frame(sock.recv)
+        except (IOError, OSError, ValueError) as e:
+            self.close()
+            raise IOError('Could not reach collector {}:{}: {}'.format(self.address[0], self.address[1], e))
+        if response is None:
+            self.close()
+            raise IOError('Collector closed the connection')
+        if response.get('ack') != self.sequence:
+            raise IOError('Batch {} refused: {}'.format(self.sequence, response.get('error')))
+        return response['rows']
+
+    def save(self):
+        with open(self.state_file+'.tmp', 'w') as FO:
+            json.dump(self.pushed, FO)
+        os.rename(self.state_file+'.tmp', self.state_file)
+
+    def push(self):
+        '''Push everything new in the local store.  Returns the rows pushed.
+        '''
+        store = SensorStore.Store(self.db)
+        total = 0
+        try:
+            for stream in self.streams or store.streams():
+                ## Only one batch is read at a time, so a long backlog never
+                ## has to fit in memory
+                while True:
+                    columns = store.read_range(stream, self.pushed.get(stream, -2**63) + 1,\
+                                               limit=self.batch)
+                    names = list(columns.keys())
+                    rows = [dict(zip(names, row)) for row in zip(*[columns[name] for name in names])]
+                    if not rows:
+                        break
+                    total += self.send({stream: rows})
+                    self.pushed[stream] = rows[-1]['timestamp']
+                    self.save()
+        finally:
+            store.close()
+        if total and self.logger:
+            self.logger.info('Pushed {} rows to {}:{}'.format(total, self.address[0], self.address[1]))
+        return total
+
+    def run(self, interval=60., backoff=300.):
+        delay = interval
+        while True:
+            try:
+                self.push()
+                delay = interval
+            except IOError as e:
+                if self.logger:
+                    self.logger.warning('{} (retrying in {:.0f} s)'.format(e, delay))
+                delay = min(delay*2, backoff)
+            time.sleep(delay)
+
+
+##-------------------------------------------------------------------------
+## Ingest Benchmark
+##-------------------------------------------------------------------------
+def _simulated_node(port, node, batches, rows):
+    pusher = Pusher(None, '127.0.0.1', port, node=node, state_file='')
+    stream = 'kegerator'
+    start = int(time.time() * 1e6)
+    for i in range(batches):
+        records = [{'timestamp': start + (i*rows + j)*1000000, 'temperature_F': 38.5 + (j % 10)/10.,
+                    'humidity': 45. + (j % 7), 'status': 'On' if (j // 20) % 2 else 'Off'}\
+                   for j in range(rows)]
+        pusher.send({stream: records})
+    pusher.close()
+
+
+def benchmark(nodes=20, batches=50, rows=100):
+    '''Time nodes processes pushing batches of rows each to a collector on
+    localhost.
+    '''
+    import multiprocessing
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    try:
+        server = CollectorServer(('127.0.0.1', 0), os.path.join(directory, 'central.db'))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        port = server.server_address[1]
+        processes = [multiprocessing.Process(target=_simulated_node,\
+                                             args=(port, 'node{}'.format(i), batches, rows))\
+                     for i in range(nodes)]
+        start = time.time()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.time() - start
+        writer = server.writer
+        server.shutdown()
+        server.server_close()
+        print('{} nodes x {} batches x {} rows: {} rows in {:.2f} s'.format(nodes, batches, rows,\
+              writer.rows, elapsed))
+        print('{:.0f} rows/s, {:.0f} batches/s, {:.1f} batches per commit'.format(\
+              writer.rows/elapsed, writer.batches/elapsed, writer.batches/max(writer.commits, 1)))
+    finally:
+        shutil.rmtree(directory)
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Collect records from the Pis on the LAN into a central store, or push to it.")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--once",
+        action="store_true", dest="once",
+        default=False, help="Push once and exit (push mode).")
+    ## add arguments
+    parser.add_argument("mode",
+        choices=['serve', 'push', 'benchmark'],
+        help="Run the collector, push this node's store to it, or benchmark ingest.")
+    parser.add_argument("--db",
+        type=str, dest="db",
+        help="Central store (serve) or this node's local store (push).")
+    parser.add_argument("--host",
+        type=str, dest="host", default='',
+        help="Collector address (push), or address to listen on (serve, default = all)")
+    parser.add_argument("--port",
+        type=int, dest="port", default=Port,
+        help="Collector port (default = {})".format(Port))
+    parser.add_argument("--node",
+        type=str, dest="node", default=None,
+        help="Name of this node, letters, digits and _ (default = the host name)")
+    parser.add_argument("--streams",
+        type=str, nargs='+', dest="streams", default=None,
+        help="Streams to push (default = all)")
+    parser.add_argument("--interval",
+        type=float, dest="interval", default=60.,
+        help="Seconds between pushes (default = 60)")
+    parser.add_argument("--nodes",
+        type=int, dest="nodes", default=20,
+        help="Simulated nodes for benchmark (default = 20)")
+    parser.add_argument("--batches",
+        type=int, dest="batches", default=50,
+        help="Batches per simulated node (default = 50)")
+    parser.add_argument("--rows",
+        type=int, dest="rows", default=100,
+        help="Rows per batch (default = 100)")
+    args = parser.parse_args()
+
+    if args.mode == 'benchmark':
+        benchmark(nodes=args.nodes, batches=args.batches, rows=args.rows)
+        return
+    if not args.db:
+        parser.error('--db is required')
+
+    logger = LogSetup.get_logger('Collector', verbose=args.verbose)
+    if args.mode == 'serve':
+        server = CollectorServer((args.host, args.port), args.db, logger=logger)
+        logger.info('Collecting into {} on port {}'.format(args.db, args.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            logger.info('Stored {} rows from {} batches in {} commits'.format(\
+                        server.writer.rows, server.writer.batches, server.writer.commits))
+    else:
+        pusher = Pusher(args.db, args.host or 'localhost', args.port, node=args.node,\
+                        streams=args.streams, logger=logger)
+        if args.once:
+            pusher.push()
+        else:
+            pusher.run(interval=args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import math
+import signal
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+## ioctl to set the timeout of a Linux watchdog device (_IOWR('W', 6, int))
+WDIOC_SETTIMEOUT = 0xc0045706
+
+
+##-------------------------------------------------------------------------
+## Define Watchdog Class
+##-------------------------------------------------------------------------
+class Watchdog(object):
+    '''The hardware watchdog (/dev/watchdog), if there is one and we may open
+    it.  Once opened the board resets unless kick() is called at least every
+    timeout seconds, which returns every GPIO to an input and so switches the
+    relay off.  close() disarms it with the magic close character, so a cron
+    job that finishes normally leaves it idle until the next run.
+    '''
+    def __init__(self, device='/dev/watchdog', timeout=None, logger=None):
+        self.fd = None
+        self.logger = logger
+        try:
+            self.fd = os.open(device, os.O_WRONLY)
+        except (IOError, OSError) as e:
+            if logger:
+                logger.debug('No hardware watchdog ({})'.format(e))
+            return
+        if timeout and fcntl:
+            try:
+                fcntl.ioctl(self.fd, WDIOC_SETTIMEOUT, struct.pack('i', int(math.ceil(timeout))))
+            except (IOError, OSError) as e:
+                if logger:
+                    logger.warning('Could not set watchdog timeout: {}'.format(e))
+
+    def kick(self):
+        if self.fd is not None:
+            os.write(self.fd, b'\0')
+
+    def close(self):
+        if self.fd is not None:
+            os.write(self.fd, b'V')
+            os.close(self.fd)
+            self.fd = None
+
+
+##-------------------------------------------------------------------------
+## Define Control Cycle Class
+##-------------------------------------------------------------------------
+class _Stage(object):
+    def __init__(self, function, args, kwargs):
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.call, args=(function, args, kwargs))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def call(self, function, args, kwargs):
+        try:
+            self.result = function(*args, **kwargs)
+        except Exception as e:
+            self.error = '{}: {}'.format(type(e).__name__, e)
+        self.done.set()
+
+
+class ControlCycle(object):
+    '''Run the stages of one control cycle, each within a deadline budget.
+
+    run() calls a stage in a daemon thread and waits at most its budget (and
+    never past the deadline of the whole cycle).  A stage which overruns or
+    raises is skipped: its thread is abandoned, since python threads cannot
+    be killed, and run() returns the fallback instead.  Values remembered by
+    earlier cycles (see remember() and last()) are kept in state_file, so a
+    skipped stage can fall back to the last known value.
+
+    If a critical stage fails, or the whole cycle overruns its deadline
+    (caught with SIGALRM even if the main thread is stuck), fail_safe is
+    called; for the kegerator it switches the relay off.  When a hardware
+    watchdog is available it is kicked after every stage and is the last
+    resort if the process hangs where no signal can reach it.
+
+    The duration of every stage is kept for the last history cycles, and
+    finish() logs the p50, p90 and p99 of each.
+    '''
+    def __init__(self, name, deadline=50., state_file=None, fail_safe=None,\
+                 watchdog=None, history=1440, logger=None):
+        self.name = name
+        self.deadline = deadline
+        self.state_file = state_file
+        self.fail_safe = fail_safe
+        self.watchdog = watchdog
+        self.history = history
+        self.logger = logger
+        self.started = None
+        self.failed_safe = False
+        self.skipped = []
+        self.state = {'durations': {}, 'overruns': {}, 'last': {}}
+        if state_file and os.path.exists(state_file):
+            try:
+                with open(state_file, 'r') as FO:
+                    self.state.update(json.load(FO))
+            except ValueError:
+                if self.logger:
+                    self.logger.warning('Ignoring unreadable cycle state {}'.format(state_file))
+
+    def start(self):
+        self.started = time.time()
+        if hasattr(signal, 'SIGALRM') and threading.current_thread().name == 'MainThread':
+            signal.signal(signal.SIGALRM, self.expired)
+            signal.alarm(int(math.ceil(self.deadline)) + 1)
+
+    def expired(self, signum, frame):
+        if self.logger:
+            self.logger.critical('{} cycle overran its {:.0f} s deadline'.format(self.name, self.deadline))
+        self.safe()
+        os._exit(1)
+
+    def safe(self):
+        '''Put the hardware in its safe state (once per cycle).
+        '''
+        if self.fail_safe and not self.failed_safe:
+            self.failed_safe = True
+            if self.logger:
+                self.logger.warning('Failing safe')
+            try:
+                self.fail_safe()
+            except Exception as e:
+                if self.logger:
+                    self.logger.critical('Fail safe action failed: {}'.format(e))
+
+    def remaining(self):
+        return self.started + self.deadline - time.time()
+
+    def run(self, name, function, budget, fallback=None, critical=False, args=(), kwargs={}):
+        '''Call function(*args, **kwargs) and return its result, or fallback
+        if it raises or takes longer than budget seconds.  A stage is not
+        started once the cycle deadline has passed.
+        '''
+        if self.remaining() <= 0:
+            error = 'no time left before the cycle deadline'
+        else:
+            start = time.time()
+            stage = _Stage(function, args, kwargs)
+            finished = stage.done.wait(max(min(budget, self.remaining()), 0))
+            duration = time.time() - start
+            durations = self.state['durations'].setdefault(name, [])
+            durations.append(duration)
+            del durations[:-self.history]
+            if self.watchdog:
+                self.watchdog.kick()
+            if finished and not stage.error:
+                return stage.result
+            if not finished:
+                self.state['overruns'][name] = self.state['overruns'].get(name, 0) + 1
+                error = 'overran its {:.1f} s budget'.format(budget)
+            else:
+                error = stage.error
+        self.skipped.append(name)
+        if self.logger:
+            self.logger.error('Skipping stage {}: {}'.format(name, error))
+        if critical:
+            self.safe()
+        return fallback
+
+    def remember(self, key, value):
+        self.state['last'][key] = [time.time(), value]
+
+    def last(self, key, max_age=None):
+        '''Return the value remembered for key, or None if there is none or it
+        is older than max_age seconds.
+        '''
+        if key not in self.state['last']:
+            return None
+        when, value = self.state['last'][key]
+        if max_age is not None and time.time() - when > max_age:
+            return None
+        return value
+
+    def percentiles(self, name, points=(50, 90, 99)):
+        durations = sorted(self.state['durations'].get(name, []))
+        if not durations:
+            return None
+        return [durations[min(int(p/100.*len(durations)), len(durations)-1)] for p in points]
+
+    def finish(self):
+        '''Disarm the deadline and the watchdog, save the state and log the
+        stage latency percentiles.
+        '''
+        if hasattr(signal, 'SIGALRM') and threading.current_thread().name == 'MainThread':
+            signal.alarm(0)
+        if self.watchdog:
+            self.watchdog.close()
+        if self.state_file:
+            try:
+                with open(self.state_file+'.tmp', 'w') as FO:
+                    json.dump(self.state, FO)
+                os.rename(self.state_file+'.tmp', self.state_file)
+            except (IOError, OSError) as e:
+                if self.logger:
+                    self.logger.warning('Could not save cycle state: {}'.format(e))
+        if self.logger:
+            self.logger.info('{} cycle took {:.2f} s{}'.format(self.name, time.time() - self.started,\
+                             ', skipped {}'.format(', '.join(self.skipped)) if self.skipped else ''))
+            for name in sorted(self.state['durations']):
+                p50, p90, p99 = self.percentiles(name)
+                self.logger.info('  {:>10s}: p50 {:7.3f} s, p90 {:7.3f} s, p99 {:7.3f} s, {} overruns in {} cycles'.format(\
+                                 name, p50, p90, p99, self.state['overruns'].get(name, 0),\
+                                 len(self.state['durations'][name])))
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Print the stage latency percentiles of a control cycle.")
+    ## add arguments
+    parser.add_argument("state_file",
+        type=str,
+        help="State file of the cycle (e.g. /var/log/Kegerator/cycle_state.json)")
+    args = parser.parse_args()
+
+    cycle = ControlCycle('', state_file=args.state_file)
+    print('{:>10s} {:>9s} {:>9s} {:>9s} {:>9s} {:>8s}'.format('stage', 'p50 (s)', 'p90 (s)', 'p99 (s)', 'cycles', 'overruns'))
+    for name in sorted(cycle.state['durations']):
+        p50, p90, p99 = cycle.percentiles(name)
+        print('{:>10s} {:9.3f} {:9.3f} {:9.3f} {:9d} {:8d}'.format(name, p50, p90, p99,\
+              len(cycle.state['durations'][name]), cycle.state['overruns'].get(name, 0)))
+
+
+if __name__ == '__main__':
+    main()
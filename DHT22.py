@@ -9,19 +9,26 @@ import time
 import subprocess
 import re
 
+from Samples import Sample
+
 
 ##-----------------------------------------------------------------------------
 ## Define DHT22 object to hold information
 ##-----------------------------------------------------------------------------
 class DHT22(object):
+    '''The last reading is held in a single Sample (temperature in C only);
+    the Fahrenheit and other attribute names are derived from it.
+    '''
     def __init__(self, pin=18):
-        self.temperature = None
-        self.temperature_C = None
-        self.temperature_F = None
-        self.humidity = None
-        self.time_struct = time.gmtime()
+        self.sample = Sample(time.time())
         self.pin = pin
 
+    temperature = property(lambda self: self.sample.temperature)
+    temperature_C = property(lambda self: self.sample.temperature_C)
+    temperature_F = property(lambda self: self.sample.temperature_F)
+    humidity = property(lambda self: self.sample.humidity)
+    time_struct = property(lambda self: time.gmtime(self.sample.time))
+
     def time(self):
         return time.strftime('%Y/%m/%d %H:%M:%S UT', self.time_struct)
 
@@ -42,26 +49,18 @@ class DHT22(object):
         hum_match = None
         while not temp_match and not hum_match:
             try:
-                self.time_struct = time.gmtime()
-                output = subprocess.check_output([DHTexec, "2302", str(self.pin)])
+                now = time.time()
+                output = subprocess.check_output([DHTexec, "2302", str(self.pin)],
+                                                 universal_newlines=True)
             except subprocess.CalledProcessError as e:
                 raise
             except:
                 raise
             temp_match = re.search("Temp =\s+([0-9.]+)", output)
             hum_match = re.search("Hum =\s+([0-9.]+)", output)
-            if temp_match:
-                self.temperature_C = float(temp_match.group(1))
-                self.temperature_F = 32. + 9./5.*self.temperature_C
-                self.temperature = self.temperature_C
-            else:
-                self.temperature_C = None
-                self.temperature_F = None
-                self.temperature = None
-            if hum_match:
-                self.humidity = float(hum_match.group(1))
-            else:
-                self.humidity = None
+            self.sample = Sample(now,\
+                                 float(temp_match.group(1)) if temp_match else None,\
+                                 float(hum_match.group(1)) if hum_match else None)
         return self.temperature_C, self.temperature_F, self.humidity
 
 
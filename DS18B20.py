@@ -10,6 +10,133 @@ import argparse
 import subprocess
 import re
 
+from Samples import Sample, History, C_to_F
+
+
+##-----------------------------------------------------------------------------
+## Helpers for Individual Probes
+##-----------------------------------------------------------------------------
+w1_devices = os.path.join('/', 'sys', 'bus', 'w1', 'devices')
+
+## Worst case conversion time in seconds for each resolution in bits
+conversion_time = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+
+## The scratchpad value after power on or a reset with no conversion since
+## (85 C), which comes with a good CRC
+PowerOnReset = 85000
+
+
+def devices(w1_root=None):
+    '''Return the sysfs paths of all DS18B20 probes on the 1-Wire bus.
+    '''
+    return sorted(glob.glob(os.path.join(w1_root or w1_devices, '28-*')))
+
+
+def get_resolution(path):
+    '''Return the conversion resolution of a probe in bits, or None if the
+    w1_therm driver does not expose it.
+    '''
+    file = os.path.join(path, 'resolution')
+    if not os.path.exists(file):
+        return None
+    with open(file, 'r') as FO:
+        return int(FO.read().strip())
+
+
+def set_resolution(path, bits):
+    '''Set the conversion resolution of a probe (9 to 12 bits).
+
+    Newer w1_therm drivers have a resolution attribute.  Older ones accept the
+    resolution written to w1_slave instead.  Both need write access to sysfs
+    (normally root).  Returns True if the resolution was applied.  Nothing is
+    written if the probe already reports bits, since each write also goes to
+    the probe's EEPROM, which wears out.
+    '''
+    assert bits in conversion_time.keys()
+    if get_resolution(path) == bits:
+        return True
+    for name in ['resolution', 'w1_slave']:
+        file = os.path.join(path, name)
+        if os.path.exists(file):
+            try:
+                with open(file, 'w') as FO:
+                    FO.write('{}\n'.format(bits))
+            except (IOError, OSError):
+                continue
+            return get_resolution(path) in [None, bits]
+    return False
+
+
+def read_device(path):
+    '''Read one probe and return its temperature in C, or None if the read
+    fails or gives the power on reset value.  The read blocks for the
+    duration of the probe's conversion.
+    '''
+    file = os.path.join(path, 'w1_slave')
+    if not os.path.exists(file):
+        return None
+    sensorFO = open(file, 'r')
+    sensor_file_contents = sensorFO.readlines()
+    sensorFO.close()
+    if len(sensor_file_contents) < 2:
+        return None
+    ## The first line ends in YES if the CRC check passed
+    if not sensor_file_contents[0].strip().endswith('YES'):
+        return None
+    MatchObj = re.search(r't=(-?\d{1,6})', sensor_file_contents[1])
+    if MatchObj and int(MatchObj.group(1)) != PowerOnReset:
+        return float(MatchObj.group(1))/1000
+    return None
+
+
+def read_temperature(path):
+    '''Read the temperature attribute of a probe (millidegrees, which the
+    w1_therm driver fills in after a bulk conversion) and return it in C,
+    or None if the read fails or gives the power on reset value.
+    '''
+    try:
+        with open(os.path.join(path, 'temperature'), 'r') as FO:
+            millidegrees = int(FO.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+    if millidegrees == PowerOnReset:
+        return None
+    return float(millidegrees)/1000
+
+
+def bulk_read_file(w1_root=None):
+    '''Return the therm_bulk_read attribute of the 1-Wire bus master, or None
+    if the w1_therm driver is too old to have one.
+    '''
+    files = sorted(glob.glob(os.path.join(w1_root or w1_devices, 'w1_bus_master*', 'therm_bulk_read')))
+    return files[0] if files else None
+
+
+def bulk_convert(w1_root=None, timeout=1.):
+    '''Start a conversion on every probe on the bus at once and wait for it
+    to finish.  Each probe's result is then read with read_temperature()
+    without converting again, so reading N probes takes one conversion time
+    rather than N; reading w1_slave would start a new conversion.  Returns
+    False if bulk conversion is not available or timed out.
+    '''
+    file = bulk_read_file(w1_root)
+    if file is None:
+        return False
+    try:
+        with open(file, 'w') as FO:
+            FO.write('trigger\n')
+        end = time.time() + timeout
+        while time.time() < end:
+            ## -1 while converting; 1 (data ready) or 0 (nothing to convert)
+            with open(file, 'r') as FO:
+                state = FO.read().strip()
+            if state in ['0', '1']:
+                return True
+            time.sleep(0.01)
+    except (IOError, OSError):
+        pass
+    return False
+
 
 ##-----------------------------------------------------------------------------
 ## Define DS18B20 object to hold information
@@ -23,48 +150,117 @@ class DS18B20(object):
         return cls._singletons[cls]
 
     def __init__(self):
-        self.temperatures = []
-        self.temperatures_C = []
-        self.temperatures_F = []
+        self.samples = History()
         self.time_struct = time.gmtime()
 
+    ## One array of temperatures in C; the other lists are derived from it
+    temperatures = property(lambda self: list(self.samples.temperatures_C))
+    temperatures_C = property(lambda self: list(self.samples.temperatures_C))
+    temperatures_F = property(lambda self: [C_to_F(temp) for temp in self.samples.temperatures_C])
+
     def time(self):
         return time.strftime('%Y/%m/%d %H:%M:%S UT', self.time_struct)
 
     def read(self):
-        self.temperatures = []
-        self.temperatures_C = []
-        self.temperatures_F = []
-        paths = glob.glob('/sys/bus/w1/devices/28-*')
+        self.samples = History()
+        paths = devices()
         if len(paths) == 0:
             print('Warning: No devices found!')
             print('Check to make sure you have run:')
             print('sudo modprobe w1-gpio')
             print('sudo modprobe w1-therm')
         for path in paths:
-            file = os.path.join(path, 'w1_slave')
-            if os.path.exists(file):
-                sensorFO = open(file, 'r')
-                sensor_file_contents = sensorFO.readlines()
-                sensorFO.close()
-                MatchObj = re.search('t=(\d{1,6})', sensor_file_contents[1])
-                if MatchObj:
-                    temp = float(MatchObj.group(1))/1000
-                    self.temperatures.append(temp)
-                    self.temperatures_C.append(temp)
-                    self.temperatures_F.append(temp*9./5.+32.)
-                    self.time_struct = time.gmtime()
+            temp = read_device(path)
+            if temp is not None:
+                self.samples.append(Sample(time.time(), temp))
+                self.time_struct = time.gmtime()
+
+
+##-------------------------------------------------------------------------
+## Resolution Benchmark
+##-------------------------------------------------------------------------
+def benchmark(reads=10, w1_root=None):
+    '''Read every probe reads times at each resolution and report the cycle
+    time (one pass over all probes) against the reading noise (the standard
+    deviation of each probe's readings, averaged over probes).
+    '''
+    paths = devices(w1_root=w1_root)
+    assert len(paths) > 0, 'No probes found'
+    original = dict([(path, get_resolution(path)) for path in paths])
+    print('{:>4s} {:>12s} {:>12s} {:>10s}'.format('bits', 'spec (s)', 'cycle (s)', 'noise (C)'))
+    for bits in sorted(conversion_time.keys()):
+        for path in paths:
+            set_resolution(path, bits)
+        readings = dict([(path, []) for path in paths])
+        start = time.time()
+        for i in range(reads):
+            for path in paths:
+                temp = read_device(path)
+                if temp is not None:
+                    readings[path].append(temp)
+        cycle = (time.time() - start) / reads
+        noise = [stdev(values) for values in readings.values() if len(values) > 1]
+        print('{:4d} {:12.3f} {:12.3f} {:10.4f}'.format(bits,\
+              conversion_time[bits]*len(paths), cycle, sum(noise)/max(len(noise), 1)))
+    for path, bits in original.items():
+        if bits:
+            set_resolution(path, bits)
+
+
+def stdev(values):
+    mean = sum(values) / len(values)
+    return (sum([(value - mean)**2 for value in values]) / (len(values) - 1))**0.5
 
 
 ##-------------------------------------------------------------------------
 ## Main Program
 ##-------------------------------------------------------------------------
 def main():
-    sensor = DS18B20()
-    sensor.read()
-    print('At {}'.format(sensor.time()))
-    for temp in sensor.temperatures_C:
-        print('  Temperature = {:.3f} C, {:.3f} F'.format(temp, temp*9./5.+32.))
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Read DS18B20 probes.")
+    ## add flags
+    parser.add_argument("--benchmark",
+        action="store_true", dest="benchmark",
+        default=False, help="Compare cycle time and noise at each resolution.")
+    parser.add_argument("--simulate",
+        action="store_true", dest="simulate",
+        default=False, help="Use a simulated 1-Wire bus.")
+    ## add arguments
+    parser.add_argument("--resolution",
+        type=int, dest="resolution", choices=sorted(conversion_time.keys()),
+        help="Set the resolution of every probe before reading.")
+    parser.add_argument("--reads",
+        type=int, dest="reads", default=10,
+        help="Reads per resolution for --benchmark (default = 10)")
+    args = parser.parse_args()
+
+    global w1_devices
+    if args.simulate:
+        import tempfile
+        import simulator.w1
+        w1_devices = tempfile.mkdtemp()
+        bus = simulator.w1.FakeW1(w1_devices).start()
+
+    if args.resolution:
+        for path in devices():
+            if not set_resolution(path, args.resolution):
+                print('Could not set resolution of {}'.format(path))
+
+    if args.benchmark:
+        benchmark(reads=args.reads)
+    else:
+        sensor = DS18B20()
+        sensor.read()
+        print('At {}'.format(sensor.time()))
+        for temp in sensor.temperatures_C:
+            print('  Temperature = {:.3f} C, {:.3f} F'.format(temp, temp*9./5.+32.))
+
+    if args.simulate:
+        bus.stop()
 
 
 if __name__ == '__main__':
@@ -6,147 +6,286 @@ from __future__ import division, print_function
 import sys
 import os
 import argparse
+import glob
 import logging
 import subprocess
 import datetime
-import pytz
-import ephem
+import json
+import re
+
+import LogSetup
+
+
+##-------------------------------------------------------------------------
+## Camera Capability Discovery
+##-------------------------------------------------------------------------
+CacheDirectory = os.path.join(os.path.expanduser('~'), '.cache', 'DSLR_Control')
+
+## gphoto2 config names which may hold each setting.  The first name found in
+## the camera's --list-config output is used, so the same code works across
+## camera models.
+ConfigNames = {'imageformat': ['imageformat'],
+               'focusmode': ['focusmode'],
+               'mode': ['autoexposuremode', 'expprogram', 'exposureprogram'],
+               'aperture': ['aperture', 'f-number'],
+               'exposure': ['shutterspeed', 'shutterspeed2', 'exptime'],
+               'ISO': ['iso', 'isospeed'],
+              }
+
+
+def parse_get_config(output, paths):
+    '''Parse the output of a gphoto2 call with one or more --get-config
+    actions.  Each block in the output ends with an "END" line and the blocks
+    come back in the same order as the requested paths.
+
+    Returns a dict keyed by config path.  Each entry holds the label, type,
+    read only flag, current value and a dict mapping choices to indices.
+    '''
+    configs = {}
+    blocks = [[]]
+    for line in output.splitlines():
+        if line.strip() == 'END':
+            blocks.append([])
+        else:
+            blocks[-1].append(line)
+    for path, block in zip(paths, blocks):
+        entry = {'label': None, 'type': None, 'readonly': False,
+                 'current': None, 'choices': {}}
+        for line in block:
+            ChoiceMatch = re.match(r'Choice:\s+(\d+)\s+(.*)$', line)
+            FieldMatch = re.match(r'(Label|Type|Readonly|Current):\s*(.*)$', line)
+            if ChoiceMatch:
+                entry['choices'][ChoiceMatch.group(2).strip()] = int(ChoiceMatch.group(1))
+            elif FieldMatch:
+                field = FieldMatch.group(1).lower()
+                value = FieldMatch.group(2).strip()
+                if field == 'readonly':
+                    entry['readonly'] = (value == '1')
+                else:
+                    entry[field] = value
+        configs[path] = entry
+    return configs
+
+
+def parse_summary(output):
+    '''Pull the camera model and serial number out of gphoto2 --summary.
+    '''
+    ModelMatch = re.search(r'Model:\s*(.+)', output)
+    SerialMatch = re.search(r'Serial Number:\s*(.+)', output)
+    model = ModelMatch.group(1).strip() if ModelMatch else 'unknown'
+    serial = SerialMatch.group(1).strip() if SerialMatch else 'unknown'
+    return model, serial
+
+
+def cache_file(model, serial, cache_dir=CacheDirectory):
+    '''Name of the capability cache file for a given camera.
+    '''
+    name = re.sub(r'[^\w.-]+', '_', '{}_{}'.format(model, serial))
+    return os.path.join(cache_dir, '{}.json'.format(name))
 
 
 ##-------------------------------------------------------------------------
 ## Define Camera Class
 ##-------------------------------------------------------------------------
-def Camera(object):
+class Camera(object):
     '''Class representing the camera configuration
+
+    The valid settings for the camera are discovered from gphoto2 the first
+    time a given camera model and serial number is seen and are cached on
+    disk.  If both the model (camera) and serial number are given and a cache
+    exists, the camera is not queried over USB at all.
     '''
-    def __init__(self, camera='Canon 5D',\
+    def __init__(self, camera=None, serial=None,\
                  mode=None, aperture=None,\
                  exposure=None, ISO=None,\
-                 port=None, logger=None):
+                 port=None, logger=None,\
+                 gphoto='sudo /sw/bin/gphoto2',\
+                 cache_dir=CacheDirectory, refresh=False):
         self.camera_type = camera
+        self.serial = serial
         self.mode = mode
         self.aperture = aperture
         self.exposure = exposure
         self.ISO = ISO
         self.port = port
         self.logger = logger
+        self.cache_dir = cache_dir
         ## Gphoto
-        self.gphoto = 'sudo /sw/bin/gphoto2'
+        self.gphoto = gphoto
+        ## Capabilities
+        self.config = None
+        if self.camera_type and self.serial and not refresh:
+            self.config = self.load_cache()
+        if not self.config:
+            self.camera_type, self.serial = self.identify()
+            if not refresh:
+                self.config = self.load_cache()
+        if not self.config:
+            self.config = self.discover()
+            self.save_cache()
         ## Commands
-        if self.camera_type == 'Canon 5D':
-            self.imageformat_cmd = '/main/settings/imageformat'
-            self.imageformat_list = {'RAW': '0'}
-            self.focusmode_cmd = '/main/settings/focusmode'
-            self.focusmode_list = {'manual': '3'}
-            self.mode_cmd = ''
-            self.mode_list = {'Av': 0,
-                              'Tv': 0,
-                              'M': 0}
-            self.aperture_cmd = ''
-            self.aperture_list = {'1.4': 0,
-                                  '1.8': 0,
-                                  '2.0': 0,
-                                  '2.8': 0,
-                                  '3.5': 0,
-                                  '4.0': 0,
-                                  '4.5': 0,
-                                  '5.6': 0,
-                                  '6.3': 0,
-                                  '8.0': 0,
-                                 }
-            self.exposure_cmd = ''
-            self.exposure_list = {}
-            self.ISO_cmd = ''
-            self.ISO_list = {'50': 0,
-                             '100': 0,
-                             '200': 0,
-                             '800': 0,
-                             '1600': 0,
-                             '3200': 0,
-                             '6400': 0,
-                             '12800': 0}
+        for setting in ConfigNames.keys():
+            path = self.find_config(setting)
+            setattr(self, '{}_cmd'.format(setting), path or '')
+            if path:
+                setattr(self, '{}_list'.format(setting), self.config[path]['choices'])
+            else:
+                setattr(self, '{}_list'.format(setting), {})
+
+
+    def run(self, options):
+        '''Run gphoto2 with the given options and return its output.  If it
+        fails, its error message is logged and CalledProcessError raised.
+        '''
+        gphoto_command = '{} --port {} {}'.format(self.gphoto, self.port, options)
+        if self.logger: self.logger.debug(gphoto_command)
+        process = subprocess.Popen(gphoto_command, shell=True, stdout=subprocess.PIPE,\
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+        output, error = process.communicate()
+        if process.returncode:
+            if self.logger: self.logger.warning('gphoto2 failed: {}'.format(error.strip()))
+            raise subprocess.CalledProcessError(process.returncode, gphoto_command, output)
+        return output
+
+
+    def identify(self):
+        '''Query the camera model and serial number.
+        '''
+        model, serial = parse_summary(self.run('--summary'))
+        if self.logger: self.logger.info('Found {} (serial {})'.format(model, serial))
+        return model, serial
+
+
+    def discover(self):
+        '''Read the full config tree from the camera.  All paths are read in a
+        single gphoto2 call to avoid re-opening the USB connection per path.
+        '''
+        if self.logger: self.logger.info('Discovering camera capabilities')
+        paths = [line.strip() for line in self.run('--list-config').splitlines()\
+                 if line.startswith('/')]
+        options = ' '.join(['--get-config {}'.format(path) for path in paths])
+        return parse_get_config(self.run(options), paths)
+
+
+    def load_cache(self):
+        file = cache_file(self.camera_type, self.serial, cache_dir=self.cache_dir)
+        if not os.path.exists(file):
+            return None
+        if self.logger: self.logger.debug('Reading capabilities from {}'.format(file))
+        with open(file, 'r') as FO:
+            cached = json.load(FO)
+        return cached['config']
+
+
+    def save_cache(self):
+        file = cache_file(self.camera_type, self.serial, cache_dir=self.cache_dir)
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        if self.logger: self.logger.debug('Writing capabilities to {}'.format(file))
+        with open(file, 'w') as FO:
+            json.dump({'model': self.camera_type,
+                       'serial': self.serial,
+                       'discovered': datetime.datetime.utcnow().isoformat(),
+                       'config': self.config}, FO, indent=1)
+
+
+    def find_config(self, setting):
+        '''Return the config path for a setting or None if the camera does not
+        have it.
+        '''
+        for name in ConfigNames[setting]:
+            for path in sorted(self.config.keys()):
+                if path.split('/')[-1] == name and not self.config[path]['readonly']:
+                    return path
+        return None
+
+
+    def set_config(self, setting, value):
+        '''Validate a setting against the cached choices and send it to the
+        camera.
+        '''
+        value = str(value)
+        path = getattr(self, '{}_cmd'.format(setting))
+        choices = getattr(self, '{}_list'.format(setting))
+        assert path, 'Camera has no {} setting'.format(setting)
+        assert value in choices.keys(),\
+               '{} is not a valid {} (choices: {})'.format(value, setting,\
+               ', '.join(sorted(choices.keys(), key=lambda x: choices[x])))
+        result = self.run('--set-config-index {}={}'.format(path, choices[value]))
+        self.config[path]['current'] = value
+        if self.logger: self.logger.debug(result)
 
 
     def set_image_format(self, format):
-        assert format in self.imageformat_list.keys()
-        gphoto_command = '{} --port {} --set-config {}={}'.format(\
-                          self.gphoto, self.port,\
-                          self.imageformat_cmd, self.imageformat_list[format])
-        result = subprocess.call(gphoto_command, shell=True)
-        if self.logger: self.logger.debug(result)
+        self.set_config('imageformat', format)
+
+
+    def raw_jpeg_format(self):
+        '''Return the camera's RAW + JPEG image format, preferring a large fine
+        JPEG, or None if it has none.  The JPEG is needed to measure frames.
+        '''
+        formats = [choice for choice in self.imageformat_list.keys()\
+                   if re.search(r'RAW|NEF|CR2|ARW', choice.upper())\
+                   and re.search(r'JPE?G|FINE|NORMAL|BASIC', choice.upper())]
+        if not formats:
+            return None
+        return min(formats, key=lambda choice: (not re.search(r'\bL|LARGE', choice.upper()),\
+                                                 'FINE' not in choice.upper(),\
+                                                 self.imageformat_list[choice]))
 
 
     def set_focus_mode(self, focusmode):
-        assert focusmode in self.focusmode_list.keys()
-        gphoto_command = '{} --port {} --set-config {}={}'.format(\
-                          self.gphoto, self.port,\
-                          self.focusmode_cmd, self.focusmode_list[focusmode])
-        result = subprocess.call(gphoto_command, shell=True)
-        if self.logger: self.logger.debug(result)
+        self.set_config('focusmode', focusmode)
 
 
     def set_mode(self, mode):
-        assert mode in self.mode_list.keys()
-        gphoto_command = '{} --port {} --set-config {}={}'.format(\
-                          self.gphoto, self.port,\
-                          self.mode_cmd, self.mode_list[mode])
-        result = subprocess.call(gphoto_command, shell=True)
-        if self.logger: self.logger.debug(result)
+        self.set_config('mode', mode)
 
 
     def set_aperture(self, aperture):
-        assert aperture in self.aperture_list.keys()
-        gphoto_command = '{} --port {} --set-config {}={}'.format(\
-                          self.gphoto, self.port,\
-                          self.aperture_cmd, self.aperture_list[aperture])
-        result = subprocess.call(gphoto_command, shell=True)
-        if self.logger: self.logger.debug(result)
+        self.set_config('aperture', aperture)
 
 
     def set_exposure(self, exposure):
-        assert exposure in self.exposure_list.keys()
-        gphoto_command = '{} --port {} --set-config {}={}'.format(\
-                          self.gphoto, self.port,\
-                          self.exposure_cmd, self.exposure_list[exposure])
-        result = subprocess.call(gphoto_command, shell=True)
-        if self.logger: self.logger.debug(result)
+        self.set_config('exposure', exposure)
 
 
     def set_ISO(self, ISO):
-        assert ISO in self.ISO_list.keys()
-        gphoto_command = '{} --port {} --set-config {}={}'.format(\
-                          self.gphoto, self.port,\
-                          self.ISO_cmd, self.ISO_list[exposure])
-        result = subprocess.call(gphoto_command, shell=True)
+        self.set_config('ISO', ISO)
+
+
+    def get_config(self, setting):
+        '''Read the current value of a setting from the camera.
+        '''
+        path = getattr(self, '{}_cmd'.format(setting))
+        assert path, 'Camera has no {} setting'.format(setting)
+        entry = parse_get_config(self.run('--get-config {}'.format(path)), [path])[path]
+        self.config[path]['current'] = entry['current']
+        return entry['current']
+
+
+    def take_exposure(self, filename='frame'):
+        '''Capture an image and download it.  gphoto2 appends the suffix for
+        each file it downloads (e.g. both .cr2 and .jpg for RAW + JPEG), so the
+        list of files written is returned.
+        '''
+        for file in glob.glob('{}.*'.format(filename)):
+            os.remove(file)
+        result = self.run('--capture-image-and-download --filename {}.%C'.format(filename))
         if self.logger: self.logger.debug(result)
-
-
-    def take_exposure(self):
-        pass
+        return sorted(glob.glob('{}.*'.format(filename)))
 
 
 ##-------------------------------------------------------------------------
 ## Time Lapse Program
 ##-------------------------------------------------------------------------
-def time_lapse(port='usb:001,011'):
-    logger = logging.getLogger('TimeLapseLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if args.verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-    today = datetime.datetime.now().strftime('%Y%m%d')
-    LogFileName = os.path.join('/', 'var', 'log', 'TimeLapse', 'log_{}.txt'.format(today))
-    LogFileHandler = logging.FileHandler(LogFileName)
-    LogFileHandler.setLevel(logging.DEBUG)
-    LogFileHandler.setFormatter(LogFormat)
-    logger.addHandler(LogFileHandler)
+def time_lapse(port='usb:001,011', model=None, serial=None):
+    import pytz
+    import ephem
+    import AutoExposure
+
+    logger = LogSetup.get_logger('TimeLapse', verbose=args.verbose,\
+             logfile=os.path.join('/', 'var', 'log', 'TimeLapse', 'log_%Y%m%d.txt'))
 
 
     ##-------------------------------------------------------------------------
@@ -172,7 +311,6 @@ def time_lapse(port='usb:001,011'):
     Observatory = MKO
     now = datetime.datetime.now(UTC)
     Observatory.date = now
-    Observatory.date = datetime.datetime(2013, 8, 23, 8, 0, 0)
     the_Sun = ephem.Sun()
     the_Sun.compute(Observatory)
 
@@ -205,25 +343,35 @@ def time_lapse(port='usb:001,011'):
     logger.info('Civil Twilight Begin:        {}'.format(civil_twilight_begin.astimezone(HST).strftime('%Y/%m/%d %H:%M:%S HST')))
     logger.info('Sunrise:                     {}'.format(sunrise.astimezone(HST).strftime('%Y/%m/%d %H:%M:%S HST')))
 
-    sys.exit(0)
-
     ##-------------------------------------------------------------------------
     ## Configure Camera
     ##-------------------------------------------------------------------------
-    cam = Camera(camera='Canon 5D', port=args.port, logger=logger)
-
-    logger.info('Setting image format to RAW')
-    cam.set_image_format('Raw')
+    cam = Camera(camera=model, serial=serial, port=port, logger=logger)
 
+    format = cam.raw_jpeg_format()
+    if format:
+        logger.info('Setting image format to {}'.format(format))
+        cam.set_image_format(format)
+    else:
+        logger.warning('Camera has no RAW + JPEG format, keeping {}'.format(cam.get_config('imageformat')))
 
-    logger.info('Setting focus mode to manual')
-    cam.set_focus_mode('manual')
+    manual = [choice for choice in cam.focusmode_list.keys() if choice.lower() == 'manual']
+    if manual:
+        logger.info('Setting focus mode to manual')
+        cam.set_focus_mode(manual[0])
+    else:
+        logger.info('Camera has no manual focus setting, set the lens to MF')
 
 
 
     ##-------------------------------------------------------------------------
     ## Enter Main Time Lapse Loop
     ##-------------------------------------------------------------------------
+    ## During the day the camera runs in Av.  From sunset to sunrise it runs
+    ## in M at a fixed aperture and the exposure ramp adjusts shutter and ISO
+    ## a fraction of a stop per frame, starting from the last Av exposure.
+    aperture = '2.0'
+    ramp = None
     while True:
         now = datetime.datetime.now(tz=pytz.utc)
 
@@ -231,36 +379,35 @@ def time_lapse(port='usb:001,011'):
             mode = 'Av'
             logger.info('It is day. Mode: {}'.format(mode))
             cam.set_mode(mode)
-        elif (now > sunset) and (now < civil_twilight_end):
-            mode = 'Av'
-            logger.info('It is evening (civil) twilight. Mode = {}'.format(mode))
-            cam.set_mode(mode)
-        elif (now > civil_twilight_end) and (now < nautical_twilight_end):
-            mode = 'Av'
-            logger.info('It is evening (nautical) twilight. Mode = {}'.format(mode))
-            cam.set_mode(mode)
-        elif (now > nautical_twilight_end) and (now < astronomical_twilight_end):
-            mode = 'M'
-            aperture = '2.0'
-            exposure = '20'
-            ISO = 1600
-            logger.info('It is evening (astronomical) twilight. Mode = {}. Av = {}. Tv = {}. ISO = {}.'.format(mode, aperture, exposure, iso))
-            cam.set_mode(mode)
-            cam.set_aperture(aperture)
-            cam.set_exposure(exposure)
-            cam.set_ISO(ISO)
-        elif now > astronomical_twilight_end:
-            mode = 'M'
-            aperture = '2.0'
-            exposure = '20'
-            ISO = 1600
-            logger.info('It is fully dark. Mode = {}. Av = {}. Tv = {}. ISO = {}.'.format(mode, aperture, exposure, iso))
-            cam.set_mode(mode)
-            cam.set_aperture(aperture)
-            cam.set_exposure(exposure)
-            cam.set_ISO(ISO)
-
-        cam.take_exposure()
+            ramp = None
+        else:
+            if not ramp:
+                exposure = cam.get_config('exposure')
+                if not AutoExposure.exposure_seconds(exposure):
+                    exposure = '1/100'
+                ISO = cam.get_config('ISO')
+                if not ISO.isdigit():
+                    ISO = '100'
+                mode = 'M'
+                logger.info('It is night. Mode = {}. Av = {}. Starting ramp at Tv = {}, ISO = {}.'.format(mode, aperture, exposure, ISO))
+                cam.set_mode(mode)
+                cam.set_aperture(aperture)
+                ramp = AutoExposure.ExposureRamp(cam.exposure_list.keys(),\
+                                                 cam.ISO_list.keys(),\
+                                                 exposure=exposure, ISO=ISO,\
+                                                 max_exposure=20., max_ISO=1600,\
+                                                 logger=logger)
+            cam.set_exposure(ramp.exposure)
+            cam.set_ISO(ramp.ISO)
+
+        files = cam.take_exposure(filename=now.strftime('%Y%m%d_%H%M%S'))
+        if ramp:
+            jpegs = [file for file in files if file.lower().endswith('.jpg')]
+            frame = AutoExposure.read_frame(jpegs[0]) if len(jpegs) > 0 else None
+            if frame is not None:
+                ramp.update(frame, step=1)
+            else:
+                logger.warning('No JPEG frame to measure, holding exposure.')
 
 
 if __name__ == '__main__':
@@ -278,7 +425,13 @@ if __name__ == '__main__':
     parser.add_argument("--port",
         type=str, dest="port",
         help="The port (use 'sudo gphoto2 --auto-detect' to find port.")
+    parser.add_argument("--model",
+        type=str, dest="model",
+        help="Camera model.  With --serial, use cached capabilities without querying the camera.")
+    parser.add_argument("--serial",
+        type=str, dest="serial",
+        help="Camera serial number.")
     args = parser.parse_args()
 
 
-    time_lapse(port=args.port)
+    time_lapse(port=args.port, model=args.model, serial=args.serial)
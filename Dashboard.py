@@ -0,0 +1,341 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import gzip
+import hashlib
+import threading
+import time
+import collections
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+import SensorStore
+import LogSetup
+
+
+##-------------------------------------------------------------------------
+## Static Page (charts are drawn in the browser)
+##-------------------------------------------------------------------------
+Page = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>RasPi Sensors</title>
+<style>
+body { font-family: sans-serif; margin: 1em; background: #fafafa; }
+h2 { margin-bottom: 0.2em; }
+.latest { font-size: 0.9em; color: #444; margin-bottom: 0.5em; }
+canvas { background: white; border: 1px solid #ccc; margin: 0 0.5em 0.5em 0; }
+</style>
+</head>
+<body>
+<div id="streams"></div>
+<script>
+var Refresh = 60000;
+
+function get(url) {
+  return fetch(url).then(function(response) { return response.json(); });
+}
+
+function draw(canvas, name, times, values) {
+  var ctx = canvas.getContext('2d'), w = canvas.width, h = canvas.height, pad = 30;
+  ctx.clearRect(0, 0, w, h);
+  var points = [];
+  for (var i = 0; i < values.length; i++) {
+    if (values[i] !== null) { points.push([times[i], values[i]]); }
+  }
+  ctx.fillStyle = '#000';
+  ctx.fillText(name, pad, 12);
+  if (points.length === 0) { return; }
+  var lo = Math.min.apply(null, points.map(function(p) { return p[1]; }));
+  var hi = Math.max.apply(null, points.map(function(p) { return p[1]; }));
+  if (hi === lo) { hi = lo + 1; }
+  ctx.fillText(hi.toFixed(1), 0, pad);
+  ctx.fillText(lo.toFixed(1), 0, h - 4);
+  ctx.strokeStyle = '#36c';
+  ctx.beginPath();
+  points.forEach(function(p, i) {
+    var x = pad + (w - pad) * p[0] / 24, y = pad + (h - 2*pad) * (hi - p[1]) / (hi - lo);
+    if (i === 0) { ctx.moveTo(x, y); } else { ctx.lineTo(x, y); }
+  });
+  ctx.stroke();
+}
+
+function update() {
+  get('/api/streams').then(function(streams) {
+    Object.keys(streams).forEach(function(stream) {
+      var div = document.getElementById(stream);
+      if (!div) {
+        div = document.createElement('div');
+        div.id = stream;
+        div.innerHTML = '<h2>' + stream + '</h2><div class="latest"></div><div class="charts"></div>';
+        document.getElementById('streams').appendChild(div);
+      }
+      get('/api/range?stream=' + stream).then(function(data) {
+        var start = new Date(); start.setHours(0, 0, 0, 0);
+        var times = data.timestamp.map(function(t) { return (t/1000 - start.getTime())/3600000; });
+        var last = data.timestamp.length - 1;
+        var latest = [];
+        var charts = div.querySelector('.charts');
+        streams[stream].forEach(function(column) {
+          if (column === 'timestamp') { return; }
+          if (last >= 0) { latest.push(column + ': ' + data[column][last]); }
+          if (data[column].some(function(v) { return typeof v === 'string'; })) { return; }
+          var canvas = document.getElementById(stream + '_' + column);
+          if (!canvas) {
+            canvas = document.createElement('canvas');
+            canvas.id = stream + '_' + column;
+            canvas.width = 400;
+            canvas.height = 160;
+            charts.appendChild(canvas);
+          }
+          draw(canvas, column, times, data[column]);
+        });
+        if (last >= 0) {
+          latest.unshift(new Date(data.timestamp[last]/1000).toLocaleString());
+        }
+        div.querySelector('.latest').textContent = latest.join(', ');
+      });
+    });
+  });
+}
+
+update();
+setInterval(update, Refresh);
+</script>
+</body>
+</html>
+'''
+
+
+##-------------------------------------------------------------------------
+## Response Cache
+##-------------------------------------------------------------------------
+class Dashboard(object):
+    '''Build and cache the JSON responses served by the dashboard.
+
+    Every response is cached in memory, already encoded and gzipped, along
+    with its ETag and the version of the data it was built from.  The version
+    of a stream is its newest timestamp, which is polled from the store at
+    most once every refresh seconds.  A cached range stays valid until new
+    data arrives, or forever once the range lies entirely in the past.  Most
+    requests are therefore answered from memory, or with a 304 if the browser
+    already holds the same ETag.
+
+    All request threads share one read only connection to the store, taking
+    turns on it.  It is opened once the database exists, so the dashboard may
+    start before any monitor has written; until then every stream list is
+    empty.  The list of streams and their columns are re-read at most once
+    every refresh seconds too.
+    '''
+    def __init__(self, db, refresh=5., max_entries=64, logger=None):
+        self.db = db
+        self.refresh = refresh
+        self.max_entries = max_entries
+        self.logger = logger
+        self.store = None
+        self.store_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+        self.names = (0, [])
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def query(self, method, *args):
+        '''Call a method of the shared store, one thread at a time.
+        '''
+        with self.store_lock:
+            if self.store is None:
+                self.store = SensorStore.Store(self.db, readonly=True)
+            return getattr(self.store, method)(*args)
+
+    def stream_names(self):
+        now = time.time()
+        with self.lock:
+            checked, names = self.names
+        if now - checked > self.refresh:
+            if not os.path.exists(self.db):
+                return []
+            names = self.query('streams')
+            ## Columns may have been added since they were cached
+            with self.store_lock:
+                self.store.columns.clear()
+            with self.lock:
+                self.names = (now, names)
+        return names
+
+    def version(self, stream):
+        now = time.time()
+        with self.lock:
+            checked, version = self.versions.get(stream, (0, None))
+        if now - checked > self.refresh:
+            version = self.query('last_timestamp', stream)
+            with self.lock:
+                self.versions[stream] = (now, version)
+        return version
+
+    def get(self, key, version, build, end=None):
+        '''Return the cached (etag, body, gzipped body) for key, building it
+        with build() if the cached copy is missing or out of date.
+        '''
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and (entry[0] == version or (end is not None and entry[0] is not None and entry[0] >= end)):
+                self.cache[key] = self.cache.pop(key)
+                self.hits += 1
+                return entry[1:]
+            self.misses += 1
+        body = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+        entry = (version, etag, body, gzip.compress(body))
+        with self.lock:
+            self.cache[key] = entry
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return entry[1:]
+
+    def streams(self):
+        names = self.stream_names()
+        version = tuple([self.version(name) for name in names])
+        return self.get(('streams',), version,\
+                        lambda: dict([(name, self.query('stream_columns', name)) for name in names]))
+
+    def latest(self):
+        names = self.stream_names()
+        version = tuple([self.version(name) for name in names])
+        return self.get(('latest',), version,\
+                        lambda: dict([(name, self.query('latest', name)) for name in names]))
+
+    def range(self, stream, start, end):
+        assert stream in self.stream_names(), 'Unknown stream: {}'.format(stream)
+        return self.get(('range', stream, start, end), self.version(stream),\
+                        lambda: self.query('read_range', stream, start, end), end=end)
+
+
+##-------------------------------------------------------------------------
+## HTTP Request Handler
+##-------------------------------------------------------------------------
+class DashboardHandler(BaseHTTPRequestHandler):
+    '''Read only HTTP interface:
+
+    /                   the static page
+    /api/streams        stream names and their columns
+    /api/latest         newest row of every stream
+    /api/range          ?stream=name and either ?date=YYYYMMDD (default
+                        today) or ?start=us&end=us
+    '''
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict([(key, val[0]) for key, val in parse_qs(url.query).items()])
+        dashboard = self.server.dashboard
+        try:
+            if url.path in ['/', '/index.html']:
+                body = Page.encode('utf-8')
+                etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+                self.respond(etag, body, None, 'text/html; charset=utf-8')
+            elif url.path == '/api/streams':
+                self.respond(*dashboard.streams())
+            elif url.path == '/api/latest':
+                self.respond(*dashboard.latest())
+            elif url.path == '/api/range':
+                if 'start' in query or 'end' in query:
+                    start = int(query['start']) if 'start' in query else None
+                    end = int(query['end']) if 'end' in query else None
+                else:
+                    start, end = SensorStore.day_range(query.get('date'))
+                self.respond(*dashboard.range(query.get('stream'), start, end))
+            else:
+                self.send_error(404)
+        except (AssertionError, ValueError) as e:
+            self.send_error(400, str(e))
+
+    def respond(self, etag, body, gzipped, content_type='application/json'):
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if gzipped and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzipped
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        ## Browsers may keep a copy, but must revalidate it with If-None-Match
+        self.send_header('Cache-Control', 'no-cache')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.dashboard.logger:
+            self.server.dashboard.logger.debug('{} {}'.format(self.address_string(), format % args))
+
+
+class DashboardServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Serve a read only dashboard of the sensor store.")
+    ## add arguments
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--db",
+        type=str, dest="db", required=True,
+        help="SQLite store to serve.")
+    parser.add_argument("--host",
+        type=str, dest="host", default='',
+        help="Address to listen on (default = all interfaces)")
+    parser.add_argument("--port",
+        type=int, dest="port", default=8080,
+        help="Port to listen on (default = 8080)")
+    parser.add_argument("--refresh",
+        type=float, dest="refresh", default=5.,
+        help="Seconds between checks of the store for new data (default = 5)")
+    args = parser.parse_args()
+
+    logger = LogSetup.get_logger('Dashboard', verbose=args.verbose)
+    server = DashboardServer((args.host, args.port), DashboardHandler)
+    server.dashboard = Dashboard(args.db, refresh=args.refresh, logger=logger)
+    logger.info('Serving {} on port {}'.format(args.db, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.dashboard.store:
+            server.dashboard.store.close()
+        logger.info('Cache hits: {}, misses: {}'.format(server.dashboard.hits, server.dashboard.misses))
+
+
+if __name__ == '__main__':
+    main()
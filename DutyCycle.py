@@ -0,0 +1,182 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import glob
+import multiprocessing
+import re
+import time
+
+import numpy as np
+
+import Archive
+
+
+DataDirectory = os.path.join('/', 'var', 'log', 'Kegerator')
+## Relay states as numbers; 'unknown' rows are left out of the runs
+RelayStates = {'On': 1, 'Off': 0}
+
+
+##-------------------------------------------------------------------------
+## Load One Day
+##-------------------------------------------------------------------------
+def load_day(path):
+    '''Read the timestamp, median keg temperature and relay state of a
+    Kegerator day file (text or archived).  Returns (date, timestamps in
+    seconds, temperatures, states) with states 1 for On, 0 for Off and -1
+    for unknown.  The lines are split directly rather than through astropy,
+    which dominates the cost of reading a day.
+    '''
+    lines = [line for line in Archive.read_lines(path) if Archive.line_timestamp(line) is not None]
+    date = re.match(r'(\d{8})', os.path.basename(path)).group(1)
+    if not lines:
+        return date, np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int8)
+    fields = [line.split() for line in lines]
+    numbers = np.array([row[:3] for row in fields], dtype=np.float64)
+    states = np.array([RelayStates.get(row[-1], -1) for row in fields], dtype=np.int8)
+    return date, numbers[:,0]/1e6, numbers[:,2], states
+
+
+##-------------------------------------------------------------------------
+## Run Length Analysis
+##-------------------------------------------------------------------------
+def runs(states):
+    '''Return the start index, end index (exclusive) and state of each run of
+    equal values.
+    '''
+    changes = np.flatnonzero(np.diff(states)) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(states)]))
+    return starts, ends, states[starts]
+
+
+def analyse(times, temperatures, states, max_gap=600.):
+    '''Duty cycle metrics of one span of samples.
+
+    Each sample's state is taken to hold until the next sample, but never
+    for more than max_gap seconds, so that gaps in the log do not count as
+    time on or off.  Runs which touch either end of the span are truncated,
+    so they are left out of the mean durations and the rates.
+    '''
+    known = states >= 0
+    times, temperatures, states = times[known], temperatures[known], states[known]
+    metrics = {'hours': 0., 'on_fraction': np.nan, 'cycles_per_hour': np.nan,
+               'mean_on': np.nan, 'mean_off': np.nan,
+               'cooling_rate': np.nan, 'warming_rate': np.nan}
+    if len(times) < 2:
+        return metrics
+    ## Time each sample represents
+    dt = np.minimum(np.diff(times), max_gap)
+    dt = np.append(dt, 0.)
+    total = dt.sum()
+    metrics['hours'] = total / 3600.
+    if total <= 0:
+        return metrics
+    metrics['on_fraction'] = dt[states == 1].sum() / total
+    starts, ends, values = runs(states)
+    metrics['cycles_per_hour'] = np.count_nonzero(values[1:] == 1) / metrics['hours']
+    ## Complete runs only: each lasts from its first sample to the first
+    ## sample of the next run
+    complete = slice(1, len(starts) - 1)
+    starts, ends, values = starts[complete], ends[complete], values[complete]
+    if len(starts) == 0:
+        return metrics
+    cumulative = np.concatenate(([0.], np.cumsum(dt)))
+    durations = cumulative[ends] - cumulative[starts]
+    change = temperatures[ends] - temperatures[starts]
+    hours = durations / 3600.
+    on, off = values == 1, values == 0
+    valid = hours > 0
+    if on.any():
+        metrics['mean_on'] = durations[on].mean() / 60.
+        rates = change[on & valid] / hours[on & valid]
+        metrics['cooling_rate'] = -np.nanmean(rates) if len(rates) else np.nan
+    if off.any():
+        metrics['mean_off'] = durations[off].mean() / 60.
+        rates = change[off & valid] / hours[off & valid]
+        metrics['warming_rate'] = np.nanmean(rates) if len(rates) else np.nan
+    return metrics
+
+
+def analyse_file(path):
+    date, times, temperatures, states = load_day(path)
+    metrics = analyse(times, temperatures, states)
+    metrics['date'] = date
+    metrics['samples'] = len(times)
+    return metrics
+
+
+##-------------------------------------------------------------------------
+## Find Day Files
+##-------------------------------------------------------------------------
+def day_files(directory=DataDirectory, start=None, end=None):
+    '''Return the day files (text, or archived if there is no text) in
+    directory with start <= date <= end (YYYYMMDD strings, None for open).
+    '''
+    paths = {}
+    for filename in glob.glob(os.path.join(directory, '[0-9]'*8+'.txt'+'*')):
+        path = filename[:-len(Archive.Extension)] if filename.endswith(Archive.Extension) else filename
+        if not path.endswith('.txt'):
+            continue
+        date = os.path.basename(path)[:8]
+        if (start is None or date >= start) and (end is None or date <= end):
+            paths[date] = path
+    return [paths[date] for date in sorted(paths)]
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Summarize the kegerator compressor duty cycle day by day.")
+    ## add arguments
+    parser.add_argument("--dir",
+        type=str, dest="dir", default=DataDirectory,
+        help="Directory of day files (default = {})".format(DataDirectory))
+    parser.add_argument("--start",
+        type=str, dest="start", default=None,
+        help="First day, YYYYMMDD (default = the first day logged)")
+    parser.add_argument("--end",
+        type=str, dest="end", default=None,
+        help="Last day, YYYYMMDD (default = the last day logged)")
+    parser.add_argument("--workers",
+        type=int, dest="workers", default=multiprocessing.cpu_count(),
+        help="Processes reading days in parallel (default = number of CPUs)")
+    args = parser.parse_args()
+
+    begin = time.time()
+    files = day_files(args.dir, args.start, args.end)
+    if args.workers > 1 and len(files) > 1:
+        pool = multiprocessing.Pool(args.workers)
+        results = pool.map(analyse_file, files, chunksize=max(1, len(files) // (4*args.workers)))
+        pool.close()
+        pool.join()
+    else:
+        results = [analyse_file(path) for path in files]
+
+    print('{:>8s} {:>6s} {:>6s} {:>8s} {:>9s} {:>9s} {:>9s} {:>9s}'.format(\
+          'date', 'hours', 'on %', 'cycles/h', 'on (min)', 'off (min)', 'cool F/h', 'warm F/h'))
+    for metrics in results:
+        print('{date:>8s} {hours:6.1f} {on:6.1f} {cycles_per_hour:8.2f} {mean_on:9.1f} '\
+              '{mean_off:9.1f} {cooling_rate:9.2f} {warming_rate:9.2f}'.format(\
+              on=metrics['on_fraction']*100., **metrics))
+    hours = np.array([metrics['hours'] for metrics in results])
+    if hours.sum() > 0:
+        weights = lambda name: np.nansum([metrics[name]*metrics['hours'] for metrics in results\
+                                          if metrics['hours'] > 0 and metrics[name] == metrics[name]])
+        on_fraction = weights('on_fraction') / hours.sum()
+        cycles = weights('cycles_per_hour') / hours.sum()
+        print('{:>8s} {:6.0f} {:6.1f} {:8.2f}'.format('all', hours.sum(), on_fraction*100., cycles))
+    print('Analysed {} days in {:.2f} s'.format(len(results), time.time() - begin))
+
+
+if __name__ == '__main__':
+    main()
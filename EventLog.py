@@ -0,0 +1,194 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import array
+import bisect
+import time
+
+
+##-------------------------------------------------------------------------
+## Define Event Log Class
+##-------------------------------------------------------------------------
+class EventLog(object):
+    '''Transitions of a discrete state, such as the kegerator relay or the
+    humidity status, kept as an append only text file with one line per
+    change:
+        timestamp old_state new_state
+    with the timestamp in integer microseconds since the epoch.
+
+    A state which holds for hours is one line rather than one string per
+    sample.  The transition times are held in an array, so state_at() is a
+    binary search and a time range is found without scanning the samples.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.times = array.array('q')
+        self.olds = []
+        self.states = []
+        self.offset = 0
+        self.refresh()
+
+    def __len__(self):
+        return len(self.times)
+
+    def refresh(self):
+        '''Read any events appended (by another process) since the last read.
+        Lines which do not parse are skipped.
+        '''
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as FO:
+            FO.seek(self.offset)
+            for line in FO:
+                if not line.endswith('\n'):
+                    break
+                self.offset += len(line)
+                fields = line.split()
+                if len(fields) != 3 or line.startswith('#') or\
+                   not fields[0].lstrip('-').isdigit():
+                    continue
+                self.times.append(int(fields[0]))
+                self.olds.append(fields[1])
+                self.states.append(fields[2])
+
+    def current(self):
+        '''The latest state, or None if nothing has been recorded.
+        '''
+        return self.states[-1] if self.states else None
+
+    def record(self, timestamp, state):
+        '''Record the state at timestamp (microseconds).  Only a change of
+        state is written.  Returns True if it was a transition.
+
+        If the clock has stepped back (a Pi without a real time clock boots
+        with an old time until NTP syncs), the transition is recorded at the
+        time of the last event instead, so the log stays in time order and
+        the change is not lost.
+        '''
+        state = state if isinstance(state, str) else state.decode()
+        assert len(state.split()) == 1, 'Invalid state: {!r}'.format(state)
+        old = self.current() or 'unknown'
+        if state == old:
+            return False
+        if self.times and timestamp < self.times[-1]:
+            timestamp = self.times[-1]
+        with open(self.path, 'a') as FO:
+            FO.write('{} {} {}\n'.format(int(timestamp), old, state))
+            self.offset = FO.tell()
+        self.times.append(int(timestamp))
+        self.olds.append(old)
+        self.states.append(state)
+        return True
+
+    def state_at(self, timestamp):
+        '''The state at timestamp.  Before the first event this is that
+        event's old state; None if there are no events.
+        '''
+        if not self.times:
+            return None
+        i = bisect.bisect_right(self.times, timestamp)
+        return self.states[i-1] if i > 0 else self.olds[0]
+
+    def transitions(self, start=None, end=None):
+        '''Return the events with start <= timestamp < end as a list of
+        (timestamp, old state, new state).
+        '''
+        first = 0 if start is None else bisect.bisect_left(self.times, start)
+        last = len(self.times) if end is None else bisect.bisect_left(self.times, end)
+        return [(self.times[i], self.olds[i], self.states[i]) for i in range(first, last)]
+
+    def steps(self, start, end):
+        '''The state over [start, end) as a step function: a list of times
+        (beginning with start and ending with end) and the state from each
+        time to the next, for plotting with drawstyle='steps-post'.
+        '''
+        times = [start]
+        states = [self.state_at(start)]
+        for timestamp, old, new in self.transitions(start, end):
+            if timestamp == start:
+                states[0] = new
+                continue
+            times.append(timestamp)
+            states.append(new)
+        times.append(end)
+        states.append(states[-1])
+        return times, states
+
+    def durations(self, start, end):
+        '''Return a dict of the time (microseconds) spent in each state over
+        [start, end).
+        '''
+        times, states = self.steps(start, end)
+        durations = {}
+        for i in range(len(times) - 1):
+            durations[states[i]] = durations.get(states[i], 0) + times[i+1] - times[i]
+        return durations
+
+
+def rebuild(log, rows):
+    '''Record the transitions found in (timestamp, state) rows, in time order,
+    e.g. from old day files which stored the state on every row.  Returns the
+    number of transitions recorded.
+    '''
+    recorded = 0
+    for timestamp, state in rows:
+        if log.times and timestamp <= log.times[-1]:
+            continue
+        if log.record(timestamp, state):
+            recorded += 1
+    return recorded
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Print a state transition log, or rebuild it from day files.")
+    ## add flags
+    parser.add_argument("--rebuild",
+        action="store_true", dest="rebuild",
+        default=False, help="Add the transitions found in the day files to the log.")
+    ## add arguments
+    parser.add_argument("--at",
+        type=str, dest="at",
+        help="Print the state at this local time (YYYYmmdd HH:MM:SS)")
+    parser.add_argument("log",
+        type=str,
+        help="Event log (e.g. /var/log/Kegerator/relay_events.txt)")
+    parser.add_argument("files", nargs='*',
+        help="Day files (Kegerator or HumidityMonitor format) for --rebuild")
+    args = parser.parse_args()
+
+    log = EventLog(args.log)
+    if args.rebuild:
+        import Archive
+        rows = []
+        for path in sorted(args.files):
+            if path.endswith(Archive.Extension):
+                path = path[:-len(Archive.Extension)]
+            for line in Archive.read_lines(path):
+                timestamp = Archive.line_timestamp(line)
+                if timestamp is not None:
+                    rows.append((timestamp, line.rstrip().replace(',', ' ').split()[-1]))
+        rows.sort()
+        print('Recorded {} transitions from {} rows'.format(rebuild(log, rows), len(rows)))
+    elif args.at:
+        timestamp = int(time.mktime(time.strptime(args.at, '%Y%m%d %H:%M:%S')) * 1e6)
+        print(log.state_at(timestamp))
+    else:
+        for timestamp, old, new in log.transitions():
+            print('{} {:>8s} -> {}'.format(\
+                  time.strftime('%Y/%m/%d %H:%M:%S', time.localtime(timestamp/1e6)), old, new))
+
+
+if __name__ == '__main__':
+    main()
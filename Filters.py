@@ -0,0 +1,337 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import math
+import random
+import bisect
+import collections
+import time
+
+
+##-------------------------------------------------------------------------
+## Indexable Skiplist
+##-------------------------------------------------------------------------
+class _Node(object):
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class IndexableSkiplist(object):
+    '''Sorted collection with O(log n) insert, remove and access by rank.
+
+    Each node's links carry the number of elements they skip over, so the
+    i'th smallest element is found by walking down the levels, subtracting
+    widths, just as a search walks down comparing values.
+    '''
+    def __init__(self, expected_size=100):
+        self.size = 0
+        self.maxlevels = int(1 + math.log(max(expected_size, 2), 2))
+        self.head = _Node(None, self.maxlevels)
+        self.random = random.Random(0)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        node = self.head
+        i += 1
+        for level in reversed(range(self.maxlevels)):
+            while node.next[level] is not None and node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def insert(self, value):
+        ## Find the last node before value on each level and its rank
+        chain = [None] * self.maxlevels
+        steps_at_level = [0] * self.maxlevels
+        node = self.head
+        for level in reversed(range(self.maxlevels)):
+            while node.next[level] is not None and node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        ## Link in a node of random height, splitting the link widths
+        levels = min(self.maxlevels, 1 - int(math.log(1. - self.random.random(), 2.)))
+        new = _Node(value, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, self.maxlevels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain = [None] * self.maxlevels
+        node = self.head
+        for level in reversed(range(self.maxlevels)):
+            while node.next[level] is not None and node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        node = chain[0].next[0]
+        if node is None or node.value != value:
+            raise KeyError('Not found: {}'.format(value))
+        for level in range(len(node.next)):
+            prev = chain[level]
+            prev.width[level] += node.width[level] - 1
+            prev.next[level] = node.next[level]
+        for level in range(len(node.next), self.maxlevels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, value):
+        '''Number of elements less than value.
+        '''
+        node = self.head
+        rank = 0
+        for level in reversed(range(self.maxlevels)):
+            while node.next[level] is not None and node.next[level].value < value:
+                rank += node.width[level]
+                node = node.next[level]
+        return rank
+
+
+##-------------------------------------------------------------------------
+## Selection Helper
+##-------------------------------------------------------------------------
+def kth_of_two(a, na, b, nb, k):
+    '''Return the k'th smallest (from 0) of the union of two ascending
+    sequences, given as accessor functions a(i) and b(i) with lengths na and
+    nb.  Uses O(log k) accesses.
+    '''
+    offset_a = offset_b = 0
+    while True:
+        if offset_a == na:
+            return b(offset_b + k)
+        if offset_b == nb:
+            return a(offset_a + k)
+        if k == 0:
+            return min(a(offset_a), b(offset_b))
+        step = (k + 1) // 2
+        index_a = min(offset_a + step, na) - 1
+        index_b = min(offset_b + step, nb) - 1
+        if a(index_a) <= b(index_b):
+            k -= index_a - offset_a + 1
+            offset_a = index_a + 1
+        else:
+            k -= index_b - offset_b + 1
+            offset_b = index_b + 1
+
+
+##-------------------------------------------------------------------------
+## Rolling Median and MAD
+##-------------------------------------------------------------------------
+class RollingMedian(object):
+    '''Median and median absolute deviation of the last window values.
+
+    Each update is O(log w): one skiplist insert and one remove.  The median
+    is read by rank.  The absolute deviations below and above the median are
+    two ascending sequences which can be read straight from the skiplist, so
+    the MAD is found by selection across the two in O(log^2 w) without ever
+    sorting the deviations.
+    '''
+    def __init__(self, window=5, values=None):
+        self.window = window
+        self.values = collections.deque()
+        self.sorted = IndexableSkiplist(window)
+        for value in values or []:
+            self.push(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def push(self, value):
+        self.values.append(value)
+        self.sorted.insert(value)
+        if len(self.values) > self.window:
+            self.sorted.remove(self.values.popleft())
+
+    def median(self):
+        n = len(self.sorted)
+        if n % 2:
+            return self.sorted[n // 2]
+        return (self.sorted[n // 2 - 1] + self.sorted[n // 2]) / 2.
+
+    def mad(self):
+        n = len(self.sorted)
+        median = self.median()
+        split = self.sorted.rank(median)
+        below = lambda i: median - self.sorted[split - 1 - i]
+        above = lambda i: self.sorted[split + i] - median
+        select = lambda k: kth_of_two(below, split, above, n - split, k)
+        if n % 2:
+            return select(n // 2)
+        return (select(n // 2 - 1) + select(n // 2)) / 2.
+
+
+## Smallest noise assumed on each channel, about the resolution of the sensors
+## giving it (DS18B20 at 10 bits, DHT22, AAG), so a window of identical
+## readings does not switch the spike rejection off
+Resolution = {'temperature_C': 0.25, 'temperature_F': 0.45, 'humidity': 0.1,
+              'AmbTemp': 0.1, 'SkyTemp': 0.1}
+
+
+class HampelFilter(object):
+    '''Replace values more than threshold scaled MADs from the rolling median
+    with the median.  The raw value still enters the window, so a real step
+    change is passed once it makes up half the window.  The scaled MAD is
+    never taken as less than min_sigma; with min_sigma 0 nothing is rejected
+    while the window's values are all equal.
+    '''
+    def __init__(self, window=5, threshold=3., values=None, min_sigma=0.):
+        self.threshold = threshold
+        self.min_sigma = min_sigma
+        self.rolling = RollingMedian(window, values)
+
+    def push(self, value):
+        '''Add a value and return (filtered value, True if it was replaced).
+        '''
+        self.rolling.push(value)
+        if len(self.rolling) < 3:
+            return value, False
+        median = self.rolling.median()
+        ## 1.4826 scales the MAD to a standard deviation for normal noise
+        sigma = max(1.4826 * self.rolling.mad(), self.min_sigma)
+        if sigma > 0 and abs(value - median) > self.threshold * sigma:
+            return median, True
+        return value, False
+
+
+##-------------------------------------------------------------------------
+## Filters for the Sampling Path
+##-------------------------------------------------------------------------
+def numeric(value):
+    '''True for a number that can be filtered (not a bool, None or NaN).
+    '''
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+class ChannelFilters(object):
+    '''A HampelFilter for every numeric channel of every sensor.
+
+    apply() takes the dict of channel values read from a sensor and returns
+    the filtered dict.  Monitors run from cron read each sensor once per
+    process, so the windows can be saved to and restored from state_file.
+    min_sigma gives the noise floor of each channel name.  When a sensor
+    gives both temperature_C and temperature_F only the Celsius value is
+    filtered and F is derived from it, so the two always agree.
+    '''
+    def __init__(self, window=5, threshold=3., state_file=None, min_sigma=Resolution, logger=None):
+        self.window = window
+        self.threshold = threshold
+        self.min_sigma = min_sigma
+        self.state_file = state_file
+        self.logger = logger
+        self.filters = {}
+        if state_file and os.path.exists(state_file):
+            try:
+                with open(state_file, 'r') as FO:
+                    for key, values in json.load(FO).items():
+                        self.filters[key] = HampelFilter(window, threshold, values[-window:],\
+                                                         self.floor(key))
+            except ValueError:
+                if self.logger:
+                    self.logger.warning('Ignoring unreadable filter state {}'.format(state_file))
+
+    def floor(self, key):
+        return self.min_sigma.get(key.split('.', 1)[-1], 0.)
+
+    def apply(self, sensor, values):
+        filtered = {}
+        derive_F = 'temperature_F' in values and numeric(values.get('temperature_C'))
+        for channel, value in values.items():
+            if channel == 'temperature_F' and derive_F:
+                continue
+            if not numeric(value):
+                filtered[channel] = value
+                continue
+            key = '{}.{}'.format(sensor, channel)
+            if key not in self.filters:
+                self.filters[key] = HampelFilter(self.window, self.threshold, min_sigma=self.floor(key))
+            filtered[channel], replaced = self.filters[key].push(value)
+            if replaced and self.logger:
+                self.logger.info('Rejected {} = {:.2f}, using rolling median {:.2f}'.format(\
+                                 key, value, filtered[channel]))
+        if derive_F:
+            filtered['temperature_F'] = filtered['temperature_C']*9./5.+32.
+        return filtered
+
+    def save(self):
+        state = dict([(key, list(hampel.rolling.values)) for key, hampel in self.filters.items()])
+        with open(self.state_file+'.tmp', 'w') as FO:
+            json.dump(state, FO)
+        os.rename(self.state_file+'.tmp', self.state_file)
+
+
+##-------------------------------------------------------------------------
+## Main Program (benchmark)
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Benchmark the rolling median/MAD against re-sorting the window.")
+    ## add arguments
+    parser.add_argument("--windows",
+        type=int, nargs='+', dest="windows", default=[101, 1001, 10001, 100001],
+        help="Window sizes to time (default = 101 1001 10001 100001)")
+    parser.add_argument("--updates",
+        type=int, dest="updates", default=2000,
+        help="Updates timed per window (default = 2000)")
+    args = parser.parse_args()
+
+    generator = random.Random(1)
+    print('{:>8s} {:>14s} {:>14s} {:>14s}'.format('window', 'skiplist (us)', 'insort (us)', 'sorted (us)'))
+    for window in args.windows:
+        data = [generator.gauss(40., 0.5) for i in range(window + args.updates)]
+        ## Skiplist median and MAD
+        rolling = RollingMedian(window, data[:window])
+        start = time.time()
+        for value in data[window:]:
+            rolling.push(value)
+            median, mad = rolling.median(), rolling.mad()
+        skiplist = (time.time() - start) / args.updates * 1e6
+        last = (median, mad)
+        ## Sorted list kept with bisect (O(w) memory moves per update)
+        values = collections.deque(data[:window])
+        ordered = sorted(values)
+        start = time.time()
+        for value in data[window:]:
+            values.append(value)
+            bisect.insort(ordered, value)
+            del ordered[bisect.bisect_left(ordered, values.popleft())]
+            median = ordered[window // 2]
+            mad = sorted([abs(x - median) for x in ordered])[window // 2]
+        insort = (time.time() - start) / args.updates * 1e6
+        assert (median, mad) == last
+        ## Re-sort the whole window every update
+        updates = min(args.updates, max(10, 2000000 // window))
+        start = time.time()
+        for i in range(args.updates - updates, args.updates):
+            ordered = sorted(data[i+1:i+1+window])
+            median = ordered[window // 2]
+            mad = sorted([abs(x - median) for x in ordered])[window // 2]
+        resort = (time.time() - start) / updates * 1e6
+        ## All three must agree on the final window
+        assert (median, mad) == last
+        print('{:8d} {:14.1f} {:14.1f} {:14.1f}'.format(window, skiplist, insort, resort))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,16 +6,15 @@ from __future__ import division, print_function
 import sys
 import os
 import argparse
-import logging
 import time
-import numpy as np
 
-import Adafruit_DHT
+import Sampler
 # import DHT22
 # import DS18B20
 # import urllib2
 # import Carriots
 import humiditycalc
+import LogSetup
 
 # import astropy.io.ascii as ascii
 # import astropy.table as table
@@ -23,46 +22,64 @@ import humiditycalc
 threshold_humid = 55
 threshold_wet = 75
 
+
+##-------------------------------------------------------------------------
+## Read Daily Data File
+##-------------------------------------------------------------------------
+def read_datafile(datafile):
+    '''Read a daily data file.  Returns a list of rows, each holding the
+    timestamp (integer microseconds since the Unix epoch), temperature (F),
+    humidity (%), absolute humidity (g/m^3) and status.  The file may have
+    been packed by Archive.py.
+    '''
+    import Archive
+    data = []
+    if Archive.exists(datafile):
+        for line in Archive.read_lines(datafile):
+            if line[0] != '#':
+                val = line.strip('\n').split(',')
+                data.append([int(val[0]), float(val[1]), float(val[2]), float(val[3]), val[4]])
+    return data
+
+
 ##-------------------------------------------------------------------------
 ## Main Program
 ##-------------------------------------------------------------------------
-def measure(verbose=False):
+def measure(verbose=False, db=None, spool=None):
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-    LogFileName = os.path.join('/', 'home', 'joshw', 'logs', time.strftime('HumidityLog_%Y%m%d.txt', time.localtime()))
-    LogFileHandler = logging.FileHandler(LogFileName)
-    LogFileHandler.setLevel(logging.DEBUG)
-    LogFileHandler.setFormatter(LogFormat)
-    logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('HumidityMonitor', verbose=verbose,\
+             logfile=os.path.join('/', 'home', 'joshw', 'logs', 'HumidityLog_%Y%m%d.txt'))
 
     ##-------------------------------------------------------------------------
     ## Get Temperature and Humidity Values
     ##-------------------------------------------------------------------------
     logger.info('#### Reading Temperature and Humidity Sensors ####')
     logger.info('Reading DHT22')
-    sensor = Adafruit_DHT.AM2302
-    pin = 4
-    DHT_humidity, DHT_temperature_C = Adafruit_DHT.read_retry(sensor, pin)
-    if not DHT_humidity or not DHT_temperature_C:
-        DHT_humidity, DHT_temperature_C = Adafruit_DHT.read_retry(sensor, pin)
-    if not DHT_humidity or not DHT_temperature_C:
-        print('Read failed a second time.')
+    import Filters
+    filters = Filters.ChannelFilters(window=5,\
+              state_file=os.path.join('/', 'home', 'joshw', 'logs', 'filter_state.json'),\
+              logger=logger)
+    ## Go through the sensor broker when it is running
+    import SensorBroker
+    engine = Sampler.SamplingEngine(SensorBroker.broker_sensors([Sampler.AdafruitDHTSensor(name='DHT22', pin=4)]),\
+                                    logger=logger, filters=filters)
+    snapshot = engine.sample()
+    filters.save()
+    import LatestBoard
+    try:
+        board = LatestBoard.Board()
+        board.publish_snapshot(snapshot)
+        board.close()
+    except (IOError, OSError) as e:
+        logger.warning('Could not publish latest values: {}'.format(e))
+    if 'DHT22' not in snapshot.values:
+        print('Read failed: {}'.format(snapshot.errors['DHT22']))
         sys.exit(1)
-    
-    DHT_temperature_F = 32. + 9./5.*DHT_temperature_C
+    DHT_humidity = snapshot.get('DHT22', 'humidity')
+    DHT_temperature_C = snapshot.get('DHT22', 'temperature_C')
+    DHT_temperature_F = snapshot.get('DHT22', 'temperature_F')
 
     logger.info('  Temperature = {:.3f} F, Humidity = {:.1f} %'.format(DHT_temperature_F, DHT_humidity))
     AH = humiditycalc.relative_to_absolute_humidity(DHT_temperature_C, DHT_humidity)
@@ -82,54 +99,73 @@ def measure(verbose=False):
 
 
     ##-------------------------------------------------------------------------
-    ## Determine Status and Alarm Using History
+    ## Determine Alarm Using Rules
     ##-------------------------------------------------------------------------
-    datestring = time.strftime('%Y%m%d_log.txt', time.localtime())
-    timestring = time.strftime('%Y/%m/%d %H:%M:%S HST', time.localtime())
-    datafile = os.path.join('/', 'home', 'joshw', 'logs', datestring)
-    logger.debug("Reading history data from file: {0}".format(datafile))
-    dataFO = open(datafile, 'a+')
-    lines = dataFO.readlines()
-
-    if len(lines) == 0:
-        dataFO = open(datafile, 'a')
-        dataFO.write('# {},{},{},{},{},{}\n'.format(
-                     'date',\
-                     'time',\
-                     'temperature (F)',\
-                     'humidity (%)',\
-                     'absolute humidity (g/m^3)',\
-                     'status'))
-        data = []
-    else:
-        data = []
-        for line in lines:
-            if line[0] != '#':
-                data.append(line.strip('\n').split(','))
-            
-
-    translation = {'OK':0, 'HUMID':1, 'WET':2, 'ALARM':2}
-    if len(data) > 6:
-        recent_status_vals = [translation[line[5]] for line in data][-6:]
-        recent_status = np.mean(recent_status_vals)
-    if len(data) > 23:
-        recent_status_vals = [translation[line[5]] for line in data][-23:]
-        recent_alarm = 2 in recent_status_vals
-        logger.debug('  Recent Status = {:.2f}, Current Status = {}, Recent alarm: {}'.format(recent_status, status, recent_alarm))
-        if (recent_status > 0.5) and not status == 'OK' and not recent_alarm:
-            status = 'ALARM'
+    import Rules
+    timestamp = int(snapshot.timestamp * 1e6)
+    logdir = os.path.join('/', 'home', 'joshw', 'logs')
+    rules = Rules.RuleEngine(Rules.HumidityRules,\
+                             sink=Rules.AlertSink(os.path.join(logdir, 'alerts.jsonl')),\
+                             state_file=os.path.join(logdir, 'rules_state.json'),\
+                             logger=logger)
+    events = rules.update('humidity', {'timestamp': timestamp,
+                                       'temperature_F': DHT_temperature_F,
+                                       'humidity': DHT_humidity,
+                                       'AH': AH})
+    rules.save()
+    if len([event for event in events if event['event'] == 'alert']) > 0:
+        status = 'ALARM'
+        logger.info('Status: {}'.format(status))
+    import EventLog
+    try:
+        if EventLog.EventLog(os.path.join(logdir, 'status_events.txt')).record(timestamp, status):
+            logger.info('Status changed to {}'.format(status))
+    except (IOError, OSError, ValueError) as e:
+        logger.warning('Could not record status event: {}'.format(e))
 
 
     ##-------------------------------------------------------------------------
     ## Record Values to Table
     ##-------------------------------------------------------------------------
-    dataFO.write('{},{},{:.1f},{:.1f},{:.2f},{}\n'.format(
-                 timestring[0:10],\
-                 timestring[11:23],\
+    datestring = time.strftime('%Y%m%d_log.txt', time.localtime())
+    datafile = os.path.join(logdir, datestring)
+    logger.debug("Writing to data file: {0}".format(datafile))
+    dataFO = open(datafile, 'a')
+    if not os.path.getsize(datafile):
+        dataFO.write('# {},{},{},{},{}\n'.format(
+                     'timestamp (us)',\
+                     'temperature (F)',\
+                     'humidity (%)',\
+                     'absolute humidity (g/m^3)',\
+                     'status'))
+    dataFO.write('{},{:.1f},{:.1f},{:.2f},{}\n'.format(
+                 timestamp,\
                  DHT_temperature_F,\
                  DHT_humidity,\
                  AH,\
                  status))
+    dataFO.close()
+
+    ## Write to SQLite Store
+    if db:
+        import SensorStore
+        logger.debug("Writing to {}".format(db))
+        store = SensorStore.Store(db)
+        store.write('humidity', {'timestamp': timestamp,
+                                 'temperature_F': DHT_temperature_F,
+                                 'humidity': DHT_humidity,
+                                 'AH': AH,
+                                 'status': status})
+        store.close()
+
+    ## Queue a plot for the render service (never render here)
+    if spool:
+        import PlotRenderer
+        try:
+            PlotRenderer.submit('humidity', time.strftime('%Y%m%d', time.localtime()),\
+                                version=timestamp, db=db, spool=spool)
+        except (IOError, OSError) as e:
+            logger.warning('Could not queue plot: {}'.format(e))
 
 
     ## Log to Carriots
@@ -163,7 +199,7 @@ def measure(verbose=False):
 ##-------------------------------------------------------------------------
 ## Make Plot
 ##-------------------------------------------------------------------------
-def plot(verbose=False):
+def plot(verbose=False, db=None, date=None):
 
     import matplotlib
     matplotlib.use('Agg')
@@ -173,47 +209,43 @@ def plot(verbose=False):
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-    LogFileName = os.path.join('/', 'home', 'joshw', 'logs', 'PlotLog.txt')
-    LogFileHandler = logging.FileHandler(LogFileName)
-    LogFileHandler.setLevel(logging.DEBUG)
-    LogFileHandler.setFormatter(LogFormat)
-    logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('HumidityPlot', verbose=verbose,\
+             logfile=os.path.join('/', 'home', 'joshw', 'logs', 'PlotLog.txt'))
+
+    import SensorStore
+    start, end = SensorStore.day_range(date)
 
     ##-------------------------------------------------------------------------
-    ## Read Log File
+    ## Read Data from SQLite Store
     ##-------------------------------------------------------------------------
-    datestring = time.strftime('%Y%m%d_log.txt', time.localtime())
-    datafile = os.path.join('/', 'home', 'joshw', 'logs', datestring)
-    logger.info("Reading Data File: "+datafile)
+    if db:
+        logger.info("Reading Data from: "+db)
+        store = SensorStore.Store(db)
+        columns = store.read_range('humidity', start, end)
+        store.close()
+        timestamps = columns['timestamp']
+        temperature = columns['temperature_F']
+        humidity = columns['humidity']
+        AH = columns['AH']
+        status = columns['status']
 
-    dataFO = open(datafile, 'a+')
-    lines = dataFO.readlines()
-    data = []
-    for line in lines:
-        if line[0] != '#':
-            data.append(line.strip('\n').split(','))
+    ##-------------------------------------------------------------------------
+    ## Read Log File
+    ##-------------------------------------------------------------------------
+    else:
+        datestring = '{}_log.txt'.format(date or time.strftime('%Y%m%d', time.localtime()))
+        datafile = os.path.join('/', 'home', 'joshw', 'logs', datestring)
+        logger.info("Reading Data File: "+datafile)
+        data = read_datafile(datafile)
+        timestamps = [val[0] for val in data]
+        temperature = [val[1] for val in data]
+        humidity = [val[2] for val in data]
+        AH = [val[3] for val in data]
+        status = [val[4] for val in data]
 
-    dates = [val[0] for val in data]
-    time_strings = [val[1] for val in data]
-    times = [(time.strptime(val[1], '%H:%M:%S HST').tm_hour +\
-              time.strptime(val[1], '%H:%M:%S HST').tm_min/60.)\
-             for val in data ]
-    temperature = [float(val[2]) for val in data]
-    humidity = [float(val[3]) for val in data]
-    AH = [float(val[4]) for val in data]
-    status = [val[5] for val in data]
+    ## Times are only converted to local time here, for display
+    times = [(val - start)/3600e6 for val in timestamps]
+    last_time = time.localtime(timestamps[-1]/1e6)
 
 
     ##-------------------------------------------------------------------------
@@ -227,7 +259,8 @@ def plot(verbose=False):
     Figure = pyplot.figure(figsize=(16,10), dpi=dpi)
 
     HumidityAxes = pyplot.axes([0.10, 0.43, 0.9, 0.40])
-    title_string = '{:10s} at {:12s}:\n'.format(dates[-1], time_strings[-1])
+    title_string = '{:10s} at {:12s}:\n'.format(time.strftime('%Y/%m/%d', last_time),\
+                                                time.strftime('%H:%M:%S %Z', last_time))
     title_string += 'Temperature = {:.1f} F, '.format(temperature[-1])
     title_string += 'Humidity = {:.0f} %'.format(humidity[-1])
     pyplot.title(title_string)
@@ -295,12 +328,19 @@ def main():
     parser.add_argument("-p", "--plot",
         action="store_true", dest="plot",
         default=False, help="Make plot.")
+    ## add arguments
+    parser.add_argument("--db",
+        type=str, dest="db", default=None,
+        help="Also write to (or plot from) this SQLite store.")
+    parser.add_argument("--spool",
+        type=str, dest="spool", default=None,
+        help="Queue a plot job in this PlotRenderer spool directory after measuring.")
     args = parser.parse_args()
 
     if not args.plot:
-        measure(verbose=args.verbose)
+        measure(verbose=args.verbose, db=args.db, spool=args.spool)
     else:
-        plot(verbose=args.verbose)
+        plot(verbose=args.verbose, db=args.db)
 
 
 if __name__ == '__main__':
@@ -6,24 +6,71 @@ from __future__ import division, print_function
 import sys
 import os
 import argparse
-import logging
-import numpy as np
 import datetime
 import math
+import time
 
-import RPi.GPIO as GPIO
+import Sampler
+import humiditycalc
+import LogSetup
 
-import DHT22
-import DS18B20
-import Carriots
-import humidity
-
-import astropy.io.ascii as ascii
-import astropy.table as table
+## Heavy modules (numpy, astropy, matplotlib, RPi.GPIO and Carriots) are
+## imported inside the functions which use them, so that each command line
+## path only pays for what it needs.
 
 
 temp_high = 42.0
 temp_low = 38.0
+## 10 bit (0.25 C) probe readings convert in ~190 ms rather than 750 ms
+ds18b20_resolution = 10
+
+## Columns of the daily data files.  timestamp is integer microseconds since
+## the Unix epoch; it is only converted to local time for display.
+table_names = ('timestamp', 'AmbTemp', 'KegTemp', 'KegTemp1', 'KegTemp2', 'KegTemp3', 'RH', 'AH', 'status')
+table_dtype = ('i8',        'f4',      'f4',      'f4',       'f4',       'f4',       'f4', 'f4', 'S8')
+
+
+##-------------------------------------------------------------------------
+## Read Daily Data File
+##-------------------------------------------------------------------------
+def read_datafile(datafile):
+    '''Read a daily data file into an astropy table.  The file may have been
+    packed by Archive.py.
+    '''
+    import astropy.io.ascii as ascii
+    import Archive
+    converters = dict([(name, [ascii.convert_numpy(dtype)])\
+                       for name, dtype in zip(table_names, table_dtype)])
+    lines = [line.rstrip('\n') for line in Archive.read_lines(datafile)]
+    return ascii.read(lines, guess=False,
+                      header_start=0, data_start=1,
+                      Reader=ascii.basic.Basic,
+                      converters=converters)
+
+
+##-------------------------------------------------------------------------
+## Median of a Short List
+##-------------------------------------------------------------------------
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle-1] + values[middle]) / 2.
+
+
+##-------------------------------------------------------------------------
+## Set Relay
+##-------------------------------------------------------------------------
+def relay(state, pin=23):
+    '''Turn the kegerator relay on (True) or off (False).  Only RPi.GPIO is
+    imported.
+    '''
+    import RPi.GPIO as GPIO
+    GPIO.setwarnings(False)
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(pin, GPIO.OUT)
+    GPIO.output(pin, state)
 
 
 ##-------------------------------------------------------------------------
@@ -32,6 +79,11 @@ temp_low = 38.0
 def main(args):
 #     temp_high = 42.0
 #     temp_low = 38.0
+    import RPi.GPIO as GPIO
+    import astropy.io.ascii as ascii
+    import astropy.table as table
+    import ControlCycle
+
     status = 'unknown'
 
     GPIO.setmode(GPIO.BCM)
@@ -40,150 +92,240 @@ def main(args):
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if args.verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
     now = datetime.datetime.now()
     DateString = '{}'.format(now.strftime('%Y%m%d'))
-    TimeString = '{} HST'.format(now.strftime('%H:%M:%S'))
-    LogFileName = os.path.join('/', 'var', 'log', 'Kegerator', 'Log_{}.txt'.format(DateString))
-    LogFileHandler = logging.FileHandler(LogFileName)
-    LogFileHandler.setLevel(logging.DEBUG)
-    LogFileHandler.setFormatter(LogFormat)
-    logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('Kegerator', verbose=args.verbose,\
+             logfile=os.path.join('/', 'var', 'log', 'Kegerator', 'Log_%Y%m%d.txt'))
 
     ##-------------------------------------------------------------------------
-    ## Get Temperature and Humidity Values
+    ## Every stage below runs within a time budget.  If the cycle cannot
+    ## decide on the relay, or overruns as a whole, the relay is switched off.
     ##-------------------------------------------------------------------------
-    logger.info('#### Reading Temperature and Humidity Sensors ####')
-    temperatures_F = []
-
+    logdir = os.path.join('/', 'var', 'log', 'Kegerator')
+    watchdog = ControlCycle.Watchdog(timeout=15, logger=logger)
+    cycle = ControlCycle.ControlCycle('kegerator', deadline=50.,\
+            state_file=os.path.join(logdir, 'cycle_state.json'),\
+            fail_safe=lambda: relay(False), watchdog=watchdog, logger=logger)
+    cycle.start()
     try:
-        logger.debug('Reading DHT22')
-        DHT = DHT22.DHT22(pin=18)
-        DHT.read()
-        logger.debug('  Temperature = {:.3f} F, Humidity = {:.1f} %'.format(DHT.temperature_F, DHT.humidity))
-        temperatures_F.append(DHT.temperature_F)
-        RH = DHT.humidity
-        AH = humidity.relative_to_absolute_humidity(DHT.temperature_C, DHT.humidity)
-        logger.debug('  Absolute Humidity = {:.2f} g/m^3'.format(AH))
-    except:
-        RH = float('nan')
-        AH = float('nan')
-
-
-    logger.debug('Reading DS18B20')
-    sensor = DS18B20.DS18B20()
-    sensor.read()
-    for temp in sensor.temperatures_C:
-        logger.debug('  Temperature = {:.3f} F'.format(temp*9./5.+32.))
-        temperatures_F.append(temp*9./5.+32.)
-
-
-    ##-------------------------------------------------------------------------
-    ## Record Values to Table
-    ##-------------------------------------------------------------------------
-    datafile = os.path.join('/', 'var', 'log', 'Kegerator', '{}.txt'.format(DateString))
-    logger.debug("Preparing astropy table object for data file {}".format(datafile))
-    if not os.path.exists(datafile):
-        logger.info("Making new astropy table object")
-        SummaryTable = table.Table(names=('date', 'time', 'AmbTemp', 'KegTemp', 'KegTemp1', 'KegTemp2', 'KegTemp3', 'RH', 'AH', 'status'), \
-                                   dtype=('S10',  'S12',  'f4',      'f4',      'f4',       'f4',       'f4',       'f4', 'f4', 'S8') )
-    else:
-        logger.debug("Reading astropy table object from file: {0}".format(datafile))
-        try:
-            SummaryTable = ascii.read(datafile, guess=False,
-                                      header_start=0, data_start=1,
-                                      Reader=ascii.basic.Basic,
-                                      converters={
-                                      'date': [ascii.convert_numpy('S10')],
-                                      'time': [ascii.convert_numpy('S12')],
-                                      'AmbTemp': [ascii.convert_numpy('f4')],
-                                      'KegTemp': [ascii.convert_numpy('f4')],
-                                      'KegTemp1': [ascii.convert_numpy('f4')],
-                                      'KegTemp2': [ascii.convert_numpy('f4')],
-                                      'KegTemp3': [ascii.convert_numpy('f4')],
-                                      'hum': [ascii.convert_numpy('f4')],
-                                      'AH': [ascii.convert_numpy('f4')],
-                                      'status': [ascii.convert_numpy('S11')],
-                                      })
-        except:
-            logger.critical("Failed to read data file: {0} {1} {2}".format(sys.exc_info()[0], sys.exc_info()[1], sys.exc_info()[2]))
-
-
-    ##-------------------------------------------------------------------------
-    ## Turn Kegerator Relay On or Off Based on Temperature
-    ##-------------------------------------------------------------------------
-    temperatures_F.sort()
-    ambient_temperature = temperatures_F.pop()
-    assert ambient_temperature > max(temperatures_F)
-    logger.info('Ambient Temperature = {:.1f}'.format(ambient_temperature))
-    for temp in temperatures_F:
-        logger.info('Kegerator Temperatures = {:.1f} F'.format(temp))
-    temperature = np.median(temperatures_F)
-    logger.info('Median Temperature = {:.1f} F'.format(temperature))
-    if temperature > temp_high:
-        status = 'On'
-        logger.info('Temperature {:.1f} is greater than {:.1f}.  Turning freezer {}.'.format(temperature, temp_high, status))
-        GPIO.output(23, True)
-    elif temperature < temp_low:
-        status = 'Off'
-        logger.info('Temperature {:.1f} is less than {:.1f}.  Turning freezer {}.'.format(temperature, temp_low, status))
-        GPIO.output(23, False)
-    else:
-        if len(SummaryTable) > 0:
-            status = SummaryTable['status'][-1]
+        ##-------------------------------------------------------------------------
+        ## Get Temperature and Humidity Values
+        ##-------------------------------------------------------------------------
+        logger.info('#### Reading Temperature and Humidity Sensors ####')
+        temperatures_F = []
+
+        import Filters
+        filters = cycle.run('filters', Filters.ChannelFilters, 2.,\
+                  kwargs={'window': 5, 'state_file': os.path.join(logdir, 'filter_state.json'),\
+                          'logger': logger})
+        ## Go through the sensor broker when it is running
+        import SensorBroker
+        direct = [Sampler.DHT22Sensor(name='DHT22', pin=18)] +\
+                 Sampler.ds18b20_sensors(resolution=ds18b20_resolution)
+        sensors = cycle.run('broker', SensorBroker.broker_sensors, 2., fallback=direct, args=(direct,))
+        engine = Sampler.SamplingEngine(sensors, logger=logger, filters=filters)
+        def sample():
+            snapshot = engine.sample()
+            if filters:
+                filters.save()
+            return snapshot
+        snapshot = cycle.run('sample', sample, 12., fallback=Sampler.Snapshot(time.time()))
+        timestamp = int(snapshot.timestamp * 1e6)
+
+        if 'DHT22' in snapshot.values:
+            DHT_temperature_C = snapshot.get('DHT22', 'temperature_C')
+            DHT_temperature_F = snapshot.get('DHT22', 'temperature_F')
+            RH = snapshot.get('DHT22', 'humidity')
+            logger.debug('DHT22 Temperature = {:.3f} F, Humidity = {:.1f} %'.format(DHT_temperature_F, RH))
+            temperatures_F.append(DHT_temperature_F)
+            AH = humiditycalc.relative_to_absolute_humidity(DHT_temperature_C, RH)
+            logger.debug('  Absolute Humidity = {:.2f} g/m^3'.format(AH))
         else:
-            status = 'unknown'
-        logger.info('Temperature if {:.1f}.  Taking no action.  Status is {}'.format(temperature, status))
-
-
-    ##-------------------------------------------------------------------------
-    ## Add row to data table
-    ##-------------------------------------------------------------------------
-    logger.debug("Writing new row to data table.")
-    while len(temperatures_F) < 4:
-        temperatures_F.append(float('nan'))
-    SummaryTable.add_row((DateString, TimeString, ambient_temperature, temperature, \
-                          temperatures_F[0], temperatures_F[1], temperatures_F[2], \
-                          RH, AH, status))
-    ## Write Table to File
-    logger.debug("  Writing new data file.")
-    ascii.write(SummaryTable, datafile, Writer=ascii.basic.Basic)
-
-
-    ##-------------------------------------------------------------------------
-    ## Log to Carriots
-    ##-------------------------------------------------------------------------
-    logger.info('Sending Data to Carriots')
-    logger.debug('  Creating Device object')
-    Device = Carriots.Client(device_id="kegerator@joshwalawender")
-    logger.debug('  Reading api key')
-    Device.read_api_key_from_file(file=os.path.join(os.path.expanduser('~joshw'), '.carriots_api'))
-    data_dict = {'Temperature': temperature, \
-                 'Status': status
-                 }
-    logger.debug('  Data: {}'.format(data_dict))
-    Device.upload(data_dict)
-
+            RH = float('nan')
+            AH = float('nan')
+
+        for sensor in engine.sensors:
+            if sensor.name != 'DHT22' and sensor.name in snapshot.values:
+                temp = snapshot.get(sensor.name, 'temperature_F')
+                logger.debug('DS18B20 {} Temperature = {:.3f} F'.format(sensor.name, temp))
+                temperatures_F.append(temp)
+
+        ## Fall back to the last known temperatures (up to 5 minutes old)
+        if len(temperatures_F) < 2:
+            cached = cycle.last('temperatures_F', max_age=300.)
+            if cached:
+                logger.warning('Using the temperatures read {:.0f} s ago'.format(\
+                               time.time() - cycle.state['last']['temperatures_F'][0]))
+                temperatures_F = cached
+        else:
+            cycle.remember('temperatures_F', list(temperatures_F))
+
+
+        ##-------------------------------------------------------------------------
+        ## Record Values to Table
+        ##-------------------------------------------------------------------------
+        datafile = os.path.join(logdir, '{}.txt'.format(DateString))
+        logger.debug("Preparing astropy table object for data file {}".format(datafile))
+        def read_table():
+            if not os.path.exists(datafile):
+                logger.info("Making new astropy table object")
+                return table.Table(names=table_names, dtype=table_dtype)
+            logger.debug("Reading astropy table object from file: {0}".format(datafile))
+            return read_datafile(datafile)
+        SummaryTable = cycle.run('table', read_table, 10.)
+
+
+        ##-------------------------------------------------------------------------
+        ## Turn Kegerator Relay On or Off Based on Temperature
+        ##-------------------------------------------------------------------------
+        import EventLog
+        events = cycle.run('events', EventLog.EventLog, 2.,\
+                           args=(os.path.join(logdir, 'relay_events.txt'),))
+        def control():
+            temperatures_F.sort()
+            ambient_temperature = temperatures_F.pop()
+            assert ambient_temperature > max(temperatures_F)
+            logger.info('Ambient Temperature = {:.1f}'.format(ambient_temperature))
+            for temp in temperatures_F:
+                logger.info('Kegerator Temperatures = {:.1f} F'.format(temp))
+            temperature = median(temperatures_F)
+            logger.info('Median Temperature = {:.1f} F'.format(temperature))
+            if temperature > temp_high:
+                status = 'On'
+                logger.info('Temperature {:.1f} is greater than {:.1f}.  Turning freezer {}.'.format(temperature, temp_high, status))
+                GPIO.output(23, True)
+            elif temperature < temp_low:
+                status = 'Off'
+                logger.info('Temperature {:.1f} is less than {:.1f}.  Turning freezer {}.'.format(temperature, temp_low, status))
+                GPIO.output(23, False)
+            else:
+                if events and events.current():
+                    status = events.current()
+                elif SummaryTable is not None and len(SummaryTable) > 0:
+                    status = SummaryTable['status'][-1]
+                else:
+                    status = cycle.last('status') or 'unknown'
+                logger.info('Temperature if {:.1f}.  Taking no action.  Status is {}'.format(temperature, status))
+            return ambient_temperature, temperature, status
+        ambient_temperature, temperature, status = cycle.run('control', control, 5., critical=True,\
+                                                             fallback=(float('nan'), float('nan'), 'Off'))
+        status = status if isinstance(status, str) else status.decode()
+        cycle.remember('status', status)
+
+
+        ##-------------------------------------------------------------------------
+        ## Add row to data table
+        ##-------------------------------------------------------------------------
+        while len(temperatures_F) < 4:
+            temperatures_F.append(float('nan'))
+        record = {'timestamp': timestamp,
+                  'AmbTemp': ambient_temperature,
+                  'KegTemp': temperature,
+                  'KegTemp1': temperatures_F[0],
+                  'KegTemp2': temperatures_F[1],
+                  'KegTemp3': temperatures_F[2],
+                  'RH': RH, 'AH': AH,
+                  'status': status}
+        def write_record():
+            try:
+                if events and events.record(timestamp, status):
+                    logger.info('Relay changed to {}'.format(status))
+            except (IOError, OSError, ValueError) as e:
+                logger.warning('  Could not record relay event: {}'.format(e))
+            if SummaryTable is not None:
+                logger.debug("Writing new row to data table.")
+                SummaryTable.add_row((timestamp, ambient_temperature, temperature, \
+                                      temperatures_F[0], temperatures_F[1], temperatures_F[2], \
+                                      RH, AH, status))
+                ## Write Table to File.  The whole day is rewritten, so write a new
+                ## file and rename it into place: if this stage overruns and the
+                ## process exits mid write, the day file is left intact.
+                logger.debug("  Writing new data file.")
+                ascii.write(SummaryTable, datafile+'.tmp', Writer=ascii.basic.Basic)
+                os.rename(datafile+'.tmp', datafile)
+            else:
+                logger.error("  Data file could not be read, not writing it")
+            ## Write to SQLite Store
+            if args.db:
+                import SensorStore
+                logger.debug("  Writing to {}".format(args.db))
+                store = SensorStore.Store(args.db)
+                store.write('kegerator', record)
+                store.close()
+            ## Latest values for local readers (dashboards, read_temp --latest)
+            import LatestBoard
+            try:
+                board = LatestBoard.Board()
+                board.publish_snapshot(snapshot)
+                board.publish('kegerator', dict([(key, value) for key, value in record.items()\
+                                                 if key != 'timestamp']), timestamp)
+                board.close()
+            except (IOError, OSError) as e:
+                logger.warning('  Could not publish latest values: {}'.format(e))
+        cycle.run('record', write_record, 10.)
+
+        ##-------------------------------------------------------------------------
+        ## Evaluate Alarm Rules
+        ##-------------------------------------------------------------------------
+        def evaluate_rules():
+            import Rules
+            try:
+                rules = Rules.RuleEngine(Rules.KegeratorRules,\
+                                         sink=Rules.AlertSink(os.path.join(logdir, 'alerts.jsonl')),\
+                                         state_file=os.path.join(logdir, 'rules_state.json'),\
+                                         logger=logger)
+                rules.update('kegerator', record)
+                rules.save()
+            except (IOError, OSError) as e:
+                logger.warning('  Could not evaluate rules: {}'.format(e))
+        cycle.run('rules', evaluate_rules, 5.)
+
+        ## Queue a plot for the render service (never render here)
+        if args.spool:
+            def queue_plot():
+                import PlotRenderer
+                try:
+                    PlotRenderer.submit('kegerator', DateString, version=timestamp, db=args.db, spool=args.spool)
+                except (IOError, OSError) as e:
+                    logger.warning('  Could not queue plot: {}'.format(e))
+            cycle.run('plot', queue_plot, 5.)
+
+        ##-------------------------------------------------------------------------
+        ## Log to Carriots
+        ##-------------------------------------------------------------------------
+        logger.info('Queueing Data for Carriots')
+        def queue_upload():
+            import Uploader
+            data_dict = {'Temperature': temperature, \
+                         'Status': record['status']
+                         }
+            logger.debug('  Data: {}'.format(data_dict))
+            try:
+                Uploader.submit("kegerator@joshwalawender", data_dict, at=snapshot.timestamp)
+            except (IOError, OSError) as e:
+                logger.warning('  Could not queue upload: {}'.format(e))
+        cycle.run('upload', queue_upload, 5.)
+    except BaseException:
+        ## Whatever went wrong, leave the relay off and the watchdog idle, so
+        ## the next cron run starts from a safe state
+        cycle.safe()
+        watchdog.close()
+        raise
+    cycle.finish()
     logger.info('Done')
 
 
 
+
 ##-------------------------------------------------------------------------
 ## PLOT
 ##-------------------------------------------------------------------------
 def plot(args):
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
     import matplotlib.pyplot as pyplot
+    import Archive
 
     ##-------------------------------------------------------------------------
     ## Set date to tonight if not specified
@@ -200,27 +342,13 @@ def plot(args):
     LogFile = os.path.join('/', 'var', 'log', 'Kegerator', 'PlotLog_'+args.date+".txt")
     PlotFile = os.path.join('/', 'var', 'log', 'Kegerator', args.date+".png")
     DataFile = os.path.join('/', 'var', 'log', 'Kegerator', args.date+".txt")
+    EventFile = os.path.join('/', 'var', 'log', 'Kegerator', 'relay_events.txt')
 
 
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if args.verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-    LogFileHandler = logging.FileHandler(LogFile)
-    LogFileHandler.setLevel(logging.DEBUG)
-    LogFileHandler.setFormatter(LogFormat)
-    logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('KegeratorPlot', verbose=args.verbose, logfile=LogFile)
 
     logger.info("Kegerator.py invoked with --plot option")
     logger.info("  Making plot for day of {}".format(args.date))
@@ -229,25 +357,25 @@ def plot(args):
     ##-------------------------------------------------------------------------
     ## Read Data
     ##-------------------------------------------------------------------------
-    if os.path.exists(DataFile):
+    data = None
+    if args.db:
+        import SensorStore
+        start, end = SensorStore.day_range(args.date)
+        store = SensorStore.Store(args.db)
+        columns = store.read_range('kegerator', start, end)
+        store.close()
+        logger.info("  Read {} rows from {}".format(len(columns['timestamp']), args.db))
+        data = dict([(name, np.array(values)) for name, values in columns.items()])
+        data['status'] = [str(val) for val in data['status']] if 'status' in data else []
+        time_decimal = list((data['timestamp'] - start) / 3600e6)
+    elif Archive.exists(DataFile):
         logger.info("  Found data file: {}".format(DataFile))
-        data = ascii.read(DataFile, guess=False,
-                          header_start=0, data_start=1,
-                          Reader=ascii.basic.Basic,
-                          converters={
-                          'date': [ascii.convert_numpy('S10')],
-                          'time': [ascii.convert_numpy('S12')],
-                          'AmbTemp': [ascii.convert_numpy('f4')],
-                          'KegTemp': [ascii.convert_numpy('f4')],
-                          'KegTemp1': [ascii.convert_numpy('f4')],
-                          'KegTemp2': [ascii.convert_numpy('f4')],
-                          'KegTemp3': [ascii.convert_numpy('f4')],
-                          'RH': [ascii.convert_numpy('f4')],
-                          'AH': [ascii.convert_numpy('f4')],
-                          'status': [ascii.convert_numpy('S11')],
-                          })
-        datetime_objects = [datetime.datetime.strptime(x['time'], '%H:%M:%S HST') for x in data]
-        time_decimal = [(x.hour + x.minute/60. + x.second/3600.) for x in datetime_objects]
+        import SensorStore
+        start, end = SensorStore.day_range(args.date)
+        data = read_datafile(DataFile)
+        time_decimal = list((np.array(data['timestamp']) - start) / 3600e6)
+
+    if data is not None and len(time_decimal) > 0:
         DecimalTime = max(time_decimal)
 
     ##-------------------------------------------------------------------------
@@ -262,7 +390,7 @@ def plot(args):
                    [0.05, 0.25, 0.65, 0.24], [0.73, 0.25, 0.21, 0.24],\
                    [0.05, 0.05, 0.65, 0.18], [0.73, 0.05, 0.21, 0.18],\
                   ]
-        if len(data) > 1:
+        if len(time_decimal) > 1:
             logger.info("  Generating plot {} ... ".format(PlotFile))
             dpi = 100
             pyplot.figure(figsize=(14,8), dpi=dpi)
@@ -306,12 +434,22 @@ def plot(args):
             RecentTemperatureAxes.axhline(temp_low, color='blue', lw=4)
             RecentTemperatureAxes.axhline(temp_high, color='blue', lw=4)
 
-            ## Plot Relay State
+            ## Plot Relay State, from the transitions if they have been logged
             translator = {'On': 1, 'Off': 0, 'unknown': -0.25}
-            relay_state = [translator[val] for val in data['status']]
+            if os.path.exists(EventFile):
+                import EventLog
+                events = EventLog.EventLog(EventFile)
+                relay_times, relay_states = events.steps(start, start + int(DecimalTime*3600e6))
+                relay_time = [(val - start)/3600e6 for val in relay_times]
+                relay_state = [translator.get(val, -0.25) for val in relay_states]
+                relay_style = {'drawstyle': 'steps-post'}
+            else:
+                relay_time = time_decimal
+                relay_state = [translator[val] for val in data['status']]
+                relay_style = {'marker': 'o', 'markersize': 3, 'markeredgewidth': 0}
             logger.debug("  Rendering Relay Status Plot.")
             RelayAxes = pyplot.axes(plotpos[2], yticklabels=[])
-            pyplot.plot(time_decimal, relay_state, 'ko-', markersize=3, markeredgewidth=0)
+            pyplot.plot(relay_time, relay_state, 'k-', **relay_style)
             pyplot.plot([DecimalTime, DecimalTime], [-1,2], 'g-', alpha=0.4)
             pyplot.ylabel("Relay")
             pyplot.xlim(0, 24)
@@ -324,7 +462,7 @@ def plot(args):
             ## Plot Relay State for Last Hour
             logger.debug("  Rendering Recent Relay State Plot.")
             RecentRelayAxes = pyplot.axes(plotpos[3], yticklabels=[])
-            pyplot.plot(time_decimal, relay_state, 'ko-', markersize=3, markeredgewidth=0)
+            pyplot.plot(relay_time, relay_state, 'k-', **relay_style)
             pyplot.plot([DecimalTime, DecimalTime], [-1,2], 'g-', alpha=0.4)
             pyplot.xticks(np.arange(0,24,0.25))
             if DecimalTime > 1.0:
@@ -391,7 +529,7 @@ def plot(args):
             pyplot.savefig(PlotFile, dpi=dpi, bbox_inches='tight', pad_inches=0.05)
             logger.info("  done.")
     else:
-        logger.info("Could not find data file: {}".format(DataFile))
+        logger.info("Could not find data for {}".format(args.date))
 
     ##-------------------------------------------------------------------------
     ## Create Daily Symlink if Not Already
@@ -407,7 +545,7 @@ def plot(args):
 
 
 
-if __name__ == '__main__':
+def cli():
     ##-------------------------------------------------------------------------
     ## Parse Command Line Arguments
     ##-------------------------------------------------------------------------
@@ -419,12 +557,27 @@ if __name__ == '__main__':
     parser.add_argument("-p", "--plot",
         action="store_true", dest="plot",
         default=False, help="Make plot.")
+    parser.add_argument("-r", "--relay",
+        dest="relay", choices=['on', 'off'],
+        help="Only switch the relay on or off.")
     parser.add_argument("-d", "--date",
         dest="date", required=False, default="", type=str,
         help="Date to analyze. (i.e. '20130805')")
+    parser.add_argument("--db",
+        dest="db", required=False, default=None, type=str,
+        help="Also write to (or plot from) this SQLite store.")
+    parser.add_argument("--spool",
+        dest="spool", required=False, default=None, type=str,
+        help="Queue a plot job in this PlotRenderer spool directory after measuring.")
     args = parser.parse_args()
 
-    if not args.plot:
+    if args.relay:
+        relay(args.relay == 'on')
+    elif not args.plot:
         main(args)
     else:
         plot(args)
+
+
+if __name__ == '__main__':
+    cli()
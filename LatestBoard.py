@@ -0,0 +1,281 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import mmap
+import struct
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+DefaultPath = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),\
+                           'RasPiLatest')
+
+## Layout: a header, then fixed size slots, one per sensor.  Each slot is
+##   sequence (u32), channel count (u16), pad (u16), timestamp (i64 us),
+##   sensor name (32 bytes), then MaxChannels channel entries of
+##   name (15 bytes), kind (1 byte, 'd' or 's') and value (8 bytes: a double
+##   or up to 8 bytes of text).
+Magic = b'RPLB'
+Header = struct.Struct('<4sII')
+SlotHeader = struct.Struct('<IHHq32s')
+Channel = struct.Struct('<15sc8s')
+Double = struct.Struct('<d')
+MaxChannels = 8
+SlotSize = SlotHeader.size + MaxChannels*Channel.size
+
+_yield = getattr(os, 'sched_yield', lambda: time.sleep(0))
+
+
+##-------------------------------------------------------------------------
+## Define Board Class
+##-------------------------------------------------------------------------
+class Board(object):
+    '''Latest values of every sensor in a fixed layout, memory mapped file.
+
+    Acquisition processes publish() the values they read; any number of
+    local processes read() them without touching the hardware or parsing a
+    log file.  Each slot is guarded by a seqlock: the writer makes the
+    sequence number odd, writes, then makes it even again.  A reader copies
+    the slot and retries if the sequence was odd or changed while it copied,
+    so it never sees a half written slot and never blocks the writer.
+
+    Several processes may publish the same sensor (the monitors and read_temp
+    all publish the DHT22), so publish() holds a lock on the file while it
+    writes, and allocating a slot to a new sensor name takes the same lock.
+    Writers therefore never interleave on a slot's sequence number.  Text
+    values (such as a relay status) are kept to 8 bytes.
+
+    The file is created readable by everyone, so monitors running as other
+    users can read it.  A board opened readonly maps the file read only and
+    needs no write permission; it cannot publish().
+    '''
+    def __init__(self, path=DefaultPath, slots=32, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if readonly:
+            self.fd = os.open(path, os.O_RDONLY)
+            self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size, access=mmap.ACCESS_READ)
+            magic, slot_size, slots = Header.unpack_from(self.map, 0)
+            assert magic == Magic and slot_size == SlotSize,\
+                   '{} is not a compatible board'.format(path)
+            self.slots = slots
+            self.index = {}
+            return
+        exists = os.path.exists(path)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = Header.size + slots*SlotSize
+        if not exists or os.fstat(self.fd).st_size < Header.size:
+            ## Set the mode explicitly, as the umask may have masked it
+            os.fchmod(self.fd, 0o644)
+            os.ftruncate(self.fd, size)
+            self.map = mmap.mmap(self.fd, size)
+            Header.pack_into(self.map, 0, Magic, SlotSize, slots)
+        else:
+            self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+            magic, slot_size, slots = Header.unpack_from(self.map, 0)
+            assert magic == Magic and slot_size == SlotSize,\
+                   '{} is not a compatible board'.format(path)
+        self.slots = slots
+        self.index = {}
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def offset(self, slot):
+        return Header.size + slot*SlotSize
+
+    def find(self, name, allocate=False):
+        '''Return the slot number for a sensor name, or None.
+        '''
+        if name in self.index:
+            return self.index[name]
+        encoded = name.encode('utf-8')[:32]
+        assert not (allocate and self.readonly), 'Board {} is open read only'.format(self.path)
+        if allocate and fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            free = None
+            for slot in range(self.slots):
+                slot_name = SlotHeader.unpack_from(self.map, self.offset(slot))[4].rstrip(b'\0')
+                if slot_name == encoded:
+                    self.index[name] = slot
+                    return slot
+                if not slot_name and free is None:
+                    free = slot
+            if not allocate:
+                return None
+            assert free is not None, 'Board {} is full'.format(self.path)
+            SlotHeader.pack_into(self.map, self.offset(free), 0, 0, 0, 0, encoded)
+            self.index[name] = free
+            return free
+        finally:
+            if allocate and fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def publish(self, name, values, timestamp=None):
+        '''Write the latest values (a dict of channel name to number or short
+        text) of a sensor.  timestamp is integer microseconds since the epoch.
+        '''
+        slot = self.find(name, allocate=True)
+        offset = self.offset(slot)
+        timestamp = timestamp if timestamp is not None else int(time.time() * 1e6)
+        entries = []
+        for channel, value in sorted(values.items())[:MaxChannels]:
+            if isinstance(value, bytes):
+                entries.append((channel, b's', value[:8]))
+            elif isinstance(value, str):
+                entries.append((channel, b's', value.encode('utf-8')[:8]))
+            elif value is not None:
+                entries.append((channel, b'd', Double.pack(float(value))))
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            ## An odd sequence number marks a write in progress
+            sequence = ((struct.unpack_from('<I', self.map, offset)[0] + 1) & 0xffffffff) | 1
+            struct.pack_into('<I', self.map, offset, sequence)
+            for i, (channel, kind, value) in enumerate(entries):
+                Channel.pack_into(self.map, offset + SlotHeader.size + i*Channel.size,\
+                                  channel.encode('utf-8')[:15], kind, value)
+            SlotHeader.pack_into(self.map, offset, sequence, len(entries), 0,\
+                                 timestamp, name.encode('utf-8')[:32])
+            struct.pack_into('<I', self.map, offset, (sequence + 1) & 0xffffffff)
+        finally:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def publish_snapshot(self, snapshot):
+        '''Publish every sensor of a Sampler.Snapshot.
+        '''
+        for name, values in snapshot.values.items():
+            read_time = snapshot.times.get(name, snapshot.timestamp)
+            self.publish(name, values, int(read_time * 1e6))
+
+    def read_slot(self, slot, retries=1000):
+        offset = self.offset(slot)
+        for attempt in range(retries):
+            before = struct.unpack_from('<I', self.map, offset)[0]
+            if not before % 2:
+                data = self.map[offset:offset+SlotSize]
+                after = struct.unpack_from('<I', self.map, offset)[0]
+                if before == after:
+                    break
+            ## The writer may be descheduled mid write (always so on a single
+            ## core), so let it run rather than spinning
+            if attempt >= 10:
+                _yield()
+        else:
+            return None
+        sequence, count, pad, timestamp, name = SlotHeader.unpack_from(data, 0)
+        values = {}
+        for i in range(count):
+            channel, kind, value = Channel.unpack_from(data, SlotHeader.size + i*Channel.size)
+            channel = channel.rstrip(b'\0').decode('utf-8')
+            if kind == b'd':
+                values[channel] = Double.unpack(value)[0]
+            else:
+                values[channel] = value.rstrip(b'\0').decode('utf-8')
+        return name.rstrip(b'\0').decode('utf-8'), values, timestamp
+
+    def read(self, name):
+        '''Return (values, timestamp in microseconds) for a sensor, or
+        (None, None) if it has not been published.
+        '''
+        slot = self.find(name)
+        if slot is None:
+            return None, None
+        result = self.read_slot(slot)
+        if result is None or result[2] == 0:
+            return None, None
+        return result[1], result[2]
+
+    def read_all(self):
+        '''Return {sensor name: (values, timestamp)} for every sensor.
+        '''
+        board = {}
+        for slot in range(self.slots):
+            result = self.read_slot(slot)
+            if result and result[0] and result[2]:
+                board[result[0]] = (result[1], result[2])
+        return board
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Print the latest values on the board, or benchmark it.")
+    ## add flags
+    parser.add_argument("--benchmark",
+        action="store_true", dest="benchmark",
+        default=False, help="Time reads while another process publishes.")
+    ## add arguments
+    parser.add_argument("--path",
+        type=str, dest="path", default=DefaultPath,
+        help="Board file (default = {})".format(DefaultPath))
+    parser.add_argument("--reads",
+        type=int, dest="reads", default=20000,
+        help="Reads timed by the benchmark (default = 20000)")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        board = Board(args.path, readonly=True)
+        now = time.time()
+        for name, (values, timestamp) in sorted(board.read_all().items()):
+            print('{:>20s} ({:6.1f} s old): {}'.format(name, now - timestamp/1e6,\
+                  ', '.join(['{} = {}'.format(key, values[key]) for key in sorted(values)])))
+        return
+
+    import multiprocessing
+    path = args.path + '.benchmark'
+    if os.path.exists(path):
+        os.remove(path)
+    board = Board(path)
+    board.publish('probe', {'temperature_C': 0., 'temperature_F': 32.})
+
+    def writer(stop):
+        writer_board = Board(path)
+        i = 0
+        while not stop.is_set():
+            i += 1
+            writer_board.publish('probe', {'temperature_C': float(i), 'temperature_F': i*9./5.+32.})
+
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=writer, args=(stop,))
+    process.daemon = True
+    process.start()
+    torn = failed = 0
+    try:
+        start = time.time()
+        for i in range(args.reads):
+            values, timestamp = board.read('probe')
+            if values is None:
+                failed += 1
+            elif abs(values['temperature_F'] - (values['temperature_C']*9./5.+32.)) > 1e-9:
+                torn += 1
+        elapsed = time.time() - start
+    finally:
+        stop.set()
+        process.join()
+        board.close()
+        os.remove(path)
+    print('{} reads during continuous publishing: {:.1f} us per read, {} inconsistent, {} gave up'.format(\
+          args.reads, elapsed/args.reads*1e6, torn, failed))
+
+
+if __name__ == '__main__':
+    main()
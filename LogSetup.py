@@ -0,0 +1,148 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import time
+import atexit
+import logging
+import logging.handlers
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
+
+## Listeners for the loggers configured so far, keyed by logger name
+_listeners = {}
+_lock = threading.Lock()
+
+
+##-------------------------------------------------------------------------
+## Daily File Handler
+##-------------------------------------------------------------------------
+class DailyFileHandler(logging.FileHandler):
+    '''Write to a file whose name is a strftime pattern of the local date,
+    e.g. /var/log/Kegerator/Log_%Y%m%d.txt.  When the date changes the current
+    file is closed and the next record opens the new day's file, so a long
+    running process writes the same daily files the cron jobs always have.
+    '''
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.current = time.strftime(pattern, time.localtime())
+        directory = os.path.dirname(self.current)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        logging.FileHandler.__init__(self, self.current, delay=True)
+
+    def emit(self, record):
+        filename = time.strftime(self.pattern, time.localtime(record.created))
+        if filename != self.current:
+            self.close()
+            self.current = filename
+            self.baseFilename = os.path.abspath(filename)
+        logging.FileHandler.emit(self, record)
+
+
+##-------------------------------------------------------------------------
+## DEBUG Rate Limiter
+##-------------------------------------------------------------------------
+class RateLimitFilter(logging.Filter):
+    '''Token bucket limit on DEBUG records.
+
+    Up to burst DEBUG records pass at once, refilling at rate per second.
+    Records above DEBUG always pass.  The number of dropped records is added
+    to the next DEBUG record that gets through.
+    '''
+    def __init__(self, rate=20., burst=100):
+        logging.Filter.__init__(self)
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.time()
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.suppressed += 1
+            return False
+        self.tokens -= 1
+        if self.suppressed:
+            record.msg = '{} ({} DEBUG messages suppressed)'.format(record.getMessage(), self.suppressed)
+            record.args = None
+            self.suppressed = 0
+        return True
+
+
+##-------------------------------------------------------------------------
+## Logger Setup
+##-------------------------------------------------------------------------
+def file_handler(logfile):
+    LogFileHandler = DailyFileHandler(logfile)
+    LogFileHandler.setLevel(logging.DEBUG)
+    LogFileHandler.setFormatter(LogFormat)
+    return LogFileHandler
+
+
+def get_logger(name='MyLogger', verbose=False, logfile=None,\
+               debug_rate=20., debug_burst=100):
+    '''Return a logger writing to the console and optionally to a daily file.
+
+    Handlers are attached only the first time a name is seen, so calling this
+    again (e.g. once per cycle in a long running process) never stacks
+    handlers.  Later calls only update the console level, and switch to a
+    new daily file if given a different logfile.
+
+    The logger itself only puts records on a queue.  Formatting and all
+    console and file I/O happen in a background QueueListener thread, which is
+    flushed when the process exits.  DEBUG records are rate limited.
+
+    logfile is a strftime pattern for the daily file, e.g.
+    os.path.join('/', 'var', 'log', 'Kegerator', 'Log_%Y%m%d.txt').
+    '''
+    logger = logging.getLogger(name)
+    console_level = logging.DEBUG if verbose else logging.INFO
+    with _lock:
+        if name in _listeners:
+            listener = _listeners[name]
+            listener.handlers[0].setLevel(console_level)
+            files = listener.handlers[1:]
+            if logfile and (not files or files[0].pattern != logfile):
+                ## Let the listener write out what it has queued first
+                listener.stop()
+                for handler in files:
+                    handler.close()
+                listener.handlers = (listener.handlers[0], file_handler(logfile))
+                listener.start()
+            return logger
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        ## Set up console output
+        LogConsoleHandler = logging.StreamHandler()
+        LogConsoleHandler.setLevel(console_level)
+        LogConsoleHandler.setFormatter(LogFormat)
+        handlers = [LogConsoleHandler]
+        ## Set up file output
+        if logfile:
+            handlers.append(file_handler(logfile))
+        ## Hand records to a background writer
+        records = queue.Queue(-1)
+        LogQueueHandler = logging.handlers.QueueHandler(records)
+        LogQueueHandler.addFilter(RateLimitFilter(rate=debug_rate, burst=debug_burst))
+        logger.addHandler(LogQueueHandler)
+        listener = logging.handlers.QueueListener(records, *handlers,\
+                                                  respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        _listeners[name] = listener
+    return logger
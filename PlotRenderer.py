@@ -0,0 +1,254 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import glob
+import time
+import multiprocessing
+
+import LogSetup
+
+
+SpoolDirectory = os.path.join('/', 'var', 'spool', 'RasPiPlots')
+
+
+##-------------------------------------------------------------------------
+## Submit a Plot Job
+##-------------------------------------------------------------------------
+def submit(kind, date, version=None, db=None, verbose=False, spool=SpoolDirectory):
+    '''Queue a plot of kind ('kegerator' or 'humidity') for date
+    ('YYYYMMDD').  This only writes a small file to the spool directory, so it
+    is safe to call from a control cycle.
+
+    version is the timestamp (integer microseconds) of the newest data the
+    plot should include.  There is one job file per plot, so submitting again
+    before the renderer gets to it replaces the pending job rather than adding
+    another.
+    '''
+    if not os.path.exists(spool):
+        os.makedirs(spool)
+    job = {'kind': kind, 'date': date, 'db': db, 'verbose': verbose,\
+           'version': version if version is not None else int(time.time() * 1e6)}
+    filename = os.path.join(spool, '{}_{}.json'.format(kind, date))
+    with open(filename+'.tmp', 'w') as FO:
+        json.dump(job, FO)
+    os.rename(filename+'.tmp', filename)
+    return filename
+
+
+##-------------------------------------------------------------------------
+## Render (runs in the render processes)
+##-------------------------------------------------------------------------
+def lower_priority():
+    '''Run the calling process at idle priority, so that it only gets the CPU
+    when nothing else (in particular the measurement and control processes)
+    wants it.
+    '''
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        pass
+    os.nice(19)
+
+
+def render(job):
+    '''Make the plot described by a job.  Returns the job, so the renderer
+    knows which version finished.
+    '''
+    if job['kind'] == 'kegerator':
+        import Kegerator
+        Kegerator.plot(argparse.Namespace(verbose=job['verbose'], date=job['date'], db=job['db']))
+    elif job['kind'] == 'humidity':
+        import HumidityMonitor
+        HumidityMonitor.plot(verbose=job['verbose'], db=job['db'], date=job['date'])
+    else:
+        raise ValueError('Unknown plot kind: {}'.format(job['kind']))
+    return job
+
+
+def render_process(job):
+    '''Body of each render process.
+    '''
+    lower_priority()
+    render(job)
+
+
+##-------------------------------------------------------------------------
+## Define Renderer Class
+##-------------------------------------------------------------------------
+class Renderer(object):
+    '''Take plot jobs from the spool directory and render each in its own
+    idle priority process, up to workers at once.
+
+    Jobs for the same plot are coalesced: only one render per plot is in
+    flight, and while it runs further submissions just replace the single
+    pending job file.  A job whose version is not newer than the last render
+    of that plot is stale and is dropped without rendering.  A render still
+    running after timeout seconds is killed, so it can not hold up the
+    renders behind it.
+    '''
+    def __init__(self, spool=SpoolDirectory, workers=1, poll=1., timeout=600., logger=None):
+        self.spool = spool
+        self.workers = workers
+        self.poll = poll
+        self.timeout = timeout
+        self.logger = logger
+        if not os.path.exists(spool):
+            os.makedirs(spool)
+        ## Render process, job and start time of each plot being rendered
+        self.in_flight = {}
+        self.rendered = {}
+        self.counts = {'rendered': 0, 'stale': 0, 'failed': 0, 'timed_out': 0}
+
+    def pending(self):
+        '''Read the queued jobs, oldest data first.
+        '''
+        jobs = []
+        for filename in glob.glob(os.path.join(self.spool, '*.json')):
+            try:
+                with open(filename, 'r') as FO:
+                    job = json.load(FO)
+            except (IOError, OSError, ValueError):
+                continue
+            job['file'] = filename
+            jobs.append(job)
+        return sorted(jobs, key=lambda job: job['version'])
+
+    def finished(self, job, start):
+        key = os.path.basename(job['file'])
+        self.rendered[key] = max(self.rendered.get(key, 0), job['version'])
+        self.counts['rendered'] += 1
+        if self.logger:
+            self.logger.info('Rendered {} in {:.1f} s'.format(key, time.time()-start))
+
+    def failed(self, job, start, error):
+        key = os.path.basename(job['file'])
+        self.counts['failed'] += 1
+        if self.logger:
+            self.logger.error('Render of {} failed: {}'.format(key, error))
+
+    def reap(self):
+        '''Collect the renders which have ended and kill those running for
+        longer than timeout.
+        '''
+        now = time.time()
+        for key, (process, job, start) in list(self.in_flight.items()):
+            if process.is_alive():
+                if now - start <= self.timeout:
+                    continue
+                process.terminate()
+                process.join()
+                del self.in_flight[key]
+                self.counts['timed_out'] += 1
+                if self.logger:
+                    self.logger.error('Killed render of {} after {:.0f} s'.format(key, now - start))
+                continue
+            process.join()
+            del self.in_flight[key]
+            if process.exitcode == 0:
+                self.finished(job, start)
+            else:
+                self.failed(job, start, 'exit code {}'.format(process.exitcode))
+
+    def dispatch(self):
+        '''Start a render for each pending job, unless a render of the same
+        plot is already running or all the workers are busy.  Returns the
+        number of renders started.
+        '''
+        self.reap()
+        dispatched = 0
+        for job in self.pending():
+            if len(self.in_flight) >= self.workers:
+                break
+            key = os.path.basename(job['file'])
+            if key in self.in_flight:
+                continue
+            try:
+                os.remove(job['file'])
+            except OSError:
+                continue
+            if job['version'] <= self.rendered.get(key, -1):
+                self.counts['stale'] += 1
+                if self.logger:
+                    self.logger.debug('Dropping stale job {}'.format(key))
+                continue
+            if self.logger:
+                self.logger.debug('Rendering {}'.format(key))
+            process = multiprocessing.Process(target=render_process, args=(job,),\
+                                              name='render {}'.format(key))
+            process.daemon = True
+            process.start()
+            self.in_flight[key] = (process, job, time.time())
+            dispatched += 1
+        return dispatched
+
+    def run(self, duration=None):
+        start = time.time()
+        try:
+            while duration is None or time.time() - start < duration:
+                self.dispatch()
+                time.sleep(self.poll)
+        finally:
+            ## Let the running renders finish, within their timeout
+            for process, job, started in list(self.in_flight.values()):
+                process.join(max(started + self.timeout - time.time(), 0))
+            self.reap()
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Render queued plots in low priority worker processes.")
+    ## add arguments
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--spool",
+        type=str, dest="spool", default=SpoolDirectory,
+        help="Spool directory of plot jobs (default = {})".format(SpoolDirectory))
+    parser.add_argument("--workers",
+        type=int, dest="workers", default=1,
+        help="Number of render processes (default = 1)")
+    parser.add_argument("--poll",
+        type=float, dest="poll", default=1.,
+        help="Seconds between checks of the spool directory (default = 1)")
+    parser.add_argument("--timeout",
+        type=float, dest="timeout", default=600.,
+        help="Seconds before a render is killed (default = 600)")
+    parser.add_argument("--duration",
+        type=float, dest="duration", default=None,
+        help="Stop after this many seconds (default = run forever)")
+    args = parser.parse_args()
+
+    logger = LogSetup.get_logger('PlotRenderer', verbose=args.verbose)
+    lower_priority()
+    ## Import matplotlib once here, so each forked render process has it
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot
+    except ImportError:
+        pass
+    renderer = Renderer(spool=args.spool, workers=args.workers, poll=args.poll,\
+                        timeout=args.timeout, logger=logger)
+    logger.info('Rendering jobs from {} with {} worker(s)'.format(args.spool, args.workers))
+    try:
+        renderer.run(duration=args.duration)
+    except KeyboardInterrupt:
+        pass
+    logger.info('Rendered {rendered}, dropped {stale} stale, {failed} failed, '\
+                '{timed_out} timed out'.format(**renderer.counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import math
+import fnmatch
+import collections
+import time
+
+
+##-------------------------------------------------------------------------
+## Default Rules
+##-------------------------------------------------------------------------
+## Each rule is a dict:
+##   name        unique name of the rule
+##   channel     'stream.column', may be a glob ('kegerator.KegTemp*'); each
+##               matching channel is tracked separately
+##   stat        'value', 'mean' or 'slope' (per hour) over the last window
+##               samples, or 'ewma' with time constant tau seconds
+##   above/below alert when the statistic is above and/or below these
+##   hysteresis  the statistic must come back this far to clear the alert
+##   when        optional condition on the latest value of another channel,
+##               {'channel': ..., 'equals'/'above'/'below': ...}
+##   gated       only samples taken while the when condition holds go into the
+##               statistic, which starts again each time the condition begins
+##               to hold (default False)
+##   debounce    consecutive samples the condition must hold (default 1)
+##   holdoff     seconds after an alert before the rule may alert again
+##   severity    'warning' (default) or 'critical'
+HumidityRules = [
+    ## Was: mean of the last 6 statuses above HUMID/2 while not OK, at most
+    ## once per 23 samples
+    {'name': 'humid', 'channel': 'humidity.humidity', 'stat': 'mean', 'window': 6,
+     'above': 55., 'when': {'channel': 'humidity.humidity', 'above': 55.},
+     'holdoff': 2*3600, 'severity': 'warning'},
+]
+
+KegeratorRules = [
+    {'name': 'keg_temperature', 'channel': 'kegerator.KegTemp*', 'stat': 'value',
+     'above': 45., 'below': 32., 'hysteresis': 1., 'debounce': 2,
+     'holdoff': 3600, 'severity': 'critical'},
+    ## Relay on but the keg is not cooling
+    {'name': 'relay_stuck', 'channel': 'kegerator.KegTemp', 'stat': 'slope', 'window': 6,
+     'above': 0., 'when': {'channel': 'kegerator.status', 'equals': 'On'}, 'gated': True,
+     'debounce': 3, 'holdoff': 3600, 'severity': 'critical'},
+]
+
+
+##-------------------------------------------------------------------------
+## Incremental Statistics
+##-------------------------------------------------------------------------
+class Window(object):
+    '''The last size (time, value) samples with running sums, so the mean and
+    the least squares slope are O(1) per sample.  Times are in hours.
+
+    The sums use times relative to an origin, which is moved up to the oldest
+    sample (recomputing the sums) once a day, so they keep their precision.
+    '''
+    def __init__(self, size, samples=None):
+        self.size = size
+        self.samples = collections.deque()
+        self.origin = None
+        self.rebase(None)
+        for t, x in samples or []:
+            self.push(t, x)
+
+    def rebase(self, origin):
+        self.origin = origin
+        self.n = 0
+        self.st = self.sx = self.stt = self.stx = 0.
+        for t, x in self.samples:
+            self.add(t, x, 1)
+
+    def push(self, t, x):
+        if self.origin is None:
+            self.origin = t
+        self.samples.append((t, x))
+        self.add(t, x, 1)
+        if len(self.samples) > self.size:
+            self.add(*self.samples.popleft(), sign=-1)
+        if t - self.origin > 24:
+            self.rebase(self.samples[0][0])
+
+    def add(self, t, x, sign):
+        t -= self.origin
+        self.n += sign
+        self.st += sign*t
+        self.sx += sign*x
+        self.stt += sign*t*t
+        self.stx += sign*t*x
+
+    def mean(self):
+        return self.sx / self.n
+
+    def slope(self):
+        if self.n < 2:
+            return None
+        denominator = self.n*self.stt - self.st*self.st
+        if denominator <= 0:
+            return None
+        return (self.n*self.stx - self.st*self.sx) / denominator
+
+
+class EWMA(object):
+    '''Exponentially weighted moving average with time constant tau
+    (seconds), correct for irregularly spaced samples.
+    '''
+    def __init__(self, tau, value=None, last=None):
+        self.tau = tau
+        self.value = value
+        self.last = last
+
+    def push(self, t, x):
+        if self.value is None:
+            self.value = x
+        else:
+            alpha = 1. - math.exp(-max(0, t - self.last) / self.tau)
+            self.value += alpha * (x - self.value)
+        self.last = t
+        return self.value
+
+
+##-------------------------------------------------------------------------
+## Define Rule Class
+##-------------------------------------------------------------------------
+class Rule(object):
+    '''One declarative rule (see the default rules above), with the state of
+    each channel it applies to.
+    '''
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+        self.channel = spec['channel']
+        self.stat = spec.get('stat', 'value')
+        self.window = spec.get('window', 1)
+        self.tau = spec.get('tau', 600.)
+        self.above = spec.get('above')
+        self.below = spec.get('below')
+        self.hysteresis = spec.get('hysteresis', 0.)
+        self.when = spec.get('when')
+        self.gated = spec.get('gated', False)
+        self.debounce = spec.get('debounce', 1)
+        self.holdoff = spec.get('holdoff', 0.)
+        self.severity = spec.get('severity', 'warning')
+        assert self.stat in ['value', 'mean', 'slope', 'ewma'], 'Unknown stat: {}'.format(self.stat)
+        assert self.above is not None or self.below is not None
+        self.states = {}
+
+    def new_state(self, saved={}):
+        return {'window': Window(self.window, saved.get('window', [])),
+                'ewma': EWMA(self.tau, saved.get('ewma'), saved.get('ewma_last')),
+                'count': saved.get('count', 0),
+                'active': saved.get('active', False),
+                'last_alert': saved.get('last_alert')}
+
+    def condition(self, latest):
+        if not self.when:
+            return True
+        value = latest.get(self.when['channel'])
+        if value is None:
+            return False
+        if 'equals' in self.when:
+            return value == self.when['equals']
+        if 'above' in self.when and not value > self.when['above']:
+            return False
+        if 'below' in self.when and not value < self.when['below']:
+            return False
+        return True
+
+    def evaluate(self, channel, t, value, latest):
+        '''Add a sample (t in seconds) for channel and return an event dict
+        if the rule alerts or clears, otherwise None.
+        '''
+        state = self.states.get(channel)
+        if state is None:
+            state = self.states[channel] = self.new_state()
+        held = self.condition(latest)
+        if self.gated and not held:
+            ## Start the statistic again when the condition next holds
+            state['window'] = Window(self.window)
+            state['ewma'] = EWMA(self.tau)
+            stat = None
+        else:
+            state['window'].push(t / 3600., value)
+            if self.stat == 'value':
+                stat = value
+            elif self.stat == 'mean':
+                stat = state['window'].mean()
+            elif self.stat == 'slope':
+                stat = state['window'].slope()
+            else:
+                stat = state['ewma'].push(t, value)
+            if stat is None:
+                return None
+        ## Hysteresis widens the band once the alert is active
+        margin = self.hysteresis if state['active'] else 0.
+        high = stat is not None and self.above is not None and stat > self.above - margin
+        low = stat is not None and self.below is not None and stat < self.below + margin
+        if (high or low) and held:
+            state['count'] += 1
+        else:
+            state['count'] = 0
+        if not state['active'] and state['count'] >= self.debounce:
+            if state['last_alert'] is not None and t - state['last_alert'] < self.holdoff:
+                return None
+            state['active'] = True
+            state['last_alert'] = t
+            return self.event('alert', channel, t, value, stat)
+        if state['active'] and state['count'] == 0:
+            state['active'] = False
+            return self.event('clear', channel, t, value, stat)
+        return None
+
+    def event(self, kind, channel, t, value, stat):
+        return {'timestamp': int(t * 1e6), 'rule': self.name, 'channel': channel,
+                'event': kind, 'severity': self.severity, 'value': value,
+                self.stat: stat}
+
+    def save(self):
+        return dict([(channel, {'window': list(state['window'].samples),
+                                'ewma': state['ewma'].value,
+                                'ewma_last': state['ewma'].last,
+                                'count': state['count'],
+                                'active': state['active'],
+                                'last_alert': state['last_alert']})
+                     for channel, state in self.states.items()])
+
+    def load(self, saved):
+        self.states = dict([(channel, self.new_state(state)) for channel, state in saved.items()])
+
+
+##-------------------------------------------------------------------------
+## Alert Sink
+##-------------------------------------------------------------------------
+class AlertSink(object):
+    '''Append alert events to a local file, one JSON object per line.
+    '''
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def write(self, event):
+        with open(self.path, 'a') as FO:
+            FO.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+##-------------------------------------------------------------------------
+## Define Rule Engine Class
+##-------------------------------------------------------------------------
+class RuleEngine(object):
+    '''Evaluate rules incrementally as each record arrives.
+
+    update() takes one record of a stream (a dict with an integer microsecond
+    'timestamp', as written to the SensorStore) and evaluates every rule
+    matching each of its channels.  Channel to rule matching is worked out
+    once per channel name.  Each evaluation is O(1), whatever the window.
+
+    Monitors run from cron evaluate one record per process, so the rule
+    state can be saved to and restored from state_file.
+    '''
+    def __init__(self, rules, sink=None, state_file=None, logger=None):
+        self.rules = [Rule(spec) for spec in rules]
+        self.sink = sink
+        self.state_file = state_file
+        self.logger = logger
+        self.matches = {}
+        self.latest = {}
+        if state_file:
+            self.load()
+
+    def rules_for(self, channel):
+        if channel not in self.matches:
+            self.matches[channel] = [rule for rule in self.rules\
+                                     if fnmatch.fnmatchcase(channel, rule.channel)]
+        return self.matches[channel]
+
+    def update(self, stream, record):
+        t = record['timestamp'] / 1e6
+        for name, value in record.items():
+            if name != 'timestamp':
+                self.latest['{}.{}'.format(stream, name)] = value
+        events = []
+        for name, value in record.items():
+            channel = '{}.{}'.format(stream, name)
+            if name == 'timestamp' or isinstance(value, (str, bytes)) or value is None:
+                continue
+            if isinstance(value, float) and math.isnan(value):
+                continue
+            for rule in self.rules_for(channel):
+                event = rule.evaluate(channel, t, value, self.latest)
+                if event:
+                    events.append(event)
+        for event in events:
+            if self.logger:
+                log = self.logger.warning if event['event'] == 'alert' else self.logger.info
+                log('Rule {rule} {event} on {channel} (value {value})'.format(**event))
+            if self.sink:
+                self.sink.write(event)
+        return events
+
+    def save(self):
+        state = dict([(rule.name, rule.save()) for rule in self.rules])
+        with open(self.state_file+'.tmp', 'w') as FO:
+            json.dump(state, FO)
+        os.rename(self.state_file+'.tmp', self.state_file)
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as FO:
+                state = json.load(FO)
+        except ValueError:
+            if self.logger:
+                self.logger.warning('Ignoring unreadable rule state {}'.format(self.state_file))
+            return
+        for rule in self.rules:
+            rule.load(state.get(rule.name, {}))
+
+
+##-------------------------------------------------------------------------
+## Main Program (replay stored data through the rules)
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Replay a stream from the SQLite store through the rules.")
+    ## add arguments
+    parser.add_argument("--db",
+        type=str, dest="db", required=True,
+        help="SQLite store to read.")
+    parser.add_argument("--stream",
+        type=str, dest="stream", default='kegerator',
+        help="Stream to replay (default = kegerator)")
+    parser.add_argument("--rules",
+        type=str, dest="rules", default=None,
+        help="JSON file of rules (default = the built in rules for the stream)")
+    parser.add_argument("-d", "--date",
+        type=str, dest="date", default=None,
+        help="Day to replay, YYYYMMDD (default = all data)")
+    args = parser.parse_args()
+
+    import SensorStore
+    if args.rules:
+        with open(args.rules, 'r') as FO:
+            rules = json.load(FO)
+    else:
+        rules = HumidityRules + KegeratorRules
+    start, end = SensorStore.day_range(args.date) if args.date else (None, None)
+    store = SensorStore.Store(args.db)
+    columns = store.read_range(args.stream, start, end)
+    store.close()
+
+    engine = RuleEngine(rules)
+    names = list(columns.keys())
+    records = [dict(zip(names, row)) for row in zip(*[columns[name] for name in names])]
+    begin = time.time()
+    for record in records:
+        for event in engine.update(args.stream, record):
+            print('{} {:>6s} {:>16s} {}'.format(\
+                  time.strftime('%Y/%m/%d %H:%M:%S', time.localtime(event['timestamp']/1e6)),\
+                  event['event'], event['rule'], event['channel']))
+    elapsed = time.time() - begin
+    print('Evaluated {} records in {:.3f} s'.format(len(records), elapsed))
+
+
+if __name__ == '__main__':
+    main()
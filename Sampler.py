@@ -0,0 +1,426 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import time
+import threading
+
+import DHT22
+import DS18B20
+
+
+##-------------------------------------------------------------------------
+## Sensor Definitions
+##-------------------------------------------------------------------------
+class Sensor(object):
+    '''Base class for a sensor read by the SamplingEngine or Scheduler.
+
+    Subclasses implement read(), which blocks until the hardware answers and
+    returns a dict of channel values (or raises on failure).
+
+    For the Scheduler each sensor also declares min_interval, the shortest
+    time the hardware allows between reads, cadence, how often it should be
+    read, and bus, the name of the shared bus it sits on.  Only one read runs
+    on a bus at a time.
+    '''
+    timeout = 5.
+    min_interval = 1.
+    cadence = 60.
+    bus = None
+
+    def __init__(self, name, timeout=None, cadence=None, bus=None):
+        self.name = name
+        if timeout is not None:
+            self.timeout = timeout
+        if cadence is not None:
+            self.cadence = max(cadence, self.min_interval)
+        if bus is not None:
+            self.bus = bus
+        if self.bus is None:
+            self.bus = name
+
+    def read(self):
+        raise NotImplementedError
+
+
+class DHT22Sensor(Sensor):
+    '''DHT22 read through the Adafruit DHT driver executable (DHT22.py).
+    '''
+    timeout = 10.
+    min_interval = 2.
+    cadence = 10.
+
+    def __init__(self, name='DHT22', pin=18, timeout=None, cadence=None):
+        Sensor.__init__(self, name, timeout=timeout, cadence=cadence,\
+                        bus='GPIO{}'.format(pin))
+        self.pin = pin
+
+    def read(self):
+        DHT = DHT22.DHT22(pin=self.pin)
+        temperature_C, temperature_F, humidity = DHT.read()
+        return {'temperature_C': temperature_C,
+                'temperature_F': temperature_F,
+                'humidity': humidity}
+
+
+class AdafruitDHTSensor(Sensor):
+    '''DHT22/AM2302 read through the Adafruit_DHT python library.
+    '''
+    timeout = 10.
+    min_interval = 2.
+    cadence = 10.
+
+    def __init__(self, name='DHT22', pin=4, retries=2, timeout=None, cadence=None):
+        Sensor.__init__(self, name, timeout=timeout, cadence=cadence,\
+                        bus='GPIO{}'.format(pin))
+        self.pin = pin
+        self.retries = retries
+
+    def read(self):
+        import Adafruit_DHT
+        for attempt in range(self.retries):
+            humidity, temperature_C = Adafruit_DHT.read_retry(Adafruit_DHT.AM2302, self.pin)
+            if humidity and temperature_C:
+                return {'temperature_C': temperature_C,
+                        'temperature_F': 32. + 9./5.*temperature_C,
+                        'humidity': humidity}
+        raise IOError('DHT22 on pin {} failed {} times'.format(self.pin, self.retries))
+
+
+class DS18B20Sensor(Sensor):
+    '''A single DS18B20 probe on the 1-Wire bus.
+
+    If resolution is given (9 to 12 bits) it is applied before the first
+    read.  Lower resolutions convert faster: 10 bits (0.25 C steps) takes
+    about 190 ms against 750 ms at the default 12 bits.
+    '''
+    timeout = 2.
+    min_interval = 0.75
+    cadence = 5.
+    bus = 'w1'
+
+    def __init__(self, path, name=None, resolution=None, timeout=None, cadence=None):
+        self.resolution = resolution
+        if resolution:
+            self.min_interval = DS18B20.conversion_time[resolution]
+        Sensor.__init__(self, name or os.path.basename(path), timeout=timeout,\
+                        cadence=cadence)
+        self.path = path
+        self.configured = resolution is None
+        ## Set after DS18B20.bulk_convert(): the next read takes the result
+        ## from the temperature attribute instead of converting again
+        self.bulk_ready = False
+
+    def read(self):
+        if not self.configured:
+            DS18B20.set_resolution(self.path, self.resolution)
+            self.configured = True
+        if self.bulk_ready:
+            self.bulk_ready = False
+            temperature_C = DS18B20.read_temperature(self.path)
+        else:
+            temperature_C = DS18B20.read_device(self.path)
+        if temperature_C is None:
+            raise IOError('Failed to read {}'.format(self.path))
+        return {'temperature_C': temperature_C,
+                'temperature_F': temperature_C*9./5.+32.}
+
+
+def ds18b20_sensors(resolution=None, resolutions={}, timeout=None, cadence=None):
+    '''Return a DS18B20Sensor for every probe found on the 1-Wire bus.
+
+    resolutions maps probe IDs (e.g. '28-000004a1b2c3') to a resolution in
+    bits for that probe.  Other probes use resolution.
+    '''
+    return [DS18B20Sensor(path, timeout=timeout, cadence=cadence,\
+                          resolution=resolutions.get(os.path.basename(path), resolution))\
+            for path in DS18B20.devices()]
+
+
+class AAGSensor(Sensor):
+    '''Sky and ambient temperature from the AAG cloud sensor on a serial
+    port.  The port is opened on the first read and kept open.  Anything
+    left in the input buffer (line noise, the tail of a reply which arrived
+    late) is discarded before each query so the replies stay in step.
+    '''
+    timeout = 3.
+    min_interval = 0.2
+    cadence = 1.
+
+    def __init__(self, name='AAG', device='/dev/ttyAMA0', timeout=None, cadence=None):
+        Sensor.__init__(self, name, timeout=timeout, cadence=cadence, bus=device)
+        self.device = device
+        self.AAG = None
+
+    def read(self):
+        import serial
+        import CloudSensor
+        if not self.AAG:
+            self.AAG = serial.Serial(self.device, 9600, timeout=2)
+        values = {}
+        for name, query in [('sky_temperature_F', CloudSensor.AAG_GetSkyTemp),
+                            ('ambient_temperature_F', CloudSensor.AAG_GetAmbTemp)]:
+            while self.AAG.inWaiting() > 0:
+                self.AAG.read(self.AAG.inWaiting())
+            values[name] = query(self.AAG)
+        return values
+
+
+##-------------------------------------------------------------------------
+## Snapshot
+##-------------------------------------------------------------------------
+class Snapshot(object):
+    '''The result of one sampling cycle.
+
+    values maps sensor name to its dict of channel values, errors maps sensor
+    name to a description of why it has no values, and times maps sensor name
+    to the time its read completed.  If the values were filtered, raw holds
+    the values as read.
+    '''
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.values = {}
+        self.raw = {}
+        self.errors = {}
+        self.times = {}
+        self.duration = None
+
+    def get(self, sensor, channel, default=None):
+        return self.values.get(sensor, {}).get(channel, default)
+
+    def time(self):
+        return time.strftime('%Y/%m/%d %H:%M:%S UT', time.gmtime(self.timestamp))
+
+
+##-------------------------------------------------------------------------
+## Sampling Engine
+##-------------------------------------------------------------------------
+class _Read(object):
+    '''One in-flight sensor read running in a daemon thread.  Daemon threads
+    are used so a hung read can never keep the process from exiting.
+    '''
+    def __init__(self, sensor, callback=None):
+        self.sensor = sensor
+        self.callback = callback
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=sensor.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.result = self.sensor.read()
+        except Exception as e:
+            self.error = '{}: {}'.format(type(e).__name__, e)
+        self.finished = time.time()
+        self.done.set()
+        if self.callback:
+            self.callback(self)
+
+
+class SamplingEngine(object):
+    '''Read a set of sensors concurrently.
+
+    Every sensor is read in its own thread and given its own timeout, so one
+    cycle takes as long as the slowest sensor rather than the sum of all of
+    them.  A sensor whose previous read has not returned yet is not read
+    again; it is reported as busy until that read finishes.
+
+    filters is an optional Filters.ChannelFilters which rejects spikes from
+    each channel using its rolling median.
+    '''
+    def __init__(self, sensors, logger=None, filters=None):
+        self.sensors = list(sensors)
+        self.logger = logger
+        self.filters = filters
+        self.in_flight = {}
+
+    def sample(self):
+        start = time.time()
+        snapshot = Snapshot(start)
+        reads = {}
+        for sensor in self.sensors:
+            if sensor.name in self.in_flight and not self.in_flight[sensor.name].done.is_set():
+                snapshot.errors[sensor.name] = 'busy (previous read still running)'
+                continue
+            reads[sensor.name] = _Read(sensor)
+            self.in_flight[sensor.name] = reads[sensor.name]
+        for name, read in reads.items():
+            remaining = start + read.sensor.timeout - time.time()
+            if not read.done.wait(max(remaining, 0)):
+                snapshot.errors[name] = 'timed out after {:.1f} s'.format(read.sensor.timeout)
+            elif read.error:
+                snapshot.errors[name] = read.error
+            else:
+                snapshot.raw[name] = read.result
+                snapshot.values[name] = self.filters.apply(name, read.result)\
+                                        if self.filters else read.result
+                snapshot.times[name] = read.finished
+        snapshot.duration = time.time() - start
+        if self.logger:
+            self.logger.debug('Sampled {} sensors in {:.3f} s'.format(len(self.sensors), snapshot.duration))
+            for name, error in snapshot.errors.items():
+                self.logger.warning('Failed to read {}: {}'.format(name, error))
+        return snapshot
+
+
+##-------------------------------------------------------------------------
+## Multi-Rate Scheduler
+##-------------------------------------------------------------------------
+class Scheduler(object):
+    '''Read each sensor at its own cadence in a background thread.
+
+    Every sensor is read every cadence seconds (never faster than its
+    min_interval).  Reads on the same bus never overlap, and the first reads
+    of sensors sharing a bus are staggered by stagger seconds so they do not
+    all fall due together.  A sensor whose read is still running (even past
+    its timeout) is not started again, but a timed out read releases its bus
+    so the other sensors on it keep going.
+
+    Consumers call latest() or snapshot() to get the most recent cached values
+    along with their age, without waiting on any hardware.  Values pass
+    through the optional filters as they arrive.
+    '''
+    def __init__(self, sensors, stagger=0.1, logger=None, filters=None):
+        self.sensors = list(sensors)
+        self.logger = logger
+        self.filters = filters
+        self.lock = threading.Condition()
+        self.values = {}
+        self.times = {}
+        self.errors = {}
+        self.reads = {}
+        self.bus_owner = {}
+        self.next_due = {}
+        position = {}
+        now = time.time()
+        for sensor in self.sensors:
+            position[sensor.bus] = position.get(sensor.bus, -1) + 1
+            self.next_due[sensor.name] = now + position[sensor.bus]*stagger
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='Scheduler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        if self.thread:
+            self.thread.join()
+
+    def finished(self, read):
+        with self.lock:
+            name = read.sensor.name
+            if read.error:
+                self.errors[name] = read.error
+            else:
+                self.values[name] = self.filters.apply(name, read.result)\
+                                    if self.filters else read.result
+                self.times[name] = read.finished
+                self.errors.pop(name, None)
+            if self.bus_owner.get(read.sensor.bus) is read:
+                del self.bus_owner[read.sensor.bus]
+            self.lock.notify()
+
+    def run(self):
+        with self.lock:
+            while self.running:
+                now = time.time()
+                wake = now + 1.
+                ## Release buses held by reads which have overrun their timeout
+                for bus, read in list(self.bus_owner.items()):
+                    deadline = read.started + read.sensor.timeout
+                    if now >= deadline:
+                        self.errors[read.sensor.name] = 'timed out after {:.1f} s'.format(read.sensor.timeout)
+                        if self.logger:
+                            self.logger.warning('Read of {} timed out'.format(read.sensor.name))
+                        del self.bus_owner[bus]
+                    else:
+                        wake = min(wake, deadline)
+                ## Start reads which are due and whose bus is free
+                for sensor in sorted(self.sensors, key=lambda s: self.next_due[s.name]):
+                    due = self.next_due[sensor.name]
+                    read = self.reads.get(sensor.name)
+                    if read and not read.done.is_set():
+                        continue
+                    if due > now:
+                        wake = min(wake, due)
+                        continue
+                    if sensor.bus in self.bus_owner:
+                        continue
+                    self.reads[sensor.name] = _Read(sensor, callback=self.finished)
+                    self.bus_owner[sensor.bus] = self.reads[sensor.name]
+                    self.next_due[sensor.name] = now + max(sensor.cadence, sensor.min_interval)
+                    wake = min(wake, self.next_due[sensor.name])
+                self.lock.wait(max(wake - time.time(), 0.001))
+
+    def latest(self, name):
+        '''Return the last values read from a sensor and their age in seconds,
+        or (None, None) if the sensor has not been read successfully yet.
+        '''
+        with self.lock:
+            if name not in self.values:
+                return None, None
+            return self.values[name], time.time() - self.times[name]
+
+    def snapshot(self):
+        '''Return a Snapshot of the latest cached values.  The times of the
+        snapshot hold when each sensor was actually read.
+        '''
+        with self.lock:
+            snapshot = Snapshot(time.time())
+            snapshot.values = dict(self.values)
+            snapshot.times = dict(self.times)
+            snapshot.errors = dict([(name, error) for name, error in self.errors.items()\
+                                    if name not in self.values])
+        return snapshot
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Run the multi-rate scheduler and print the latest values.")
+    ## add arguments
+    parser.add_argument("--duration",
+        type=float, dest="duration", default=30.,
+        help="How long to run in seconds (default = 30)")
+    parser.add_argument("--aag",
+        type=str, dest="aag",
+        help="Serial device of an AAG cloud sensor to include.")
+    args = parser.parse_args()
+
+    sensors = [DHT22Sensor(name='DHT22')] + ds18b20_sensors()
+    if args.aag:
+        sensors.append(AAGSensor(device=args.aag))
+    scheduler = Scheduler(sensors)
+    scheduler.start()
+    end = time.time() + args.duration
+    while time.time() < end:
+        time.sleep(1)
+        for sensor in sensors:
+            values, age = scheduler.latest(sensor.name)
+            if values:
+                print('{:>20s} ({:5.1f} s old): {}'.format(sensor.name, age, values))
+    scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
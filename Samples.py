@@ -0,0 +1,200 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import argparse
+import array
+import math
+import time
+
+
+def C_to_F(temperature_C):
+    return None if temperature_C is None else temperature_C*9./5.+32.
+
+
+##-------------------------------------------------------------------------
+## Define Sample Class
+##-------------------------------------------------------------------------
+class Sample(object):
+    '''One reading of a temperature (and optionally humidity) sensor.
+
+    Only the time (seconds since the epoch), the temperature in C and the
+    humidity are stored, in __slots__, so a sample has no per-instance dict.
+    Fahrenheit and the other names the old attribute bags used are derived
+    on access.
+    '''
+    __slots__ = ('time', 'temperature_C', 'humidity')
+
+    def __init__(self, time, temperature_C=None, humidity=None):
+        self.time = time
+        self.temperature_C = temperature_C
+        self.humidity = humidity
+
+    @property
+    def temperature(self):
+        return self.temperature_C
+
+    @property
+    def temperature_F(self):
+        return C_to_F(self.temperature_C)
+
+    def as_dict(self):
+        '''Channel values as returned by the Sampler sensors.
+        '''
+        values = {'temperature_C': self.temperature_C, 'temperature_F': self.temperature_F}
+        if self.humidity is not None:
+            values['humidity'] = self.humidity
+        return values
+
+    def __repr__(self):
+        return 'Sample({!r}, {!r}, {!r})'.format(self.time, self.temperature_C, self.humidity)
+
+
+##-------------------------------------------------------------------------
+## Define History Class
+##-------------------------------------------------------------------------
+class History(object):
+    '''A time series of samples held as three array('d') columns, 24 bytes
+    per sample, instead of a list of objects.  Missing values are NaN.
+
+    If maxlen is given the oldest samples are dropped, in blocks so that
+    trimming stays cheap; samples past maxlen which are still held are never
+    seen through len(), indexing, iteration or column().  column() returns a
+    numpy array when numpy is available, for vectorized use by the plotting
+    and analysis code.
+    '''
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen
+        self.times = array.array('d')
+        self.temperatures_C = array.array('d')
+        self.humidities = array.array('d')
+
+    def start(self):
+        '''Index in the columns of the oldest sample within maxlen.
+        '''
+        return max(len(self.times) - self.maxlen, 0) if self.maxlen else 0
+
+    def __len__(self):
+        return len(self.times) - self.start()
+
+    def append(self, sample):
+        self.times.append(sample.time)
+        self.temperatures_C.append(float('nan') if sample.temperature_C is None\
+                                   else sample.temperature_C)
+        self.humidities.append(float('nan') if sample.humidity is None\
+                               else sample.humidity)
+        if self.maxlen and len(self.times) > self.maxlen + max(self.maxlen // 8, 1):
+            extra = len(self.times) - self.maxlen
+            for column in [self.times, self.temperatures_C, self.humidities]:
+                del column[:extra]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('History index out of range')
+        i += self.start()
+        temperature_C = self.temperatures_C[i]
+        humidity = self.humidities[i]
+        return Sample(self.times[i],\
+                      None if math.isnan(temperature_C) else temperature_C,\
+                      None if math.isnan(humidity) else humidity)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def column(self, name):
+        '''Return a copy of a column ('time', 'temperature_C', 'temperature_F'
+        or 'humidity'), trimmed to maxlen.
+        '''
+        start = self.start()
+        data = {'time': self.times, 'temperature_C': self.temperatures_C,
+                'temperature_F': self.temperatures_C, 'humidity': self.humidities}[name]
+        try:
+            import numpy as np
+        except ImportError:
+            values = data[start:]
+            if name == 'temperature_F':
+                values = array.array('d', [value*9./5.+32. for value in values])
+            return values
+        ## Slicing copies, so the live array stays free to grow
+        values = np.frombuffer(data[start:], dtype=np.float64)
+        if name == 'temperature_F':
+            values = values*9./5.+32.
+        return values
+
+
+##-------------------------------------------------------------------------
+## Memory Benchmark
+##-------------------------------------------------------------------------
+class _AttributeBag(object):
+    '''The attributes the DHT22 class used to keep for every reading.
+    '''
+    def __init__(self, temperature_C, humidity):
+        self.temperature = temperature_C
+        self.temperature_C = temperature_C
+        self.temperature_F = 32. + 9./5.*temperature_C
+        self.humidity = humidity
+        self.time_struct = time.gmtime()
+
+
+def measure(build, n):
+    '''Return the bytes allocated per sample by build(n).
+    '''
+    import tracemalloc
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build(n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / n
+
+
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Measure the memory used per sample by each representation.")
+    ## add arguments
+    parser.add_argument("--samples",
+        type=int, dest="samples", default=8640,
+        help="Number of samples (default = 8640, one day at 10 s)")
+    args = parser.parse_args()
+
+    start = time.time()
+    def readings(n):
+        return [(start + i*10., 4. + (i % 100)/100., 40. + (i % 37)/10.) for i in range(n)]
+
+    def bags(n):
+        return [_AttributeBag(t, h) for s, t, h in readings(n)]
+    def lists(n):
+        ## The three parallel lists the DS18B20 class kept
+        temperatures, temperatures_C, temperatures_F = [], [], []
+        for s, t, h in readings(n):
+            temperatures.append(t)
+            temperatures_C.append(t)
+            temperatures_F.append(t*9./5.+32.)
+        return temperatures, temperatures_C, temperatures_F
+    def samples(n):
+        return [Sample(s, t, h) for s, t, h in readings(n)]
+    def history(n):
+        series = History()
+        for s, t, h in readings(n):
+            series.append(Sample(s, t, h))
+        return series
+
+    print('{:>36s} {:>14s}'.format('representation', 'bytes/sample'))
+    for name, build in [('attribute bag objects (DHT22)', bags),
+                        ('parallel float lists (DS18B20)', lists),
+                        ('__slots__ Sample objects', samples),
+                        ('array backed History', history)]:
+        print('{:>36s} {:14.1f}'.format(name, measure(build, args.samples)))
+
+
+if __name__ == '__main__':
+    main()
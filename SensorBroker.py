@@ -0,0 +1,355 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import sys
+import os
+import argparse
+import json
+import socket
+import threading
+import time
+import collections
+
+try:
+    from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+except ImportError:
+    from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+import Sampler
+import LogSetup
+
+
+SocketPath = os.path.join('/', 'var', 'run', 'RasPiSensors.sock')
+
+
+##-------------------------------------------------------------------------
+## Define Broker Class
+##-------------------------------------------------------------------------
+class _Read(object):
+    '''One physical read of a sensor, shared by every request that arrives
+    while it is running.
+    '''
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.started = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Broker(object):
+    '''Own the sensor hardware and serve cached readings.
+
+    A request for a sensor read within the last max_age seconds is answered
+    from the cache (a hit).  Otherwise a physical read is started (a miss),
+    and any request arriving while it runs waits for that same read rather
+    than starting another (coalesced).  Reads on the same bus never overlap,
+    so processes started together by cron no longer collide on the DHT22's
+    single wire protocol.
+    '''
+    def __init__(self, sensors, max_age=5., logger=None):
+        self.sensors = dict([(sensor.name, sensor) for sensor in sensors])
+        self.max_age = max_age
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.bus_locks = dict([(sensor.bus, threading.Lock()) for sensor in sensors])
+        self.values = {}
+        self.times = {}
+        self.reads = {}
+        self.started = time.time()
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.latencies = collections.deque(maxlen=1000)
+        self.read_counts = collections.defaultdict(int)
+        self.read_time = collections.defaultdict(float)
+
+    def _read(self, read):
+        with self.bus_locks[read.sensor.bus]:
+            try:
+                read.result = read.sensor.read()
+            except Exception as e:
+                read.error = '{}: {}'.format(type(e).__name__, e)
+        read.finished = time.time()
+        with self.lock:
+            name = read.sensor.name
+            self.read_counts[name] += 1
+            self.read_time[name] += read.finished - read.started
+            if read.error:
+                self.failures += 1
+            else:
+                self.values[name] = read.result
+                self.times[name] = read.finished
+        read.done.set()
+        if read.error and self.logger:
+            self.logger.warning('Failed to read {}: {}'.format(name, read.error))
+
+    def get(self, names=None, max_age=None):
+        '''Return a Sampler.Snapshot of the named sensors (default all), read
+        no more than max_age seconds ago (default the broker's max_age).
+        '''
+        start = time.time()
+        max_age = self.max_age if max_age is None else max_age
+        names = sorted(self.sensors.keys()) if names is None else names
+        snapshot = Sampler.Snapshot(start)
+        waiting = {}
+        with self.lock:
+            self.requests += 1
+            for name in names:
+                if name not in self.sensors:
+                    snapshot.errors[name] = 'unknown sensor'
+                elif name in self.values and start - self.times[name] <= max_age:
+                    self.hits += 1
+                    snapshot.values[name] = self.values[name]
+                    snapshot.times[name] = self.times[name]
+                elif name in self.reads and not self.reads[name].done.is_set():
+                    self.coalesced += 1
+                    waiting[name] = self.reads[name]
+                else:
+                    self.misses += 1
+                    read = _Read(self.sensors[name])
+                    self.reads[name] = read
+                    waiting[name] = read
+                    thread = threading.Thread(target=self._read, args=(read,), name=name)
+                    thread.daemon = True
+                    thread.start()
+        for name, read in waiting.items():
+            remaining = read.started + read.sensor.timeout - time.time()
+            if not read.done.wait(max(remaining, 0)):
+                snapshot.errors[name] = 'timed out after {:.1f} s'.format(read.sensor.timeout)
+            elif read.error:
+                snapshot.errors[name] = read.error
+            else:
+                snapshot.values[name] = read.result
+                snapshot.times[name] = read.finished
+        snapshot.duration = time.time() - start
+        with self.lock:
+            self.latencies.append(snapshot.duration)
+        return snapshot
+
+    def stats(self):
+        '''Return the request counters, request latency percentiles (ms) and
+        the number and mean duration of physical reads of each sensor.
+        '''
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {'uptime': time.time() - self.started,
+                     'requests': self.requests,
+                     'hits': self.hits,
+                     'misses': self.misses,
+                     'coalesced': self.coalesced,
+                     'failures': self.failures,
+                     'reads': dict([(name, {'count': count,
+                                            'mean_ms': self.read_time[name]/count*1e3})\
+                                    for name, count in self.read_counts.items()])}
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced'])/lookups if lookups else None
+        if latencies:
+            percentile = lambda p: latencies[min(int(p/100.*len(latencies)), len(latencies)-1)]*1e3
+            stats['latency_ms'] = {'p50': percentile(50), 'p90': percentile(90),
+                                   'p99': percentile(99), 'max': latencies[-1]*1e3}
+        return stats
+
+
+##-------------------------------------------------------------------------
+## Unix Socket Server
+##-------------------------------------------------------------------------
+class BrokerHandler(StreamRequestHandler):
+    '''Newline delimited JSON.  Each request line is one of
+        {"read": [sensor names] or null, "max_age": seconds or null}
+        {"stats": true}
+    and is answered by one JSON line.
+    '''
+    def handle(self):
+        broker = self.server.broker
+        for line in self.rfile:
+            try:
+                message = json.loads(line.decode('utf-8'))
+                if message.get('stats'):
+                    response = broker.stats()
+                elif message.get('sensors'):
+                    response = {'sensors': dict([(name, {'resolution': getattr(sensor, 'resolution', None)})\
+                                                 for name, sensor in broker.sensors.items()])}
+                else:
+                    snapshot = broker.get(message.get('read'), message.get('max_age'))
+                    response = {'timestamp': snapshot.timestamp,
+                                'values': snapshot.values,
+                                'times': snapshot.times,
+                                'errors': snapshot.errors}
+            except (ValueError, AttributeError, TypeError) as e:
+                response = {'error': 'bad request: {}'.format(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class BrokerServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    ## Every cron job may connect in the same second; a Unix socket refuses
+    ## (EAGAIN) rather than queues connections beyond the listen backlog
+    request_queue_size = 64
+
+
+##-------------------------------------------------------------------------
+## Client Side
+##-------------------------------------------------------------------------
+def request(message, path=SocketPath, timeout=30.):
+    '''Send one request to the broker and return its decoded response.
+    Raises socket.error (an IOError) if the broker is not running.
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path)
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                raise IOError('Broker closed the connection')
+            data += chunk
+    finally:
+        client.close()
+    return json.loads(data.decode('utf-8'))
+
+
+def running(path=SocketPath):
+    '''True if a broker is answering on path.
+    '''
+    if not os.path.exists(path):
+        return False
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        client.close()
+
+
+class BrokerSensor(Sampler.Sensor):
+    '''A sensor read through the broker, for use in a SamplingEngine or
+    Scheduler in place of the sensor the broker owns.
+    '''
+    def __init__(self, name, path=SocketPath, max_age=None, timeout=None, cadence=None,\
+                 resolution=None):
+        Sampler.Sensor.__init__(self, name, timeout=timeout, cadence=cadence)
+        self.path = path
+        self.max_age = max_age
+        self.resolution = resolution
+
+    def read(self):
+        response = request({'read': [self.name], 'max_age': self.max_age},\
+                           path=self.path, timeout=self.timeout)
+        if self.name in response.get('errors', {}):
+            raise IOError('Broker: {}'.format(response['errors'][self.name]))
+        return response['values'][self.name]
+
+
+def broker_sensors(sensors, path=SocketPath, max_age=None):
+    '''Return BrokerSensors standing in for sensors if the broker is running,
+    otherwise the sensors themselves, so callers fall back to reading the
+    hardware directly.  A sensor the broker does not serve, or serves at a
+    different resolution than the caller asked for, is read directly too.
+    '''
+    if not running(path):
+        return sensors
+    try:
+        served = request({'sensors': True}, path=path, timeout=5.).get('sensors', {})
+    except (socket.error, ValueError):
+        return sensors
+    proxies = []
+    for sensor in sensors:
+        resolution = getattr(sensor, 'resolution', None)
+        if sensor.name not in served or\
+           resolution not in [None, served[sensor.name].get('resolution')]:
+            proxies.append(sensor)
+        else:
+            proxies.append(BrokerSensor(sensor.name, path=path, max_age=max_age,\
+                                        timeout=sensor.timeout+1., cadence=sensor.cadence,\
+                                        resolution=resolution))
+    return proxies
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Serve cached sensor readings over a Unix socket.")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--stats",
+        action="store_true", dest="stats",
+        default=False, help="Print the statistics of the running broker and exit.")
+    parser.add_argument("--no-ds18b20",
+        action="store_true", dest="no_ds18b20",
+        default=False, help="Do not serve the DS18B20 probes.")
+    ## add arguments
+    parser.add_argument("--socket",
+        type=str, dest="socket", default=SocketPath,
+        help="Unix socket to serve on (default = {})".format(SocketPath))
+    parser.add_argument("--max-age",
+        type=float, dest="max_age", default=5.,
+        help="Serve cached readings up to this many seconds old (default = 5)")
+    parser.add_argument("--dht22-pin",
+        type=int, dest="dht22_pin",
+        help="Serve a DHT22 on this pin read through the DHT22 driver.")
+    parser.add_argument("--adafruit-dht-pin",
+        type=int, dest="adafruit_dht_pin",
+        help="Serve a DHT22 on this pin read through the Adafruit_DHT library.")
+    parser.add_argument("--resolution",
+        type=int, dest="resolution",
+        help="DS18B20 resolution in bits (default = leave as is)")
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(request({'stats': True}, path=args.socket), indent=2, sort_keys=True))
+        return
+
+    logger = LogSetup.get_logger('SensorBroker', verbose=args.verbose)
+    sensors = []
+    if args.dht22_pin is not None:
+        sensors.append(Sampler.DHT22Sensor(name='DHT22', pin=args.dht22_pin))
+    if args.adafruit_dht_pin is not None:
+        sensors.append(Sampler.AdafruitDHTSensor(name='DHT22', pin=args.adafruit_dht_pin))
+    if not args.no_ds18b20:
+        sensors.extend(Sampler.ds18b20_sensors(resolution=args.resolution))
+    if not sensors:
+        logger.error('No sensors to serve')
+        sys.exit(1)
+
+    if os.path.exists(args.socket):
+        if running(args.socket):
+            logger.error('A broker is already serving {}'.format(args.socket))
+            sys.exit(1)
+        os.remove(args.socket)
+    server = BrokerServer(args.socket, BrokerHandler)
+    os.chmod(args.socket, 0o666)
+    server.broker = Broker(sensors, max_age=args.max_age, logger=logger)
+    logger.info('Serving {} on {}'.format(', '.join(sorted(server.broker.sensors)), args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+        stats = server.broker.stats()
+        logger.info('Requests: {}, hits: {}, misses: {}, coalesced: {}'.format(\
+                    stats['requests'], stats['hits'], stats['misses'], stats['coalesced']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import re
+import time
+import sqlite3
+
+
+##-------------------------------------------------------------------------
+## Timestamps
+##-------------------------------------------------------------------------
+def now_us():
+    '''Current time as integer microseconds since the Unix epoch.
+    '''
+    return int(time.time() * 1e6)
+
+
+##-------------------------------------------------------------------------
+## Define Store Class
+##-------------------------------------------------------------------------
+class Store(object):
+    '''Time series store in a SQLite database shared by all the monitors.
+
+    Each sensor stream (e.g. 'kegerator', 'humidity') is a table keyed by an
+    integer timestamp in microseconds since the epoch.  The timestamp is the
+    table's INTEGER PRIMARY KEY, so rows are stored in time order and time
+    range reads are index range scans.  Columns are created from the first
+    record written and added as new fields appear.
+
+    The database runs in WAL mode, so plotting and other readers never block
+    the acquisition processes writing to it.
+
+    A readonly store opens an existing database read only.  Its connection
+    may be used from any thread, but only by one thread at a time.
+    '''
+    def __init__(self, path, timeout=10., readonly=False):
+        self.path = path
+        self.columns = {}
+        if readonly:
+            self.connection = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(path)),\
+                                              timeout=timeout, uri=True, check_same_thread=False)
+            return
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def close(self):
+        self.connection.close()
+
+    def streams(self):
+        cursor = self.connection.execute(\
+                 "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+        return [row[0] for row in cursor]
+
+    def stream_columns(self, stream):
+        if stream not in self.columns:
+            cursor = self.connection.execute('PRAGMA table_info("{}")'.format(stream))
+            columns = [row[1] for row in cursor]
+            if len(columns) == 0:
+                return []
+            self.columns[stream] = columns
+        return self.columns[stream]
+
+    def ensure_stream(self, stream, record):
+        '''Create the table for a stream, or add columns to it, so that it can
+        hold record.
+        '''
+        assert re.match(r'^\w+$', stream), 'Invalid stream name: {}'.format(stream)
+        existing = self.stream_columns(stream)
+        if len(existing) == 0:
+            self.connection.execute(\
+                 'CREATE TABLE IF NOT EXISTS "{}" (timestamp INTEGER PRIMARY KEY)'.format(stream))
+            existing = ['timestamp']
+        for name, value in sorted(record.items()):
+            if name in existing:
+                continue
+            assert re.match(r'^\w+$', name), 'Invalid column name: {}'.format(name)
+            if isinstance(value, str):
+                kind = 'TEXT'
+            elif isinstance(value, (bool, int)):
+                kind = 'INTEGER'
+            else:
+                kind = 'REAL'
+            self.connection.execute('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(stream, name, kind))
+            existing.append(name)
+        self.columns[stream] = existing
+
+    def write_cycle(self, records):
+        '''Write the records from one cycle in a single transaction.
+
+        records maps stream name to a list of dicts.  Each dict must have a
+        'timestamp' in integer microseconds; a second record with the same
+        timestamp replaces the first.  If any record fails nothing is written,
+        and the cached columns of the streams are dropped, as the tables and
+        columns made for them may have been rolled back too.
+        '''
+        try:
+            with self.connection:
+                ## Begin explicitly, so the tables and columns made for the
+                ## records are rolled back with them
+                if not self.connection.in_transaction:
+                    self.connection.execute('BEGIN')
+                for stream, rows in records.items():
+                    for row in rows:
+                        self.ensure_stream(stream, row)
+                    names = self.stream_columns(stream)
+                    sql = 'INSERT OR REPLACE INTO "{}" ({}) VALUES ({})'.format(stream,\
+                          ', '.join(['"{}"'.format(name) for name in names]),\
+                          ', '.join(['?']*len(names)))
+                    self.connection.executemany(sql, [[row.get(name) for name in names]\
+                                                      for row in rows])
+        except Exception:
+            for stream in records:
+                self.columns.pop(stream, None)
+            raise
+
+    def write(self, stream, record):
+        self.write_cycle({stream: [record]})
+
+    def read_range(self, stream, start=None, end=None, columns=None, limit=None):
+        '''Read the rows of a stream with start <= timestamp < end, only the
+        first limit of them if limit is given.
+
+        Times are in integer microseconds (None for an open end).  Returns a
+        dict of column name to list of values, in time order, which is the
+        shape the plotting code wants.
+        '''
+        names = columns or self.stream_columns(stream)
+        if 'timestamp' not in names:
+            names = ['timestamp'] + list(names)
+        if len(self.stream_columns(stream)) == 0:
+            return dict([(name, []) for name in names])
+        sql = 'SELECT {} FROM "{}" WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp'.format(\
+              ', '.join(['"{}"'.format(name) for name in names]), stream)
+        parameters = [start if start is not None else -2**63, end if end is not None else 2**63-1]
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters.append(limit)
+        cursor = self.connection.execute(sql, parameters)
+        rows = cursor.fetchall()
+        return dict([(name, [row[i] for row in rows]) for i, name in enumerate(names)])
+
+    def last_timestamp(self, stream):
+        '''Return the newest timestamp in a stream, or None.  This is a single
+        primary key lookup, so it is cheap enough to poll.
+        '''
+        if len(self.stream_columns(stream)) == 0:
+            return None
+        cursor = self.connection.execute('SELECT MAX(timestamp) FROM "{}"'.format(stream))
+        return cursor.fetchone()[0]
+
+    def latest(self, stream):
+        '''Return the most recent row of a stream as a dict, or None.
+        '''
+        names = self.stream_columns(stream)
+        if len(names) == 0:
+            return None
+        cursor = self.connection.execute(\
+                 'SELECT * FROM "{}" ORDER BY timestamp DESC LIMIT 1'.format(stream))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([description[0] for description in cursor.description], row))
+
+
+def day_range(date=None):
+    '''Return the (start, end) in microseconds of a local calendar day given
+    as 'YYYYMMDD' (today if None).
+    '''
+    if not date:
+        date = time.strftime('%Y%m%d', time.localtime())
+    start = time.mktime(time.strptime(date, '%Y%m%d'))
+    end = time.mktime(time.localtime(start + 36*3600)[:3] + (0, 0, 0, 0, 0, -1))
+    return int(start * 1e6), int(end * 1e6)
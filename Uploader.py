@@ -0,0 +1,453 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import glob
+import math
+import time
+import threading
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlparse
+    import queue
+except ImportError:
+    import httplib
+    from urlparse import urlparse
+    import Queue as queue
+
+import Carriots
+import LogSetup
+
+
+SpoolDirectory = os.path.join('/', 'var', 'spool', 'RasPiUpload')
+
+## Client errors which may succeed if sent again later; any other 4xx means
+## the server will never accept the job
+RetryStatus = [408, 425, 429]
+
+## Upload options for each device:
+##   delta      send only the fields which changed since the last upload
+##   keyframe   send every field at least once every keyframe uploads
+##   precision  decimal places kept for each numeric field (default 2)
+##   tolerance  changes smaller than this are not sent (default 0)
+Devices = {
+    'kegerator@joshwalawender': {'delta': True, 'keyframe': 12,
+                                 'precision': {'Temperature': 1}, 'tolerance': {'Temperature': 0.1}},
+    'Shed@joshwalawender': {'delta': True, 'keyframe': 12},
+}
+
+
+##-------------------------------------------------------------------------
+## Submit an Upload
+##-------------------------------------------------------------------------
+def submit(device, data, at=None, spool=SpoolDirectory):
+    '''Queue data for upload by the uploader process.  This only writes a
+    small file to the spool directory, so it never waits on the network.
+    '''
+    if not os.path.exists(spool):
+        os.makedirs(spool)
+    at = at if at is not None else time.time()
+    job = {'device': device, 'at': int(at), 'data': data}
+    filename = os.path.join(spool, '{:017.6f}_{}.json'.format(at, device.replace('/', '_')))
+    with open(filename+'.tmp', 'w') as FO:
+        json.dump(job, FO)
+    os.rename(filename+'.tmp', filename)
+    return filename
+
+
+##-------------------------------------------------------------------------
+## Define Connection Pool Class
+##-------------------------------------------------------------------------
+class ConnectionPool(object):
+    '''A few persistent HTTP connections to one host, shared by all devices.
+
+    Connections are kept alive between requests, so the TCP (and TLS) set up
+    is paid once rather than on every upload.  A connection which fails is
+    dropped and the request is retried once on a fresh one.
+    '''
+    def __init__(self, url, size=2, timeout=10.):
+        parsed = urlparse(url)
+        self.path = parsed.path or '/'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.https = parsed.scheme == 'https'
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.size = size
+        self.opened = 0
+
+    def connect(self):
+        self.opened += 1
+        if self.https:
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, body, headers):
+        '''POST body and return (status, response body).
+        '''
+        for attempt in range(2):
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = self.connect()
+            try:
+                connection.request('POST', self.path, body, headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (httplib.HTTPException, IOError, OSError):
+                connection.close()
+                if attempt:
+                    raise
+                continue
+            if response.will_close or self.idle.qsize() >= self.size:
+                connection.close()
+            else:
+                self.idle.put(connection)
+            return response.status, content
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+##-------------------------------------------------------------------------
+## Define Delta Encoder Class
+##-------------------------------------------------------------------------
+class DeltaEncoder(object):
+    '''Reduce each device's payloads to the fields which changed.
+
+    Values are rounded to their precision first, so noise below it never
+    counts as a change.  NaN and infinite values are sent as null, as JSON
+    has no way to write them.  Every keyframe uploads (and after any failed upload)
+    the full set of fields is sent, so a consumer can always rebuild the
+    complete state by carrying the last value of each field forward.
+    '''
+    def __init__(self, delta=True, keyframe=12, precision={}, tolerance={}):
+        self.delta = delta
+        self.keyframe = keyframe
+        self.precision = precision
+        self.tolerance = tolerance
+        self.last = {}
+        self.count = 0
+
+    def round(self, name, value):
+        if isinstance(value, float):
+            if math.isnan(value) or math.isinf(value):
+                return None
+            return round(value, self.precision.get(name, 2))
+        return value
+
+    def encode(self, data):
+        if not isinstance(data, dict):
+            return data
+        data = dict([(name, self.round(name, value)) for name, value in data.items()])
+        if not self.delta or self.count % self.keyframe == 0:
+            changed = data
+        else:
+            changed = {}
+            for name, value in data.items():
+                last = self.last.get(name)
+                if isinstance(value, (int, float)) and isinstance(last, (int, float)):
+                    if abs(value - last) > self.tolerance.get(name, 0):
+                        changed[name] = value
+                elif value != last:
+                    changed[name] = value
+        return changed
+
+    def sent(self, data, payload):
+        '''Record a successful upload of payload (the encoding of data).
+        '''
+        if isinstance(data, dict):
+            self.last.update(payload)
+        self.count += 1
+
+    def reset(self):
+        '''Send a keyframe next, e.g. after a failed upload.
+        '''
+        self.count = 0
+
+
+##-------------------------------------------------------------------------
+## Define Uploader Class
+##-------------------------------------------------------------------------
+class Uploader(object):
+    '''Upload queued data for any number of devices over one pool of
+    persistent connections.
+
+    Jobs are sent in time order for each device.  Devices are independent,
+    so up to pool_size of them are sent in parallel.  The API key is read once
+    and only read again if its file changes.  A job whose delta is empty is
+    not sent at all.  A failed upload stays in the spool and is retried after
+    backoff seconds, unless the server rejected it outright (a 4xx other
+    than those in RetryStatus): that job is moved to the rejected directory
+    of the spool and the device moves on to its next job.
+    '''
+    def __init__(self, devices=Devices, spool=SpoolDirectory, url=Carriots.Client.api_url,\
+                 api_key_file=None, api_key=None, pool_size=2, backoff=60., logger=None):
+        self.devices = devices
+        self.spool = spool
+        self.api_key_file = api_key_file
+        self.api_key = api_key
+        self.pool = ConnectionPool(url, size=pool_size)
+        self.pool_size = pool_size
+        self.backoff = backoff
+        self.logger = logger
+        self.encoders = {}
+        self.retry_after = {}
+        self.content_type = 'application/vnd.carriots.api.v2+json'
+        self.counts = {'uploads': 0, 'skipped': 0, 'failed': 0, 'rejected': 0,\
+                       'bytes': 0, 'full_bytes': 0}
+        self.lock = threading.Lock()
+
+    def encoder(self, device):
+        if device not in self.encoders:
+            self.encoders[device] = DeltaEncoder(**self.devices.get(device, {'delta': False}))
+        return self.encoders[device]
+
+    def headers(self):
+        api_key = self.api_key or Carriots.read_api_key(self.api_key_file)
+        return {'User-Agent': 'Raspberry-Carriots',
+                'Content-Type': self.content_type,
+                'Accept': self.content_type,
+                'Carriots.apikey': api_key,
+                'Connection': 'keep-alive'}
+
+    def upload(self, job):
+        '''Send one job.  Returns False if it failed and should be sent again
+        later, True if it is done with (accepted, or rejected and moved aside).
+        '''
+        encoder = self.encoder(job['device'])
+        payload = encoder.encode(job['data'])
+        full = json.dumps({'protocol': 'v2', 'device': job['device'],
+                           'at': job['at'], 'data': job['data']})
+        if payload == {}:
+            with self.lock:
+                encoder.sent(job['data'], payload)
+                self.counts['skipped'] += 1
+                self.counts['full_bytes'] += len(full)
+            return True
+        body = json.dumps({'protocol': 'v2', 'device': job['device'],
+                           'at': job['at'], 'data': payload}, separators=(',', ':'))
+        try:
+            status, content = self.pool.request(body.encode('utf-8'), self.headers())
+        except (httplib.HTTPException, IOError, OSError) as e:
+            status, content = None, str(e)
+        with self.lock:
+            if status is not None and 200 <= status < 300:
+                encoder.sent(job['data'], payload)
+                self.counts['uploads'] += 1
+                self.counts['bytes'] += len(body)
+                self.counts['full_bytes'] += len(full)
+                return True
+            encoder.reset()
+            rejected = status is not None and 400 <= status < 500 and status not in RetryStatus
+            self.counts['rejected' if rejected else 'failed'] += 1
+        if rejected:
+            self.reject(job, status, content)
+            return True
+        if self.logger:
+            self.logger.warning('Upload for {} failed: {} {}'.format(job['device'], status, content))
+        return False
+
+    def reject(self, job, status, content):
+        '''Move a job the server will never accept out of the spool.
+        '''
+        if job.get('file'):
+            rejected = os.path.join(self.spool, 'rejected')
+            if not os.path.exists(rejected):
+                os.makedirs(rejected)
+            os.rename(job['file'], os.path.join(rejected, os.path.basename(job['file'])))
+        if self.logger:
+            self.logger.error('Upload for {} rejected ({} {}), moved to {}'.format(job['device'],\
+                              status, content, os.path.join(self.spool, 'rejected')))
+
+    def pending(self):
+        jobs = {}
+        for filename in sorted(glob.glob(os.path.join(self.spool, '*.json'))):
+            try:
+                with open(filename, 'r') as FO:
+                    job = json.load(FO)
+            except (IOError, OSError, ValueError):
+                continue
+            job['file'] = filename
+            jobs.setdefault(job['device'], []).append(job)
+        return jobs
+
+    def send_device(self, jobs):
+        for job in jobs:
+            if not self.upload(job):
+                self.retry_after[job['device']] = time.time() + self.backoff
+                return
+            if os.path.exists(job['file']):
+                os.remove(job['file'])
+
+    def dispatch(self):
+        '''Send everything pending, one thread per device (at most pool_size
+        at once).  Returns the number of devices sent.
+        '''
+        now = time.time()
+        jobs = self.pending()
+        devices = [device for device in sorted(jobs) if self.retry_after.get(device, 0) <= now]
+        for i in range(0, len(devices), self.pool_size):
+            threads = [threading.Thread(target=self.send_device, args=(jobs[device],))\
+                       for device in devices[i:i+self.pool_size]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return len(devices)
+
+    def run(self, poll=5., duration=None):
+        start = time.time()
+        while duration is None or time.time() - start < duration:
+            self.dispatch()
+            time.sleep(poll)
+        self.pool.close()
+
+
+##-------------------------------------------------------------------------
+## Benchmark Against a Local Mock Endpoint
+##-------------------------------------------------------------------------
+def benchmark(uploads=200, devices=2):
+    '''Compare one urllib request per upload with full payloads against the
+    pooled, delta encoded uploader, both posting to a local mock server.
+    '''
+    import random
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    try:
+        from socketserver import ThreadingMixIn
+    except ImportError:
+        from SocketServer import ThreadingMixIn
+
+    received = {'requests': 0, 'bytes': 0, 'connections': 0}
+
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        ## Reply in one segment, like a real server, so keep-alive requests
+        ## are not held up by delayed ACKs
+        disable_nagle_algorithm = True
+        def setup(self):
+            BaseHTTPRequestHandler.setup(self)
+            received['connections'] += 1
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            received['requests'] += 1
+            received['bytes'] += length
+            body = b'{"response":"OK"}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            pass
+
+    class MockServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = MockServer(('127.0.0.1', 0), MockHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{}/streams'.format(server.server_address[1])
+
+    generator = random.Random(0)
+    names = ['device{}@bench'.format(i) for i in range(devices)]
+    jobs = []
+    for i in range(uploads):
+        jobs.append({'device': names[i % devices], 'at': 1400000000 + i*60,
+                     'data': {'Temperature': 38. + generator.gauss(0, 0.05),
+                              'AmbTemp': 70. + i/100.,
+                              'RH': 45. + generator.gauss(0, 0.5),
+                              'Status': 'On' if (i // 40) % 2 else 'Off'}})
+
+    ## Baseline: a new connection and the full payload every time
+    Client = Carriots.Client(api_key='bench')
+    Client.api_url = url
+    before = dict(received)
+    start = time.time()
+    for job in jobs:
+        Client.device_id = job['device']
+        Client.send({'protocol': 'v2', 'device': job['device'], 'at': job['at'], 'data': job['data']})
+        Client.response.read()
+    baseline = (time.time() - start, received['bytes'] - before['bytes'],\
+                received['connections'] - before['connections'])
+
+    ## Pooled connections and delta encoding
+    uploader = Uploader(devices=dict([(name, {'delta': True, 'keyframe': 12,\
+                                              'precision': {'Temperature': 1, 'RH': 0}})\
+                                      for name in names]),\
+                        url=url, api_key='bench')
+    before = dict(received)
+    start = time.time()
+    for job in jobs:
+        uploader.upload(job)
+    pooled = (time.time() - start, received['bytes'] - before['bytes'],\
+              received['connections'] - before['connections'])
+    uploader.pool.close()
+    server.shutdown()
+
+    print('{:>24s} {:>10s} {:>12s} {:>12s}'.format('', 'req/s', 'bytes/upload', 'connections'))
+    for name, (elapsed, size, connections) in [('urllib, full payload', baseline),\
+                                               ('pooled, delta encoded', pooled)]:
+        print('{:>24s} {:10.1f} {:12.1f} {:12d}'.format(name, uploads/elapsed, size/uploads, connections))
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Upload queued data for all devices to Carriots.")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--benchmark",
+        action="store_true", dest="benchmark",
+        default=False, help="Run the benchmark against a local mock endpoint.")
+    ## add arguments
+    parser.add_argument("--spool",
+        type=str, dest="spool", default=SpoolDirectory,
+        help="Spool directory of queued uploads (default = {})".format(SpoolDirectory))
+    parser.add_argument("--api-key",
+        type=str, dest="api_key_file",
+        default=os.path.join(os.path.expanduser('~joshw'), '.carriots_api'),
+        help="File holding the Carriots API key.")
+    parser.add_argument("--poll",
+        type=float, dest="poll", default=5.,
+        help="Seconds between checks of the spool (default = 5)")
+    parser.add_argument("--uploads",
+        type=int, dest="uploads", default=200,
+        help="Uploads sent by the benchmark (default = 200)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(uploads=args.uploads)
+        return
+
+    logger = LogSetup.get_logger('Uploader', verbose=args.verbose)
+    uploader = Uploader(spool=args.spool, api_key_file=args.api_key_file, logger=logger)
+    logger.info('Uploading from {}'.format(args.spool))
+    try:
+        uploader.run(poll=args.poll)
+    except KeyboardInterrupt:
+        pass
+    logger.info('Sent {uploads} uploads ({bytes} bytes, {full_bytes} as full payloads), '\
+                '{skipped} unchanged, {failed} failed, {rejected} rejected'.format(**uploader.counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import json
+import shutil
+import signal
+import tempfile
+import time
+
+import DS18B20
+import Sampler
+import Kegerator
+import LogSetup
+
+
+## An example zones file:
+## [{"name": "kegerator", "probes": ["28-000004a1b2c3", "28-000004a1b2c4"],
+##   "relay_pin": 23, "temp_low": 38.0, "temp_high": 42.0},
+##  {"name": "fermenter", "probes": ["28-000004a1b2c5"], "relay_pin": 24,
+##   "temp_low": 64.0, "temp_high": 66.0, "action": "heat"}]
+ZonesFile = os.path.join('/', 'etc', 'RasPiZones.json')
+LogDirectory = os.path.join('/', 'var', 'log', 'Kegerator')
+
+
+##-------------------------------------------------------------------------
+## Define Zone Class
+##-------------------------------------------------------------------------
+class Zone(object):
+    '''One fridge or chamber: a group of probes, a relay and its setpoints.
+
+    A cooling zone switches its relay on above temp_high and off below
+    temp_low; a heating zone (action 'heat') does the reverse.  Between the
+    setpoints the relay is left as it is.  A zone with no readings switches
+    its relay off.  Records go to the store stream named stream (default the
+    zone name).
+    '''
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.probes = list(spec['probes'])
+        self.relay_pin = spec['relay_pin']
+        self.temp_low = spec['temp_low']
+        self.temp_high = spec['temp_high']
+        self.action = spec.get('action', 'cool')
+        self.stream = spec.get('stream', self.name)
+        assert self.action in ['cool', 'heat'], 'Unknown action: {}'.format(self.action)
+        assert self.temp_low < self.temp_high, 'Zone {}: temp_low must be below temp_high'.format(self.name)
+
+    def decide(self, temperature, status):
+        if temperature is None:
+            return 'Off'
+        above, below = ('On', 'Off') if self.action == 'cool' else ('Off', 'On')
+        if temperature > self.temp_high:
+            return above
+        if temperature < self.temp_low:
+            return below
+        return status if status in ['On', 'Off'] else 'Off'
+
+
+def read_zones(filename):
+    with open(filename, 'r') as FO:
+        return [Zone(spec) for spec in json.load(FO)]
+
+
+##-------------------------------------------------------------------------
+## Define Controller Class
+##-------------------------------------------------------------------------
+class Controller(object):
+    '''Run every zone from one process.
+
+    Each cycle reads all the probes of all the zones together.  When the
+    1-Wire driver supports it, one bulk conversion is started on the whole
+    bus and each probe's temperature attribute is read, so the probes
+    convert in parallel and the cycle takes one conversion time however
+    many zones there are.  Otherwise the probes are
+    read concurrently and the bus serializes their conversions.  A probe
+    shared by several zones is read once.
+
+    relay(state, pin) switches a relay; by default Kegerator.relay.
+    '''
+    def __init__(self, zones, w1_root=None, relay=None, db=None, logdir=None,\
+                 resolution=10, publish=True, logger=None):
+        self.zones = zones
+        self.w1_root = w1_root or DS18B20.w1_devices
+        self.relay = relay or Kegerator.relay
+        self.db = db
+        self.logdir = logdir
+        self.publish = publish
+        self.logger = logger
+        self.status = dict([(zone.name, None) for zone in zones])
+        self.events = {}
+        if logdir:
+            import EventLog
+            for zone in zones:
+                self.events[zone.name] = EventLog.EventLog(\
+                     os.path.join(logdir, '{}_relay_events.txt'.format(zone.stream)))
+                self.status[zone.name] = self.events[zone.name].current()
+        probes = sorted(set(sum([zone.probes for zone in zones], [])))
+        paths = [os.path.join(self.w1_root, probe) for probe in probes]
+        if resolution:
+            for path in paths:
+                DS18B20.set_resolution(path, resolution)
+        self.conversion = DS18B20.conversion_time[resolution or 12]
+        self.bulk = DS18B20.bulk_read_file(self.w1_root) is not None
+        ## Without bulk conversion the reads queue on the bus
+        timeout = self.conversion * (1 if self.bulk else len(paths)) + 1.
+        self.engine = Sampler.SamplingEngine([Sampler.DS18B20Sensor(path, timeout=timeout)\
+                                              for path in paths], logger=logger)
+
+    def cycle(self):
+        '''Read every zone, switch the relays and record the results.
+        Returns the Sampler.Snapshot of the probes.
+        '''
+        start = time.time()
+        if self.bulk:
+            if DS18B20.bulk_convert(self.w1_root, timeout=self.conversion*2 + 0.5):
+                for sensor in self.engine.sensors:
+                    sensor.bulk_ready = True
+            elif self.logger:
+                self.logger.warning('Bulk conversion failed, probes will convert one at a time')
+        snapshot = self.engine.sample()
+        timestamp = int(snapshot.timestamp * 1e6)
+        records = {}
+        for zone in self.zones:
+            temperatures = [snapshot.get(probe, 'temperature_F') for probe in zone.probes\
+                            if probe in snapshot.values]
+            temperature = Kegerator.median(temperatures) if temperatures else None
+            status = zone.decide(temperature, self.status[zone.name])
+            try:
+                self.relay(status == 'On', pin=zone.relay_pin)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error('Could not switch relay of {}: {}'.format(zone.name, e))
+            if status != self.status[zone.name] and self.logger:
+                self.logger.info('{}: {} F, relay {}'.format(zone.name,\
+                                 '{:.1f}'.format(temperature) if temperature is not None else 'no reading',\
+                                 status))
+            self.status[zone.name] = status
+            if zone.name in self.events:
+                try:
+                    self.events[zone.name].record(timestamp, status)
+                except (IOError, OSError, ValueError) as e:
+                    if self.logger:
+                        self.logger.warning('Could not record relay event of {}: {}'.format(zone.name, e))
+            record = {'timestamp': timestamp, 'status': status,
+                      'temperature': temperature if temperature is not None else float('nan')}
+            for i, probe in enumerate(zone.probes):
+                record['temperature{}'.format(i+1)] = snapshot.get(probe, 'temperature_F', float('nan'))
+            records.setdefault(zone.stream, []).append(record)
+        if self.db:
+            import SensorStore
+            store = SensorStore.Store(self.db)
+            store.write_cycle(records)
+            store.close()
+        if self.publish:
+            import LatestBoard
+            try:
+                board = LatestBoard.Board()
+                for stream, rows in records.items():
+                    board.publish(stream, dict([(key, value) for key, value in rows[-1].items()\
+                                                if key != 'timestamp']), timestamp)
+                board.close()
+            except (IOError, OSError) as e:
+                if self.logger:
+                    self.logger.warning('Could not publish latest values: {}'.format(e))
+        snapshot.duration = time.time() - start
+        if self.logger:
+            self.logger.debug('Cycle of {} zones took {:.3f} s'.format(len(self.zones), snapshot.duration))
+        return snapshot
+
+    def run(self, interval=60., duration=None):
+        end = time.time() + duration if duration else None
+        next_cycle = time.time()
+        while end is None or time.time() < end:
+            self.cycle()
+            next_cycle += interval
+            time.sleep(max(next_cycle - time.time(), 0))
+
+
+##-------------------------------------------------------------------------
+## Scaling Benchmark on Simulated Zones
+##-------------------------------------------------------------------------
+def benchmark(zone_counts=[1, 2, 4, 8], probes_per_zone=3, cycles=2, resolution=10):
+    '''Time a cycle of N simulated zones, with and without bulk conversion.
+    '''
+    import simulator.w1
+    print('{:>6s} {:>7s} {:>16s} {:>12s}'.format('zones', 'probes', 'one at a time (s)', 'bulk (s)'))
+    for count in zone_counts:
+        probes = dict([('28-{:012x}'.format(i), 3. + i % 5) for i in range(count*probes_per_zone)])
+        names = sorted(probes.keys())
+        zones = [Zone({'name': 'zone{}'.format(z), 'relay_pin': z,
+                       'probes': names[z*probes_per_zone:(z+1)*probes_per_zone],
+                       'temp_low': 38., 'temp_high': 42.}) for z in range(count)]
+        times = []
+        for bulk in [False, True]:
+            root = tempfile.mkdtemp()
+            bus = simulator.w1.FakeW1(root, probes=probes, bulk=bulk).start()
+            try:
+                controller = Controller(zones, w1_root=root, relay=lambda state, pin: None,\
+                                        resolution=resolution, publish=False)
+                start = time.time()
+                for i in range(cycles):
+                    snapshot = controller.cycle()
+                    assert len(snapshot.values) == len(probes), snapshot.errors
+                times.append((time.time() - start) / cycles)
+            finally:
+                bus.stop()
+                shutil.rmtree(root)
+        print('{:6d} {:7d} {:16.3f} {:12.3f}'.format(count, len(probes), times[0], times[1]))
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Control several fridges and chambers from one process.")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--once",
+        action="store_true", dest="once",
+        default=False, help="Run a single cycle and exit (e.g. from cron).")
+    parser.add_argument("--benchmark",
+        action="store_true", dest="benchmark",
+        default=False, help="Time cycles of simulated zones against the zone count.")
+    ## add arguments
+    parser.add_argument("--zones",
+        type=str, dest="zones", default=ZonesFile,
+        help="JSON file of zones (default = {})".format(ZonesFile))
+    parser.add_argument("--db",
+        type=str, dest="db", default=None,
+        help="SQLite store to write each zone's stream to.")
+    parser.add_argument("--logdir",
+        type=str, dest="logdir", default=LogDirectory,
+        help="Directory for the relay event logs (default = {})".format(LogDirectory))
+    parser.add_argument("--interval",
+        type=float, dest="interval", default=60.,
+        help="Seconds between cycles (default = 60)")
+    parser.add_argument("--resolution",
+        type=int, dest="resolution", default=10,
+        help="DS18B20 resolution in bits (default = 10)")
+    parser.add_argument("--zone-counts",
+        type=int, nargs='+', dest="zone_counts", default=[1, 2, 4, 8],
+        help="Zone counts for --benchmark (default = 1 2 4 8)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(zone_counts=args.zone_counts, resolution=args.resolution)
+        return
+
+    logger = LogSetup.get_logger('ZoneController', verbose=args.verbose,\
+             logfile=os.path.join(args.logdir, 'ZoneLog_%Y%m%d.txt'))
+    zones = read_zones(args.zones)
+    controller = Controller(zones, db=args.db, logdir=args.logdir,\
+                            resolution=args.resolution, logger=logger)
+    logger.info('Controlling {} ({} bulk conversion)'.format(', '.join([zone.name for zone in zones]),\
+                'with' if controller.bulk else 'without'))
+    if args.once:
+        controller.cycle()
+        return
+    ## A service is stopped with SIGTERM, which would otherwise end the
+    ## process without switching the relays off below
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        controller.run(interval=args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for zone in zones:
+            controller.relay(False, pin=zone.relay_pin)
+        logger.info('Relays switched off')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import sys
+import os
+import argparse
+import json
+import re
+import subprocess
+import time
+
+
+## Modules behind each entry point
+EntryPoints = ['Kegerator', 'HumidityMonitor', 'DSLR_Control', 'CloudSensor',
+               'read_temp', 'DHT22', 'DS18B20', 'Carriots']
+
+
+##-------------------------------------------------------------------------
+## Measure Import Time
+##-------------------------------------------------------------------------
+def import_time(module, python=sys.executable):
+    '''Import a module in a fresh interpreter with -X importtime.
+
+    Returns the cumulative import time of the module in seconds (None if the
+    import failed) and a list of (cumulative seconds, name) for every top
+    level package it pulled in, slowest first.
+    '''
+    process = subprocess.Popen([python, '-X', 'importtime', '-c', 'import {}'.format(module)],\
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,\
+                               universal_newlines=True,\
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    output, errors = process.communicate()
+    total = None
+    packages = {}
+    for line in errors.splitlines():
+        MatchObj = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)', line)
+        if not MatchObj:
+            continue
+        cumulative = int(MatchObj.group(2)) / 1e6
+        depth = len(MatchObj.group(3)) - 1
+        name = MatchObj.group(4)
+        if name == module and depth == 0:
+            total = cumulative
+        elif depth <= 2 and name not in ['site', 'encodings']:
+            top = name.split('.')[0]
+            packages[top] = max(packages.get(top, 0), cumulative)
+    if process.returncode != 0:
+        total = None
+    slowest = sorted([(seconds, name) for name, seconds in packages.items()], reverse=True)
+    return total, slowest
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Report the import time of each entry point module.")
+    ## add arguments
+    parser.add_argument("--runs",
+        type=int, dest="runs", default=3,
+        help="Imports per module; the fastest is reported (default = 3)")
+    parser.add_argument("--top",
+        type=int, dest="top", default=3,
+        help="Number of slowest imported packages to list (default = 3)")
+    parser.add_argument("--history",
+        type=str, dest="history", default="importtime_history.json",
+        help="File recording results of previous runs for comparison.")
+    parser.add_argument("modules", nargs='*', default=EntryPoints,
+        help="Modules to measure (default = all entry points)")
+    args = parser.parse_args()
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, 'r') as FO:
+            history = json.load(FO)
+    previous = history[-1]['results'] if len(history) > 0 else {}
+
+    results = {}
+    print('{:>16s} {:>9s} {:>9s}  {}'.format('module', 'time (s)', 'change', 'slowest imports'))
+    for module in args.modules:
+        runs = [import_time(module) for i in range(args.runs)]
+        runs = [run for run in runs if run[0] is not None]
+        if len(runs) == 0:
+            print('{:>16s} {:>9s}'.format(module, 'failed'))
+            continue
+        total, slowest = min(runs)
+        results[module] = total
+        change = '' if module not in previous else '{:+.3f}'.format(total - previous[module])
+        print('{:>16s} {:9.3f} {:>9s}  {}'.format(module, total, change,\
+              ', '.join(['{} {:.3f}'.format(name, seconds) for seconds, name in slowest[:args.top]])))
+
+    history.append({'time': time.strftime('%Y/%m/%d %H:%M:%S'), 'results': results})
+    with open(args.history, 'w') as FO:
+        json.dump(history, FO, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ import argparse
 import logging
 import time
 import picamera
+import LogSetup
 
 
 
@@ -36,23 +37,7 @@ def main():
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if args.verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-#     LogFileName = None
-#     LogFileHandler = logging.FileHandler(LogFileName)
-#     LogFileHandler.setLevel(logging.DEBUG)
-#     LogFileHandler.setFormatter(LogFormat)
-#     logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('picamera', verbose=args.verbose)
 
 
     ##-------------------------------------------------------------------------
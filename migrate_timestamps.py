@@ -0,0 +1,142 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import re
+import glob
+import shutil
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## Timestamp Conversion
+##-------------------------------------------------------------------------
+def to_timestamps(dates, times, utc_offset=-10):
+    '''Convert date and 'HH:MM:SS' time strings to integer microseconds since
+    the Unix epoch.
+
+    dates may be 'YYYYMMDD' or 'YYYY/MM/DD'.  The work is vectorized: the
+    times are sliced out of a fixed width character array and each distinct
+    date (there is usually only one per file) is parsed once.  utc_offset is
+    the offset of the local time the files were written in, in hours.
+    '''
+    if len(dates) == 0:
+        return np.zeros(0, dtype=np.int64)
+    times = np.array([val[:8] for val in times], dtype='S8')
+    chars = times.view(np.uint8).reshape(len(times), 8).astype(np.int64) - ord('0')
+    seconds = (chars[:,0]*10 + chars[:,1])*3600 + (chars[:,3]*10 + chars[:,4])*60\
+              + chars[:,6]*10 + chars[:,7]
+    unique, index = np.unique(np.array(dates), return_inverse=True)
+    days = np.array([np.datetime64('{}-{}-{}'.format(*re.match(r'(\d{4})/?(\d{2})/?(\d{2})', val).groups()), 'D')\
+                     for val in unique]).astype(np.int64)
+    return (days[index]*86400 + seconds - int(utc_offset*3600)) * 1000000
+
+
+##-------------------------------------------------------------------------
+## Kegerator Files
+##-------------------------------------------------------------------------
+def migrate_kegerator(lines, utc_offset=-10):
+    '''Convert the lines of an old Kegerator daily file (space delimited,
+    'date "time" AmbTemp ...') to the timestamp format.  Returns None if the
+    file is already converted.
+    '''
+    header = lines[0].split()
+    if header[0] == 'timestamp':
+        return None
+    assert header[0:2] == ['date', 'time'], 'Unrecognized header: {}'.format(lines[0].strip())
+    rows = [re.match(r'(\S+)\s+"?(\d\d:\d\d:\d\d)[^"]*"?\s+(.*)', line).groups()\
+            for line in lines[1:] if line.strip()]
+    timestamps = to_timestamps([row[0] for row in rows], [row[1] for row in rows],\
+                               utc_offset=utc_offset)
+    output = [' '.join(['timestamp'] + header[2:]) + '\n']
+    output.extend(['{} {}\n'.format(timestamp, row[2].strip())\
+                   for timestamp, row in zip(timestamps, rows)])
+    return output
+
+
+##-------------------------------------------------------------------------
+## HumidityMonitor Files
+##-------------------------------------------------------------------------
+def migrate_humidity(lines, utc_offset=-10):
+    '''Convert the lines of an old HumidityMonitor log ('YYYY/MM/DD,HH:MM:SS
+    HST,...') to the timestamp format.  Returns None if the file is already
+    converted.
+    '''
+    if lines[0].startswith('# timestamp'):
+        return None
+    rows = [line.strip('\n').split(',', 2) for line in lines if line[0] != '#' and line.strip()]
+    timestamps = to_timestamps([row[0] for row in rows], [row[1] for row in rows],\
+                               utc_offset=utc_offset)
+    output = ['# {},{},{},{},{}\n'.format('timestamp (us)', 'temperature (F)', 'humidity (%)',\
+                                          'absolute humidity (g/m^3)', 'status')]
+    output.extend(['{},{}\n'.format(timestamp, row[2])\
+                   for timestamp, row in zip(timestamps, rows)])
+    return output
+
+
+def migrate_file(filename, utc_offset=-10, backup='.orig'):
+    '''Convert a file in place, keeping a copy of the original.  Returns the
+    number of rows converted, or None if the file was skipped.
+    '''
+    with open(filename, 'r') as FO:
+        lines = FO.readlines()
+    if len(lines) == 0:
+        return None
+    if re.match(r'\d{8}_log\.txt$', os.path.basename(filename)):
+        output = migrate_humidity(lines, utc_offset=utc_offset)
+    else:
+        output = migrate_kegerator(lines, utc_offset=utc_offset)
+    if output is None:
+        return None
+    if backup and not os.path.exists(filename+backup):
+        shutil.copy2(filename, filename+backup)
+    with open(filename+'.tmp', 'w') as FO:
+        FO.writelines(output)
+    os.rename(filename+'.tmp', filename)
+    return len(output) - 1
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Convert old daily data files to epoch microsecond timestamps.")
+    ## add arguments
+    parser.add_argument("--utc-offset",
+        type=float, dest="utc_offset", default=-10,
+        help="UTC offset in hours of the time zone the files were written in (default = -10, HST)")
+    parser.add_argument("--no-backup",
+        action="store_true", dest="no_backup",
+        default=False, help="Do not keep a .orig copy of each converted file.")
+    parser.add_argument("files", nargs='*',
+        default=glob.glob(os.path.join('/', 'var', 'log', 'Kegerator', '[0-9]'*8+'.txt'))\
+              + glob.glob(os.path.join('/', 'home', 'joshw', 'logs', '[0-9]'*8+'_log.txt')),
+        help="Files to convert (default = all Kegerator and HumidityMonitor day files)")
+    args = parser.parse_args()
+
+    converted = 0
+    for filename in sorted(args.files):
+        try:
+            rows = migrate_file(filename, utc_offset=args.utc_offset,\
+                                backup=None if args.no_backup else '.orig')
+        except (AssertionError, AttributeError, ValueError) as e:
+            print('{}: failed ({})'.format(filename, e))
+            continue
+        if rows is None:
+            print('{}: skipped'.format(filename))
+        else:
+            converted += 1
+            print('{}: {} rows converted'.format(filename, rows))
+    print('Converted {} of {} files'.format(converted, len(args.files)))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,8 @@ import logging
 import subprocess
 import re
 
-import RPi.GPIO as GPIO
-
-import DHT22
-import DS18B20
+import Sampler
+import LogSetup
 
 
 ##-------------------------------------------------------------------------
@@ -33,6 +31,9 @@ def main():
     parser.add_argument("-v", "--verbose",
         action="store_true", dest="verbose",
         default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--latest",
+        action="store_true", dest="latest",
+        default=False, help="Print the latest published values without reading the sensors.")
     ## add arguments
     parser.add_argument("--input",
         type=str, dest="input",
@@ -42,41 +43,47 @@ def main():
     ##-------------------------------------------------------------------------
     ## Create logger object
     ##-------------------------------------------------------------------------
-    logger = logging.getLogger('MyLogger')
-    logger.setLevel(logging.DEBUG)
-    ## Set up console output
-    LogConsoleHandler = logging.StreamHandler()
-    if args.verbose:
-        LogConsoleHandler.setLevel(logging.DEBUG)
-    else:
-        LogConsoleHandler.setLevel(logging.INFO)
-    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
-    LogConsoleHandler.setFormatter(LogFormat)
-    logger.addHandler(LogConsoleHandler)
-    ## Set up file output
-#     LogFileName = None
-#     LogFileHandler = logging.FileHandler(LogFileName)
-#     LogFileHandler.setLevel(logging.DEBUG)
-#     LogFileHandler.setFormatter(LogFormat)
-#     logger.addHandler(LogFileHandler)
+    logger = LogSetup.get_logger('read_temp', verbose=args.verbose)
+
+    import LatestBoard
+    if args.latest:
+        now = time.time()
+        try:
+            board = LatestBoard.Board(readonly=True)
+        except (IOError, OSError):
+            ## Nothing has been published yet
+            return
+        for name, (values, timestamp) in sorted(board.read_all().items()):
+            logger.info('{} ({:.0f} s old): {}'.format(name, now - timestamp/1e6,\
+                        ', '.join(['{} = {}'.format(key, values[key]) for key in sorted(values)])))
+        board.close()
+        return
 
 #     os.system('modprobe w1-gpio')
 #     os.system('modprobe w1-therm')
 
     ##-------------------------------------------------------------------------
-    ## Read DS18B20 Temperature Sensors
-    ##-------------------------------------------------------------------------
-    temps = DS18B20.read()
-    for temp in temps:
-        logger.info('Temperature (DS18B20) = {:.1f} F'.format(temp))
-    
+    ## Read DS18B20 and DHT22 Sensors Concurrently
     ##-------------------------------------------------------------------------
-    ## Read DHT22 Temperature and Humidity Sensor
-    ##-------------------------------------------------------------------------
-    temp_DHT, humidity = DHT22.read()
-    logger.info('Temperature (DHT22) = {:.1f} F'.format(temp_DHT))
-    logger.info('Humidity (DHT22) = {:.0f} %'.format(humidity))
-
+    ## Go through the sensor broker when it is running
+    import SensorBroker
+    engine = Sampler.SamplingEngine(SensorBroker.broker_sensors([Sampler.DHT22Sensor(name='DHT22')] +\
+                                    Sampler.ds18b20_sensors()), logger=logger)
+    snapshot = engine.sample()
+    logger.info('At {} ({:.2f} s)'.format(snapshot.time(), snapshot.duration))
+    try:
+        board = LatestBoard.Board()
+        board.publish_snapshot(snapshot)
+        board.close()
+    except (IOError, OSError) as e:
+        logger.warning('Could not publish latest values: {}'.format(e))
+    for sensor in engine.sensors:
+        if sensor.name != 'DHT22' and sensor.name in snapshot.values:
+            logger.info('Temperature (DS18B20 {}) = {:.1f} F'.format(sensor.name,\
+                        snapshot.get(sensor.name, 'temperature_F')))
+    if 'DHT22' in snapshot.values:
+        logger.info('Temperature (DHT22) = {:.1f} F'.format(snapshot.get('DHT22', 'temperature_F')))
+        logger.info('Humidity (DHT22) = {:.0f} %'.format(snapshot.get('DHT22', 'humidity')))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,269 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import re
+import time
+
+import Archive
+import humiditycalc
+import SensorStore
+import LogSetup
+
+
+## Day files of each kind of log
+DayFiles = {'kegerator': os.path.join('/', 'var', 'log', 'Kegerator', '[0-9]'*8+'.txt'),
+            'humidity': os.path.join('/', 'home', 'joshw', 'logs', '[0-9]'*8+'_log.txt')}
+
+
+def F_to_C(temperature_F):
+    return (temperature_F - 32.)*5./9.
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+##-------------------------------------------------------------------------
+## Reprocess One Day
+##-------------------------------------------------------------------------
+def reprocess_kegerator(lines, settings):
+    '''Recompute AH and the relay status of a Kegerator day from its
+    temperatures and humidity.  The relay is replayed with the thresholds in
+    settings, starting from the status logged on the day's first row.
+    '''
+    rows = []
+    status = None
+    for line in lines:
+        fields = line.split()
+        timestamp = Archive.line_timestamp(line)
+        if timestamp is None or len(fields) < 9:
+            continue
+        AmbTemp, KegTemp, KegTemp1, KegTemp2, KegTemp3, RH = [to_float(val) for val in fields[1:7]]
+        if status is None:
+            status = fields[8]
+        if KegTemp > settings['temp_high']:
+            status = 'On'
+        elif KegTemp < settings['temp_low']:
+            status = 'Off'
+        AH = humiditycalc.relative_to_absolute_humidity(F_to_C(AmbTemp), RH)\
+             if not (math.isnan(AmbTemp) or math.isnan(RH)) else float('nan')
+        rows.append({'timestamp': timestamp, 'AmbTemp': AmbTemp, 'KegTemp': KegTemp,
+                     'KegTemp1': KegTemp1, 'KegTemp2': KegTemp2, 'KegTemp3': KegTemp3,
+                     'RH': RH, 'AH': AH, 'status': status})
+    return rows
+
+
+def reprocess_humidity(lines, settings):
+    '''Recompute AH and the threshold status of a HumidityMonitor day.
+    ALARM is raised by the stateful rules engine, so it is not recomputed
+    here; rows which were in ALARM keep it.
+    '''
+    rows = []
+    for line in lines:
+        if line[0] == '#' or not line.strip():
+            continue
+        fields = line.strip('\n').split(',')
+        temperature_F, humidity = float(fields[1]), float(fields[2])
+        if humidity < settings['threshold_humid']:
+            status = 'OK'
+        elif humidity < settings['threshold_wet']:
+            status = 'HUMID'
+        else:
+            status = 'WET'
+        if fields[4] == 'ALARM':
+            status = 'ALARM'
+        rows.append({'timestamp': int(fields[0]), 'temperature_F': temperature_F,
+                     'humidity': humidity,
+                     'AH': humiditycalc.relative_to_absolute_humidity(F_to_C(temperature_F), humidity),
+                     'status': status})
+    return rows
+
+
+def aggregate(kind, date, rows):
+    '''Daily summary of reprocessed rows.
+    '''
+    import numpy as np
+    summary = {'timestamp': SensorStore.day_range(date)[0], 'samples': len(rows)}
+    channels = ['KegTemp', 'AmbTemp', 'RH', 'AH'] if kind == 'kegerator' else ['temperature_F', 'humidity', 'AH']
+    for channel in channels:
+        values = np.array([row[channel] for row in rows], dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values):
+            summary[channel+'_min'] = float(values.min())
+            summary[channel+'_mean'] = float(values.mean())
+            summary[channel+'_max'] = float(values.max())
+    if kind == 'kegerator':
+        import DutyCycle
+        states = np.array([DutyCycle.RelayStates.get(row['status'], -1) for row in rows], dtype=np.int8)
+        metrics = DutyCycle.analyse(np.array([row['timestamp'] for row in rows])/1e6,\
+                                    np.array([row['KegTemp'] for row in rows]), states)
+        summary['on_fraction'] = float(metrics['on_fraction'])
+        summary['cycles_per_hour'] = float(metrics['cycles_per_hour'])
+    else:
+        for status in ['OK', 'HUMID', 'WET', 'ALARM']:
+            summary[status] = len([row for row in rows if row['status'] == status])
+    return summary
+
+
+def reprocess_day(job):
+    '''Worker: reprocess one day file.  Returns (path, kind, rows, summary).
+    '''
+    path, kind, settings = job
+    date = re.match(r'(\d{8})', os.path.basename(path)).group(1)
+    lines = Archive.read_lines(path)
+    if kind == 'kegerator':
+        rows = reprocess_kegerator(lines, settings)
+    else:
+        rows = reprocess_humidity(lines, settings)
+    return path, kind, rows, aggregate(kind, date, rows) if rows else None
+
+
+##-------------------------------------------------------------------------
+## Checkpoint
+##-------------------------------------------------------------------------
+class Checkpoint(object):
+    '''The day files already written to the output store.  Saved after every
+    day, so an interrupted run resumes where it stopped.  Days are written
+    with INSERT OR REPLACE, so redoing a day after a crash between the store
+    commit and the checkpoint is harmless.
+    '''
+    def __init__(self, path, settings):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'r') as FO:
+                state = json.load(FO)
+            ## Different settings mean every day must be redone
+            if state.get('settings') == settings:
+                self.done = set(state['done'])
+        self.settings = settings
+
+    def add(self, path):
+        self.done.add(path)
+        with open(self.path+'.tmp', 'w') as FO:
+            json.dump({'settings': self.settings, 'done': sorted(self.done)}, FO)
+        os.rename(self.path+'.tmp', self.path)
+
+
+def day_files(kinds, start=None, end=None):
+    files = []
+    for kind in kinds:
+        paths = set()
+        for filename in glob.glob(DayFiles[kind]) + glob.glob(DayFiles[kind]+Archive.Extension):
+            path = filename[:-len(Archive.Extension)] if filename.endswith(Archive.Extension) else filename
+            date = os.path.basename(path)[:8]
+            if (start is None or date >= start) and (end is None or date <= end):
+                paths.add(path)
+        files.extend([(path, kind) for path in sorted(paths)])
+    return files
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    import Kegerator
+    import HumidityMonitor
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Recompute AH, statuses and daily aggregates of the historical logs.")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("--restart",
+        action="store_true", dest="restart",
+        default=False, help="Ignore the checkpoint and reprocess every day.")
+    ## add arguments
+    parser.add_argument("--db",
+        type=str, dest="db", required=True,
+        help="SQLite store to write the results to.")
+    parser.add_argument("--kind",
+        type=str, dest="kind", choices=['kegerator', 'humidity', 'all'], default='all',
+        help="Which logs to reprocess (default = all)")
+    parser.add_argument("--start",
+        type=str, dest="start", default=None,
+        help="First day, YYYYMMDD (default = the first day logged)")
+    parser.add_argument("--end",
+        type=str, dest="end", default=None,
+        help="Last day, YYYYMMDD (default = the last day logged)")
+    parser.add_argument("--workers",
+        type=int, dest="workers", default=multiprocessing.cpu_count(),
+        help="Worker processes (default = number of CPUs)")
+    parser.add_argument("--temp-high",
+        type=float, dest="temp_high", default=Kegerator.temp_high,
+        help="Relay on above this temperature (default = {})".format(Kegerator.temp_high))
+    parser.add_argument("--temp-low",
+        type=float, dest="temp_low", default=Kegerator.temp_low,
+        help="Relay off below this temperature (default = {})".format(Kegerator.temp_low))
+    parser.add_argument("--threshold-humid",
+        type=float, dest="threshold_humid", default=HumidityMonitor.threshold_humid,
+        help="HUMID at or above this humidity (default = {})".format(HumidityMonitor.threshold_humid))
+    parser.add_argument("--threshold-wet",
+        type=float, dest="threshold_wet", default=HumidityMonitor.threshold_wet,
+        help="WET at or above this humidity (default = {})".format(HumidityMonitor.threshold_wet))
+    parser.add_argument("--checkpoint",
+        type=str, dest="checkpoint", default=None,
+        help="Checkpoint file (default = the store name + .checkpoint)")
+    parser.add_argument("files", nargs='*',
+        help="Day files to reprocess (default = every day file of --kind)")
+    args = parser.parse_args()
+
+    logger = LogSetup.get_logger('reprocess', verbose=args.verbose)
+    settings = {'temp_high': args.temp_high, 'temp_low': args.temp_low,
+                'threshold_humid': args.threshold_humid, 'threshold_wet': args.threshold_wet}
+    checkpoint = Checkpoint(args.checkpoint or args.db+'.checkpoint', settings)
+    if args.restart:
+        checkpoint.done = set()
+    kinds = ['kegerator', 'humidity'] if args.kind == 'all' else [args.kind]
+    if args.files:
+        files = [(path[:-len(Archive.Extension)] if path.endswith(Archive.Extension) else path,\
+                  'humidity' if '_log' in os.path.basename(path) else 'kegerator')\
+                 for path in args.files]
+    else:
+        files = day_files(kinds, args.start, args.end)
+    files = [(path, kind) for path, kind in files if path not in checkpoint.done]
+    logger.info('Reprocessing {} day files ({} done already) with {} workers'.format(\
+                len(files), len(checkpoint.done), args.workers))
+
+    ## Workers parse and compute; only this process writes to the store, one
+    ## transaction per day, in whatever order the days finish
+    store = SensorStore.Store(args.db)
+    pool = multiprocessing.Pool(args.workers)
+    begin = last_report = time.time()
+    total = 0
+    try:
+        for i, (path, kind, rows, summary) in enumerate(pool.imap_unordered(\
+                reprocess_day, [(path, kind, settings) for path, kind in files])):
+            if rows:
+                store.write_cycle({kind: rows, kind+'_daily': [summary]})
+            checkpoint.add(path)
+            total += len(rows)
+            logger.debug('{}: {} rows'.format(path, len(rows)))
+            if time.time() - last_report > 10. or i == len(files) - 1:
+                last_report = time.time()
+                logger.info('{}/{} days, {} rows, {:.0f} rows/s'.format(i+1, len(files), total,\
+                            total/max(time.time() - begin, 1e-6)))
+    finally:
+        pool.terminate()
+        store.close()
+    logger.info('Reprocessed {} rows in {:.1f} s ({:.0f} rows/s)'.format(total, time.time() - begin,\
+                total/max(time.time() - begin, 1e-6)))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,31 @@ setup(
     version = "0.2.1",
     author='Josh Walawender',
     packages = find_packages(),
+    py_modules = ['Carriots', 'CloudSensor', 'DHT22', 'DS18B20', 'DSLR_Control',
+                  'HumidityMonitor', 'Kegerator', 'humiditycalc', 'read_temp',
+                  'AutoExposure', 'LogSetup', 'Sampler', 'SensorStore', 'migrate_timestamps',
+                  'Dashboard', 'PlotRenderer', 'Rules', 'Filters',
+                  'Archive', 'Uploader', 'Samples', 'LatestBoard',
+                  'SensorBroker', 'ControlCycle', 'EventLog',
+                  'DutyCycle', 'reprocess', 'ZoneController', 'Collector'],
     entry_points = {
         'console_scripts': [
             'measurehumidity = HumidityMonitor:main',
             'plothumidity = HumidityMonitor:plot',
+            'kegerator = Kegerator:cli',
+            'readtemp = read_temp:main',
+            'sensordashboard = Dashboard:main',
+            'plotrenderer = PlotRenderer:main',
+            'archivelogs = Archive:main',
+            'carriotsuploader = Uploader:main',
+            'sensorbroker = SensorBroker:main',
+            'cyclestats = ControlCycle:main',
+            'eventlog = EventLog:main',
+            'dutycycle = DutyCycle:main',
+            'reprocesslogs = reprocess:main',
+            'zonecontroller = ZoneController:main',
+            'collector = Collector:main',
+            'hardwarebench = simulator.bench:main',
         ]
     }
 )
@@ -0,0 +1,62 @@
+'''Simulated hardware for exercising the RasPi projects away from a Pi.
+
+    w1       FakeW1, a fake /sys/bus/w1/devices tree of DS18B20 probes
+    gpio     a fake RPi.GPIO
+    dht      a fake Adafruit_DHT
+    aag      FakeAAG, an AAG cloud sensor on a pseudo terminal
+    camera   a fake picamera producing synthetic frames
+    gphoto2  FakeGphoto2, a fake gphoto2 executable and camera
+    faults   Faults, the injectable faults shared by all of them
+    bench    times each pipeline against the fakes (python -m simulator.bench)
+
+install() puts the fake modules in sys.modules under the names the
+projects import, so the code under test runs unchanged.  Every fake models
+the latency of the real device (scaled by simulator.faults.time_scale)
+and takes a Faults to inject errors.
+'''
+
+from __future__ import division, print_function
+
+## Import General Tools
+import sys
+import types
+import importlib.util
+
+
+## The fake modules put in sys.modules by install()
+installed = {}
+
+
+def install(serial=None):
+    '''Make RPi.GPIO, Adafruit_DHT and picamera import the fakes.  A serial
+    module backed by simulator.aag.Port is installed too if pyserial is not
+    available (or serial=True); FakeAAG works with the real one.  Returns
+    the names installed.
+    '''
+    import simulator.gpio
+    import simulator.dht
+    import simulator.camera
+    RPi = types.ModuleType('RPi')
+    RPi.GPIO = simulator.gpio
+    modules = {'RPi': RPi, 'RPi.GPIO': simulator.gpio,
+               'Adafruit_DHT': simulator.dht, 'picamera': simulator.camera}
+    if serial is None:
+        serial = importlib.util.find_spec('serial') is None
+    if serial:
+        import simulator.aag
+        fake = types.ModuleType('serial')
+        fake.Serial = simulator.aag.Port
+        fake.SerialException = IOError
+        modules['serial'] = fake
+    sys.modules.update(modules)
+    installed.update(modules)
+    return sorted(modules.keys())
+
+
+def uninstall():
+    '''Remove the fake modules installed by install().
+    '''
+    for name, module in list(installed.items()):
+        if sys.modules.get(name) is module:
+            del sys.modules[name]
+        del installed[name]
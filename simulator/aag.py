@@ -0,0 +1,181 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import fcntl
+import math
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+
+from simulator.faults import Faults, sleep
+
+
+##-------------------------------------------------------------------------
+## Fake AAG Cloud Sensor on a Pseudo Terminal
+##-------------------------------------------------------------------------
+class FakeAAG(object):
+    '''An AAG CloudWatcher answering on a pseudo terminal.
+
+    device is the name of the slave end (e.g. /dev/pts/3), which the real
+    serial code opens in place of /dev/ttyAMA0.  Commands are a letter
+    followed by '!'.  Each answer is one or more 15 byte blocks ('!', a two
+    character code, a twelve character value) followed by the handshake
+    block '!', XON and twelve spaces, '0':
+        S! sky temperature (1/100 C)      T! ambient temperature (1/100 C)
+        C! zener, LDR and rain sensor     Q! heater PWM
+        D! error counters E1 to E4        F! safe (X) / unsafe (Y) switch
+    The device thinks for latency seconds and then sends at baud, 10 bits
+    per byte, so a sky temperature query takes about 130 ms as on a real
+    unit.
+
+    faults (a simulator.faults.Faults) understands 'timeout' (no answer),
+    'garbage' (random bytes before the answer), 'truncated' (the answer is
+    cut short) and 'corrupt' (a block with a bad code character).
+    '''
+    def __init__(self, sky_temperature=-20., ambient_temperature=15., rain_temperature=20.,\
+                 safe=True, noise=0.2, latency=0.1, baud=9600, faults=None):
+        self.sky_temperature = sky_temperature
+        self.ambient_temperature = ambient_temperature
+        self.rain_temperature = rain_temperature
+        self.safe = safe
+        self.noise = noise
+        self.latency = latency
+        self.baud = baud
+        self.faults = faults or Faults()
+        self.queries = 0
+        self.master = None
+        self.slave = None
+        self.device = None
+        self.running = False
+        self.thread = None
+
+    def block(self, code, value):
+        return '!{:<2s}{:>12s}'.format(code, str(value))
+
+    def handshake(self):
+        return '!' + chr(17) + ' '*12 + '0'
+
+    def answer(self, command):
+        '''Return the blocks answering a command, or None if it is unknown.
+        '''
+        gauss = lambda: self.faults.random.gauss(0, self.noise)
+        if command == 'S':
+            return self.block('1', int(round((self.sky_temperature + gauss())*100)))
+        if command == 'T':
+            return self.block('2', int(round((self.ambient_temperature + gauss())*100)))
+        if command == 'C':
+            ## Inverse of the conversions in CloudSensor.AAG_GetValues
+            zener = int(round(1023. * 3. / 12.))
+            ldr = int(round(1023. / (56. / 2000. + 1)))
+            R = math.exp(3450. * (1. / (273.15 + self.rain_temperature) - 1. / 298.15))
+            rain = int(round(1023. / (1. / R + 1)))
+            return self.block('6', zener) + self.block('4', ldr) + self.block('5', rain)
+        if command == 'Q':
+            return self.block('Q', 512)
+        if command == 'D':
+            return ''.join([self.block('E{}'.format(i), 0) for i in range(1, 5)])
+        if command == 'F':
+            return self.block('X' if self.safe else 'Y', '')
+        return None
+
+    def send(self, data):
+        for i in range(0, len(data), 15):
+            chunk = data[i:i+15]
+            sleep(len(chunk) * 10. / self.baud)
+            os.write(self.master, chunk)
+
+    def start(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def serve(self):
+        buffer = ''
+        while self.running:
+            ready = select.select([self.master], [], [], 0.05)[0]
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master, 64).decode('latin-1')
+            except OSError:
+                break
+            while '!' in buffer:
+                command, buffer = buffer.split('!', 1)
+                command = command[-1:]
+                response = self.answer(command)
+                if response is None:
+                    continue
+                self.queries += 1
+                fault = self.faults.next()
+                sleep(self.latency)
+                if fault == 'timeout':
+                    continue
+                data = (response + self.handshake()).encode('latin-1')
+                if fault == 'garbage':
+                    data = self.faults.garbage(self.faults.random.randint(1, 15)) + data
+                elif fault == 'truncated':
+                    data = data[:self.faults.random.randint(1, len(data) - 1)]
+                elif fault == 'corrupt':
+                    data = data[:1] + b'?' + data[2:]
+                self.send(data)
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(1.)
+        for fd in [self.master, self.slave]:
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+##-------------------------------------------------------------------------
+## Minimal Serial Port
+##-------------------------------------------------------------------------
+class Port(object):
+    '''The part of serial.Serial which CloudSensor uses (write, read with a
+    timeout, inWaiting, close), working in str as the CloudSensor code does.
+    For driving a FakeAAG where pyserial is not installed; with pyserial
+    use serial.Serial(aag.device, 9600, timeout=2) as on the Pi.
+    '''
+    def __init__(self, device, baudrate=9600, timeout=2.):
+        self.fd = os.open(device, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.fd)
+        self.timeout = timeout
+
+    def write(self, data):
+        return os.write(self.fd, data.encode('latin-1') if not isinstance(data, bytes) else data)
+
+    def inWaiting(self):
+        return struct.unpack('i', fcntl.ioctl(self.fd, termios.FIONREAD, b'\0'*4))[0]
+
+    def read(self, size=1):
+        data = b''
+        end = time.time() + self.timeout
+        while len(data) < size:
+            remaining = end - time.time()
+            if remaining <= 0 or not select.select([self.fd], [], [], remaining)[0]:
+                break
+            data += os.read(self.fd, size - len(data))
+        return data.decode('latin-1')
+
+    def close(self):
+        os.close(self.fd)
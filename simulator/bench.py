@@ -0,0 +1,258 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import argparse
+import io
+import shutil
+import subprocess
+import tempfile
+import time
+
+import simulator
+import simulator.faults
+from simulator.faults import Faults
+
+
+## Faults injected into each pipeline, as shares of the fault rate
+FaultMix = {'w1': {'crc': 0.5, 'reset': 0.2, 'missing': 0.2, 'timeout': 0.1},
+            'dht': {'checksum': 0.6, 'timeout': 0.2, 'garbage': 0.2},
+            'aag': {'timeout': 0.25, 'garbage': 0.25, 'truncated': 0.25, 'corrupt': 0.25},
+            'relay': {'stuck': 1.},
+            'picamera': {'timeout': 0.2, 'mmal': 0.4, 'truncated': 0.4},
+            'dslr': {'timeout': 0.1, 'busy': 0.4, 'nodevice': 0.2, 'garbage': 0.3}}
+
+
+def faults_for(pipeline, rate, seed=None):
+    return Faults(seed=seed, **dict([(name, share*rate) for name, share in FaultMix[pipeline].items()]))
+
+
+class Result(object):
+    '''Operations run, their total time, the errors the code under test
+    reported, the bad values it let through, and the faults injected.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.operations = 0
+        self.elapsed = 0.
+        self.errors = 0
+        self.bad = 0
+        self.injected = 'none'
+
+    def report(self):
+        print('{:10s} {:6d} {:9.4f} {:7d} {:5d}  {}'.format(self.name, self.operations,\
+              self.elapsed / max(self.operations, 1), self.errors, self.bad, self.injected))
+
+
+##-------------------------------------------------------------------------
+## Pipelines
+##-------------------------------------------------------------------------
+def bench_w1(cycles, rate, seed=None, interval=1.):
+    '''Sample four DS18B20 probes at 10 bits through the SamplingEngine, a
+    cycle every interval seconds.
+    '''
+    import Sampler
+    import simulator.w1
+    result = Result('ds18b20')
+    root = tempfile.mkdtemp()
+    probes = dict([('28-00000000000{}'.format(i), 3. + i) for i in range(4)])
+    bus = simulator.w1.FakeW1(root, probes=probes, faults=faults_for('w1', rate, seed)).start()
+    try:
+        engine = Sampler.SamplingEngine([Sampler.DS18B20Sensor(os.path.join(root, probe), resolution=10)\
+                                         for probe in sorted(probes)])
+        for i in range(cycles):
+            start = time.time()
+            snapshot = engine.sample()
+            result.elapsed += time.time() - start
+            result.operations += len(probes)
+            result.errors += len(snapshot.errors)
+            result.bad += len([values for values in snapshot.values.values()\
+                               if values['temperature_C'] >= 85.])
+            simulator.faults.sleep(start + interval - time.time())
+        result.injected = bus.faults.summary()
+    finally:
+        bus.stop()
+        shutil.rmtree(root)
+    return result
+
+
+def bench_dht(reads, rate, seed=None):
+    '''Read a DHT22 through Sampler.AdafruitDHTSensor, waiting the sensor's
+    minimum interval (not timed) between reads.
+    '''
+    import Sampler
+    import simulator.dht
+    result = Result('dht22')
+    simulator.dht.faults = faults_for('dht', rate, seed)
+    simulator.dht.last_read.clear()
+    sensor = Sampler.AdafruitDHTSensor(pin=4)
+    for i in range(reads):
+        start = time.time()
+        try:
+            values = sensor.read()
+            if not (0 <= values['humidity'] <= 100 and -40 <= values['temperature_C'] <= 80):
+                result.bad += 1
+        except IOError:
+            result.errors += 1
+        result.elapsed += time.time() - start
+        result.operations += 1
+        simulator.faults.sleep(simulator.dht.min_interval)
+    result.injected = simulator.dht.faults.summary()
+    return result
+
+
+def bench_aag(queries, rate, seed=None):
+    '''Query sky and ambient temperature through Sampler.AAGSensor.
+    '''
+    import Sampler
+    import simulator.aag
+    result = Result('aag')
+    aag = simulator.aag.FakeAAG(faults=faults_for('aag', rate, seed)).start()
+    try:
+        sensor = Sampler.AAGSensor(device=aag.device)
+        for i in range(queries):
+            start = time.time()
+            values = sensor.read()
+            result.elapsed += time.time() - start
+            result.operations += 1
+            if None in values.values():
+                result.errors += 1
+        sensor.AAG.close()
+        result.injected = aag.faults.summary()
+    finally:
+        aag.stop()
+    return result
+
+
+def bench_relay(switches, rate, seed=None):
+    '''Switch the kegerator relay through Kegerator.relay and read it back.
+    '''
+    import Kegerator
+    import simulator.gpio
+    result = Result('relay')
+    simulator.gpio.reset()
+    simulator.gpio.faults = faults_for('relay', rate, seed)
+    start = time.time()
+    for i in range(switches):
+        Kegerator.relay(i % 2 == 0)
+        if simulator.gpio.input(23) != (i % 2 == 0):
+            result.bad += 1
+    result.elapsed = time.time() - start
+    result.operations = switches
+    result.injected = simulator.gpio.faults.summary()
+    return result
+
+
+def bench_picamera(frames, rate, seed=None):
+    '''Capture full resolution raw RGB frames, as integrating_picamera does.
+    '''
+    import picamera
+    result = Result('picamera')
+    picamera.faults = faults_for('picamera', rate, seed)
+    width, height = 2592, 1944
+    fwidth, fheight = (width + 31) // 32 * 32, (height + 15) // 16 * 16
+    with picamera.PiCamera() as camera:
+        camera.resolution = (width, height)
+        for i in range(frames):
+            stream = io.BytesIO()
+            start = time.time()
+            try:
+                camera.capture(stream, 'rgb')
+                if len(stream.getvalue()) != fwidth * fheight * 3:
+                    result.bad += 1
+            except picamera.PiCameraError:
+                result.errors += 1
+            result.elapsed += time.time() - start
+            result.operations += 1
+    result.injected = picamera.faults.summary()
+    return result
+
+
+def bench_dslr(frames, rate, seed=None):
+    '''Discover a DSLR's capabilities and take RAW + JPEG exposures through
+    DSLR_Control.Camera and the fake gphoto2.
+    '''
+    import DSLR_Control
+    import simulator.gphoto2
+    result = Result('dslr')
+    directory = tempfile.mkdtemp()
+    fake = simulator.gphoto2.FakeGphoto2(directory, faults=faults_for('dslr', rate, seed)).start()
+    try:
+        camera = None
+        while camera is None:
+            start = time.time()
+            try:
+                camera = DSLR_Control.Camera(port='usb:001,001', gphoto=fake.path,\
+                                             cache_dir=os.path.join(directory, 'cache'))
+                camera.set_image_format(camera.raw_jpeg_format())
+            except (subprocess.CalledProcessError, AssertionError, KeyError):
+                camera = None
+                result.errors += 1
+                if os.path.exists(os.path.join(directory, 'cache')):
+                    shutil.rmtree(os.path.join(directory, 'cache'))
+            result.elapsed += time.time() - start
+            result.operations += 1
+        for i in range(frames):
+            start = time.time()
+            try:
+                files = camera.take_exposure(filename=os.path.join(directory, 'frame{:03d}'.format(i)))
+                if len(files) != 2:
+                    result.bad += 1
+            except subprocess.CalledProcessError:
+                result.errors += 1
+            result.elapsed += time.time() - start
+            result.operations += 1
+        state = fake.state()
+        result.injected = ', '.join(['{} {}'.format(name, state['injected'][name])\
+                                     for name in sorted(state['injected'])]) or 'none'
+    finally:
+        fake.stop()
+        shutil.rmtree(directory)
+    return result
+
+
+Pipelines = [('ds18b20', bench_w1), ('dht22', bench_dht), ('aag', bench_aag),
+             ('relay', bench_relay), ('picamera', bench_picamera), ('dslr', bench_dslr)]
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    parser = argparse.ArgumentParser(
+             description="Time each hardware pipeline against the simulated devices.")
+    ## add arguments
+    parser.add_argument("--fault-rate",
+        type=float, dest="fault_rate", default=0.05,
+        help="Fraction of device operations which fail (default = 0.05)")
+    parser.add_argument("--time-scale",
+        type=float, dest="time_scale", default=1.,
+        help="Multiply the simulated device delays by this (default = 1)")
+    parser.add_argument("--operations",
+        type=int, dest="operations", default=20,
+        help="Operations per pipeline (default = 20)")
+    parser.add_argument("--seed",
+        type=int, dest="seed", default=None,
+        help="Seed for the injected faults")
+    parser.add_argument("pipelines", nargs='*',
+        help="Pipelines to run (default = all: {})".format(', '.join([name for name, bench in Pipelines])))
+    args = parser.parse_args()
+
+    simulator.install()
+    simulator.faults.time_scale = args.time_scale
+    print('{:10s} {:>6s} {:>9s} {:>7s} {:>5s}  {}'.format('pipeline', 'ops', 's/op', 'errors', 'bad',\
+          'faults injected'))
+    for name, bench in Pipelines:
+        if not args.pipelines or name in args.pipelines:
+            bench(args.operations, args.fault_rate, args.seed).report()
+    simulator.uninstall()
+
+
+if __name__ == '__main__':
+    main()
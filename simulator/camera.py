@@ -0,0 +1,180 @@
+#!/usr/env/python
+
+'''A fake picamera.
+
+simulator.install() puts this module in sys.modules as picamera.  PiCamera
+captures synthetic frames: a smooth gradient of mean brightness scene
+(counts per microsecond of exposure at ISO 100, so the exposure settings
+matter) with shot noise, clipped to 8 bits.  'rgb', 'bgr' and
+'yuv' captures are padded to the 32x16 blocks of the real camera, 'jpeg'
+needs PIL.
+
+A still capture takes mode_switch seconds plus the exposure; a capture on
+the video port takes one frame time.
+
+faults (a simulator.faults.Faults) understands 'timeout' (a
+PiCameraRuntimeError after capture_timeout seconds), 'mmal' (a
+PiCameraMMALError, as when the GPU is out of resources) and 'truncated'
+(only part of the frame is written).
+'''
+
+from __future__ import division, print_function
+
+## Import General Tools
+import io
+
+import numpy as np
+
+from simulator.faults import Faults, sleep
+
+
+faults = Faults()
+scene = 2.
+mode_switch = 0.3
+capture_timeout = 5.
+captures = 0
+
+
+class PiCameraError(Exception):
+    pass
+
+
+class PiCameraValueError(PiCameraError, ValueError):
+    pass
+
+
+class PiCameraRuntimeError(PiCameraError, RuntimeError):
+    pass
+
+
+class PiCameraMMALError(PiCameraError):
+    pass
+
+
+def padded(width, height):
+    return (width + 31) // 32 * 32, (height + 15) // 16 * 16
+
+
+##-------------------------------------------------------------------------
+## Define Fake PiCamera Class
+##-------------------------------------------------------------------------
+class PiCamera(object):
+    MAX_RESOLUTION = (2592, 1944)
+
+    def __init__(self, resolution=None, framerate=30):
+        self._resolution = tuple(resolution or (1280, 720))
+        self.framerate = framerate
+        self.shutter_speed = 0
+        self.iso = 0
+        self.closed = False
+        self.previewing = False
+        self.random = np.random.RandomState(faults.random.randint(0, 2**31 - 1))
+
+    def _get_resolution(self):
+        return self._resolution
+
+    def _set_resolution(self, value):
+        width, height = value
+        if not (0 < width <= self.MAX_RESOLUTION[0] and 0 < height <= self.MAX_RESOLUTION[1]):
+            raise PiCameraValueError('Invalid resolution requested: {!r}'.format(value))
+        self._resolution = (int(width), int(height))
+
+    resolution = property(_get_resolution, _set_resolution)
+
+    @property
+    def exposure_speed(self):
+        '''The exposure time in microseconds.  In auto mode the exposure
+        aims for a mid grey frame, up to one frame time.
+        '''
+        if self.shutter_speed:
+            return self.shutter_speed
+        limit = int(1e6 / self.framerate)
+        return min(int(128. / (scene * (self.iso or 100) / 100.)), limit)
+
+    def start_preview(self):
+        self.previewing = True
+
+    def stop_preview(self):
+        self.previewing = False
+
+    def frame(self):
+        '''A synthetic (height, width, 3) uint8 frame at the current settings.
+        '''
+        width, height = self._resolution
+        counts = scene * self.exposure_speed * (self.iso or 100) / 100.
+        gradient = np.linspace(0.5, 1.5, width)[np.newaxis, :] * np.linspace(1.2, 0.8, height)[:, np.newaxis]
+        mean = counts * gradient
+        frame = mean + self.random.standard_normal(mean.shape) * np.sqrt(np.maximum(mean, 1.))
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+        return np.repeat(frame[:, :, np.newaxis], 3, axis=2)
+
+    def encode(self, frame, format):
+        height, width = frame.shape[:2]
+        fwidth, fheight = padded(width, height)
+        if format in ['rgb', 'bgr']:
+            data = np.zeros((fheight, fwidth, 3), dtype=np.uint8)
+            data[:height, :width] = frame if format == 'rgb' else frame[:, :, ::-1]
+            return data.tobytes()
+        if format == 'yuv':
+            Y = np.zeros((fheight, fwidth), dtype=np.uint8)
+            Y[:height, :width] = frame[:, :, 0]
+            UV = np.full((fheight // 2) * (fwidth // 2) * 2, 128, dtype=np.uint8)
+            return Y.tobytes() + UV.tobytes()
+        if format == 'jpeg':
+            try:
+                from PIL import Image
+            except ImportError:
+                raise PiCameraValueError('The simulated camera needs PIL for jpeg captures')
+            output = io.BytesIO()
+            Image.fromarray(frame).save(output, 'JPEG')
+            return output.getvalue()
+        raise PiCameraValueError('Invalid format {!r}'.format(format))
+
+    def capture(self, output, format=None, use_video_port=False, resize=None):
+        global captures
+        if self.closed:
+            raise PiCameraRuntimeError('Camera is closed')
+        if format is None:
+            if not isinstance(output, str):
+                raise PiCameraValueError('Unable to determine type from output')
+            extension = output.rsplit('.', 1)[-1].lower()
+            format = {'jpg': 'jpeg', 'data': 'rgb'}.get(extension, extension)
+        fault = faults.next()
+        if fault == 'timeout':
+            sleep(capture_timeout)
+            raise PiCameraRuntimeError('Timed out waiting for capture to end')
+        if fault == 'mmal':
+            raise PiCameraMMALError('Failed to enable connection: Out of resources')
+        if use_video_port:
+            sleep(1. / self.framerate)
+        else:
+            sleep(mode_switch + self.exposure_speed / 1e6)
+        if resize:
+            self._resolution, full = tuple(resize), self._resolution
+        try:
+            data = self.encode(self.frame(), format)
+        finally:
+            if resize:
+                self._resolution = full
+        if fault == 'truncated':
+            data = data[:len(data) // 3]
+        if isinstance(output, str):
+            with open(output, 'wb') as FO:
+                FO.write(data)
+        else:
+            output.write(data)
+        captures += 1
+
+    def capture_continuous(self, output, format=None, use_video_port=False, resize=None):
+        while True:
+            self.capture(output, format=format, use_video_port=use_video_port, resize=resize)
+            yield output
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,80 @@
+#!/usr/env/python
+
+'''A fake Adafruit_DHT library.
+
+simulator.install() puts this module in sys.modules as Adafruit_DHT.  The
+reading of each pin is set in sensors as {pin: (temperature_C, humidity)};
+pins not listed read default.  Readings have gaussian noise and are
+rounded to the sensor's 0.1 steps.
+
+A read bit-bangs the 40 bit frame, taking read_time.  Like the real
+sensor, a read sooner than min_interval after the last one on the same pin
+fails, and read_retry() waits delay_seconds between attempts.
+
+faults (a simulator.faults.Faults) understands 'checksum' and 'timeout'
+(the read returns (None, None), a timeout after twice the read time) and
+'garbage' (a frame with a good checksum but a corrupted sign or high byte,
+which reads as an absurd value).
+'''
+
+from __future__ import division, print_function
+
+## Import General Tools
+import time
+
+import simulator.faults
+from simulator.faults import Faults, sleep
+
+
+DHT11 = 11
+DHT22 = 22
+AM2302 = 22
+
+faults = Faults()
+default = (21.0, 45.0)
+sensors = {}
+noise = 0.1
+read_time = 0.005
+min_interval = 2.
+last_read = {}
+reads = 0
+
+
+def read(sensor, pin, platform=None):
+    '''Return (humidity, temperature_C) or (None, None).
+    '''
+    global reads
+    if sensor not in [DHT11, DHT22]:
+        raise ValueError('Expected DHT11, DHT22, or AM2302 sensor value.')
+    if pin is None or int(pin) < 0 or int(pin) > 31:
+        raise ValueError('Pin must be a valid GPIO number 0 to 31.')
+    reads += 1
+    fault = faults.next()
+    sleep(read_time * (2 if fault == 'timeout' else 1))
+    now = time.time()
+    too_soon = now - last_read.get(pin, 0) < min_interval * simulator.faults.time_scale
+    last_read[pin] = now
+    if too_soon or fault in ['checksum', 'timeout']:
+        return None, None
+    temperature, humidity = sensors.get(pin, default)
+    temperature += faults.random.gauss(0, noise)
+    humidity = min(max(humidity + faults.random.gauss(0, noise), 0.), 100.)
+    if sensor == DHT11:
+        temperature, humidity = float(round(temperature)), float(round(humidity))
+    else:
+        temperature, humidity = round(temperature, 1), round(humidity, 1)
+    if fault == 'garbage':
+        if faults.random.random() < 0.5:
+            temperature = -3276.7 + temperature
+        else:
+            humidity = 3276.8 - humidity
+    return humidity, temperature
+
+
+def read_retry(sensor, pin, retries=15, delay_seconds=2, platform=None):
+    for attempt in range(retries):
+        humidity, temperature = read(sensor, pin, platform)
+        if humidity is not None and temperature is not None:
+            return humidity, temperature
+        sleep(delay_seconds)
+    return None, None
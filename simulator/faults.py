@@ -0,0 +1,70 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import random
+import time
+
+
+## Every simulated delay is multiplied by time_scale, so a benchmark can run
+## the slow devices (the DHT22 retry delay, a long exposure) faster than real
+## time while keeping their relative costs.
+time_scale = 1.
+
+
+def sleep(seconds):
+    if seconds > 0 and time_scale > 0:
+        time.sleep(seconds * time_scale)
+
+
+##-------------------------------------------------------------------------
+## Define Faults Class
+##-------------------------------------------------------------------------
+class Faults(object):
+    '''Injectable faults for a fake device.
+
+    rates maps a fault name to the probability that an operation suffers it,
+    e.g. Faults(crc=0.05, timeout=0.01, garbage=0.01).  Each fake documents
+    the faults it understands; others are ignored.  next() draws the fault of
+    one operation (None for a clean one) and counts what was injected, so a
+    benchmark can compare the errors a driver saw with those injected.
+    force() makes the next operations fail a given way regardless of rates.
+    '''
+    def __init__(self, seed=None, **rates):
+        assert sum(rates.values()) <= 1., 'Fault rates add up to more than 1'
+        self.rates = rates
+        self.random = random.Random(seed)
+        self.forced = []
+        self.injected = {}
+        self.operations = 0
+
+    def force(self, fault, count=1):
+        self.forced.extend([fault] * count)
+
+    def next(self):
+        self.operations += 1
+        if self.forced:
+            fault = self.forced.pop(0)
+        else:
+            fault = None
+            draw = self.random.random()
+            for name in sorted(self.rates.keys()):
+                if draw < self.rates[name]:
+                    fault = name
+                    break
+                draw -= self.rates[name]
+        if fault:
+            self.injected[fault] = self.injected.get(fault, 0) + 1
+        return fault
+
+    def garbage(self, size):
+        '''Random bytes, as from line noise or a device talking at the wrong
+        baud rate.
+        '''
+        return bytes(bytearray([self.random.randint(0, 255) for i in range(size)]))
+
+    def summary(self):
+        return ', '.join(['{} {}'.format(name, self.injected[name]) for name in sorted(self.injected)])\
+               or 'none'
+
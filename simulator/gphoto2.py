@@ -0,0 +1,248 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import sys
+import os
+import json
+import stat
+
+import simulator.faults
+from simulator.faults import Faults, sleep
+
+
+## The config tree of the fake camera: path, label, choices and current
+## value, as a Canon reports them.
+ConfigTree = [
+    ('/main/imgsettings/imageformat', 'Image Format',
+     ['Large Fine JPEG', 'Large Normal JPEG', 'Small Fine JPEG', 'RAW + Small Fine JPEG',
+      'RAW + Large Fine JPEG'],
+     'Large Fine JPEG'),
+    ('/main/imgsettings/iso', 'ISO Speed',
+     ['Auto', '100', '125', '160', '200', '250', '320', '400', '500', '640', '800', '1000',
+      '1250', '1600', '2000', '2500', '3200', '4000', '5000', '6400'], '100'),
+    ('/main/capturesettings/autoexposuremode', 'Canon Auto Exposure Mode',
+     ['P', 'Tv', 'Av', 'M', 'Bulb'], 'Av'),
+    ('/main/capturesettings/focusmode', 'Focus Mode',
+     ['One Shot', 'AI Focus', 'AI Servo'], 'One Shot'),
+    ('/main/capturesettings/aperture', 'Aperture',
+     ['1.8', '2.0', '2.2', '2.5', '2.8', '3.2', '3.5', '4.0', '4.5', '5.0', '5.6', '6.3',
+      '7.1', '8.0', '9.0', '10', '11', '13', '16', '22'], '5.6'),
+    ('/main/capturesettings/shutterspeed', 'Shutter Speed',
+     ['bulb', '30', '25', '20', '15', '13', '10', '8', '6', '5', '4', '3.2', '2.5', '2', '1.6',
+      '1.3', '1', '0.8', '0.6', '0.5', '0.4', '0.3', '1/4', '1/5', '1/6', '1/8', '1/10', '1/13',
+      '1/15', '1/20', '1/25', '1/30', '1/40', '1/50', '1/60', '1/80', '1/100', '1/125', '1/160',
+      '1/200', '1/250', '1/320', '1/400', '1/500', '1/640', '1/800', '1/1000', '1/1250',
+      '1/1600', '1/2000', '1/2500', '1/3200', '1/4000'], '1/125'),
+    ('/main/status/batterylevel', 'Battery Level', None, '100%'),
+]
+
+Errors = {'timeout': "*** Error (-10: 'Timeout reading from or writing to the port') ***",
+          'busy': "*** Error (-110: 'I/O in progress') ***",
+          'nodevice': '*** Error: No camera found. ***'}
+
+
+def seconds(shutter):
+    if '/' in shutter:
+        numerator, denominator = shutter.split('/')
+        return float(numerator) / float(denominator)
+    try:
+        return float(shutter)
+    except ValueError:
+        return 1.
+
+
+##-------------------------------------------------------------------------
+## Fake gphoto2 Executable
+##-------------------------------------------------------------------------
+class FakeGphoto2(object):
+    '''A gphoto2 executable driving a simulated DSLR.
+
+    start() writes an executable named gphoto2 into directory, which
+    DSLR_Control.Camera runs in place of the real one
+    (Camera(gphoto=fake.path, port='usb:001,001')).  It answers --summary,
+    --list-config, --get-config, --set-config-index and
+    --capture-image-and-download --filename in gphoto2's output format.  The
+    camera's settings live in a JSON state file beside it, so they persist
+    between calls as on a camera.
+
+    Each call costs open_time for opening the USB connection; a capture adds
+    the exposure and the download of the file(s) at usb_rate bytes/s.  The
+    JPEG is a real JPEG (with PIL) of a scene of brightness scene (EV at
+    ISO 100), exposed to mid grey when the shutter, aperture and ISO match
+    it, so exposure ramps can be run against it.
+
+    faults (a simulator.faults.Faults) understands 'timeout' (gphoto2 hangs
+    for hang seconds and fails), 'busy' (I/O in progress), 'nodevice' (the
+    camera dropped off the USB bus) and 'garbage' (the output is replaced by
+    noise but gphoto2 exits 0).
+    '''
+    def __init__(self, directory, model='Canon EOS 5D Mark II', serial='0123456789',\
+                 open_time=0.3, usb_rate=20e6, raw_size=2000000, scene=12., hang=5.,\
+                 faults=None):
+        self.directory = directory
+        self.path = os.path.join(directory, 'gphoto2')
+        self.state_file = os.path.join(directory, 'gphoto2_state.json')
+        self.model = model
+        self.serial = serial
+        self.open_time = open_time
+        self.usb_rate = usb_rate
+        self.raw_size = raw_size
+        self.scene = scene
+        self.hang = hang
+        self.faults = faults or Faults()
+
+    def start(self):
+        state = {'model': self.model, 'serial': self.serial, 'open_time': self.open_time,
+                 'usb_rate': self.usb_rate, 'raw_size': self.raw_size, 'scene': self.scene,
+                 'hang': self.hang, 'time_scale': simulator.faults.time_scale,
+                 'faults': self.faults.rates, 'forced': self.faults.forced,
+                 'injected': {}, 'calls': 0, 'captures': 0,
+                 'config': dict([(path, current) for path, label, choices, current in ConfigTree])}
+        save_state(self.state_file, state)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(self.path, 'w') as FO:
+            FO.write('#!{}\n'.format(sys.executable))
+            FO.write('import sys\nsys.path.insert(0, {!r})\n'.format(root))
+            FO.write('import simulator.gphoto2\n')
+            FO.write('sys.exit(simulator.gphoto2.run({!r}, sys.argv[1:]))\n'.format(self.state_file))
+        os.chmod(self.path, os.stat(self.path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return self
+
+    def state(self):
+        with open(self.state_file, 'r') as FO:
+            return json.load(FO)
+
+    def force(self, fault, count=1):
+        '''Make the next count calls fail with fault.
+        '''
+        state = self.state()
+        state['forced'].extend([fault] * count)
+        save_state(self.state_file, state)
+
+    def stop(self):
+        for file in [self.path, self.state_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def save_state(file, state):
+    with open(file+'.tmp', 'w') as FO:
+        json.dump(state, FO)
+    os.rename(file+'.tmp', file)
+
+
+def write_frame(filename, state):
+    '''Write a synthetic JPEG exposed at the camera's settings.
+    '''
+    config = state['config']
+    iso = config['/main/imgsettings/iso']
+    level = 128. * 2**state['scene'] * seconds(config['/main/capturesettings/shutterspeed']) *\
+            (int(iso) if iso.isdigit() else 400) / 100. / float(config['/main/capturesettings/aperture'])**2
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:
+        with open(filename, 'wb') as FO:
+            FO.write(b'\xff\xd8\xff\xe0' + bytes(bytearray(min(int(level), 255) for i in range(4096))) + b'\xff\xd9')
+        return
+    gradient = np.linspace(0.5, 1.5, 640)[np.newaxis, :] * np.linspace(1.2, 0.8, 480)[:, np.newaxis]
+    frame = np.clip(level * gradient + np.random.standard_normal(gradient.shape) * 2., 0, 255)
+    Image.fromarray(frame.astype(np.uint8)).save(filename, 'JPEG')
+
+
+def run(state_file, argv):
+    '''The fake gphoto2 command line.  Returns the exit status.
+    '''
+    with open(state_file, 'r') as FO:
+        state = json.load(FO)
+    simulator.faults.time_scale = state['time_scale']
+    faults = Faults(**state['faults'])
+    faults.forced = state['forced']
+    fault = faults.next()
+    state['calls'] += 1
+    if fault:
+        state['injected'][fault] = state['injected'].get(fault, 0) + 1
+    save_state(state_file, state)
+
+    sleep(state['open_time'])
+    if fault == 'timeout':
+        sleep(state['hang'])
+    if fault in Errors:
+        sys.stderr.write(Errors[fault] + '\n')
+        return 1
+    if fault == 'garbage':
+        sys.stdout.write(faults.garbage(200).decode('latin-1') + '\n')
+        return 0
+
+    output = []
+    trees = dict([(path, (label, choices)) for path, label, choices, current in ConfigTree])
+    i = 0
+    while i < len(argv):
+        option = argv[i]
+        value = argv[i+1] if i + 1 < len(argv) else None
+        if option in ['--port', '--filename', '--get-config', '--set-config-index']:
+            i += 1
+        i += 1
+        if option == '--summary':
+            output.append('Camera summary:')
+            output.append('Manufacturer: Canon Inc.')
+            output.append('Model: {}'.format(state['model']))
+            output.append('  Version: 3-2.1.2')
+            output.append('  Serial Number: {}'.format(state['serial']))
+        elif option == '--list-config':
+            output.extend([path for path, label, choices, current in ConfigTree])
+        elif option == '--get-config':
+            if value not in trees:
+                sys.stderr.write('*** Error: {} not found in configuration tree. ***\n'.format(value))
+                return 1
+            label, choices = trees[value]
+            sleep(0.02)
+            output.append('Label: {}'.format(label))
+            output.append('Readonly: {}'.format(0 if choices else 1))
+            output.append('Type: {}'.format('RADIO' if choices else 'TEXT'))
+            output.append('Current: {}'.format(state['config'][value]))
+            for index, choice in enumerate(choices or []):
+                output.append('Choice: {} {}'.format(index, choice))
+            output.append('END')
+        elif option == '--set-config-index':
+            path, index = value.split('=')
+            label, choices = trees.get(path, (None, None))
+            if not choices or not 0 <= int(index) < len(choices):
+                sys.stderr.write('*** Error (-2: \'Bad parameters\') ***\n')
+                return 1
+            sleep(0.05)
+            state['config'][path] = choices[int(index)]
+        elif option == '--capture-image-and-download':
+            filename = None
+            for j in range(len(argv) - 1):
+                if argv[j] == '--filename':
+                    filename = argv[j+1]
+            imageformat = state['config']['/main/imgsettings/imageformat']
+            suffixes = (['cr2'] if 'RAW' in imageformat.upper() else []) +\
+                       (['jpg'] if 'JPEG' in imageformat else [])
+            sleep(seconds(state['config']['/main/capturesettings/shutterspeed']))
+            for suffix in suffixes:
+                number = state['captures']
+                state['captures'] += 1
+                name = (filename or 'capt{:04d}.%C').replace('%C', suffix)
+                output.append('New file is in location /capt{:04d}.{} on the camera'.format(number, suffix))
+                if suffix == 'jpg':
+                    write_frame(name, state)
+                else:
+                    with open(name, 'wb') as FO:
+                        FO.write(os.urandom(state['raw_size']))
+                sleep(os.path.getsize(name) / state['usb_rate'])
+                output.append('Saving file as {}'.format(name))
+                output.append('Deleting file /capt{:04d}.{} on the camera'.format(number, suffix))
+    save_state(state_file, state)
+    if output:
+        print('\n'.join(output))
+    return 0
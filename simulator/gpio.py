@@ -0,0 +1,125 @@
+#!/usr/env/python
+
+'''A fake RPi.GPIO.
+
+simulator.install() puts this module in sys.modules as RPi.GPIO, so the
+relay code runs unchanged.  It checks calls the way the real library does
+(numbering mode set, channel set up as an output) and keeps the level of
+every channel in levels and each output call in history as (time, channel,
+level).  set_input() drives the level an input reads.
+
+faults (a simulator.faults.Faults) understands 'stuck': the output call
+returns but the level does not change, as with a welded relay contact.
+'''
+
+from __future__ import division, print_function
+
+## Import General Tools
+import time
+
+from simulator.faults import Faults
+
+
+BOARD = 10
+BCM = 11
+OUT = 0
+IN = 1
+LOW = 0
+HIGH = 1
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RPI_REVISION = 3
+VERSION = '0.6.5 (simulated)'
+
+faults = Faults()
+mode = None
+warnings = True
+directions = {}
+levels = {}
+history = []
+
+
+def reset():
+    '''Forget all state, as after a reboot.
+    '''
+    global mode, warnings
+    mode = None
+    warnings = True
+    directions.clear()
+    levels.clear()
+    del history[:]
+
+
+def setmode(new_mode):
+    global mode
+    if new_mode not in [BOARD, BCM]:
+        raise ValueError('An invalid mode was passed to setmode()')
+    if mode is not None and new_mode != mode:
+        raise ValueError('A different mode has already been set!')
+    mode = new_mode
+
+
+def getmode():
+    return mode
+
+
+def setwarnings(flag):
+    global warnings
+    warnings = bool(flag)
+
+
+def _channels(channel):
+    if mode is None:
+        raise RuntimeError('Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) '\
+                           'or GPIO.setmode(GPIO.BCM)')
+    channels = list(channel) if isinstance(channel, (list, tuple)) else [channel]
+    for number in channels:
+        if not isinstance(number, int) or not 0 <= number <= (27 if mode == BCM else 40):
+            raise ValueError('The channel sent is invalid on a Raspberry Pi')
+    return channels
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=None):
+    if direction not in [IN, OUT]:
+        raise ValueError('An invalid direction was passed to setup()')
+    for number in _channels(channel):
+        directions[number] = direction
+        if direction == OUT and initial is not None:
+            levels[number] = int(bool(initial))
+        elif direction == OUT:
+            levels.setdefault(number, LOW)
+        else:
+            levels.setdefault(number, HIGH if pull_up_down == PUD_UP else LOW)
+
+
+def output(channel, state):
+    channels = _channels(channel)
+    states = list(state) if isinstance(state, (list, tuple)) else [state] * len(channels)
+    for number, level in zip(channels, states):
+        if directions.get(number) != OUT:
+            raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+        if faults.next() != 'stuck':
+            levels[number] = int(bool(level))
+        history.append((time.time(), number, int(bool(level))))
+
+
+def input(channel):
+    number = _channels(channel)[0]
+    if number not in directions:
+        raise RuntimeError('You must setup() the GPIO channel first')
+    return levels.get(number, LOW)
+
+
+def set_input(channel, level):
+    levels[channel] = int(bool(level))
+
+
+def cleanup(channel=None):
+    global mode
+    channels = list(directions.keys()) if channel is None else _channels(channel)
+    for number in channels:
+        directions.pop(number, None)
+        levels.pop(number, None)
+    if channel is None:
+        mode = None
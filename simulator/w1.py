@@ -0,0 +1,209 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import errno
+import fcntl
+import random
+import struct
+import termios
+import threading
+import time
+
+from simulator.faults import Faults, sleep
+
+
+##-------------------------------------------------------------------------
+## Fake 1-Wire sysfs Tree
+##-------------------------------------------------------------------------
+class FakeW1(object):
+    '''A fake /sys/bus/w1/devices tree of DS18B20 probes.
+
+    Each probe directory has a resolution attribute and a w1_slave file in the
+    format written by the w1_therm driver.  Readings are quantized to the
+    probe's current resolution and have gaussian noise added.
+
+    With latency=True each w1_slave is a named pipe served by a thread which
+    sleeps for the conversion time at the current resolution before answering,
+    and a bus lock makes conversions on the bus serial, so reads block the way
+    they do on real hardware.  With latency=False the files are rewritten by
+    update() and reads return immediately.
+
+    With bulk=True the bus master has a therm_bulk_read attribute.  Writing
+    'trigger' to it converts every probe at once (taking the longest
+    conversion time); it reads -1 until the conversion is done and then 1.
+    As in the w1_therm driver, the result is in each probe's temperature
+    attribute (millidegrees, empty if the read failed); reading w1_slave
+    always starts a new conversion.
+
+    faults (a simulator.faults.Faults) injects the failures seen on long
+    1-Wire runs: 'crc' (corrupted scratchpad, CRC check NO), 'reset' (the
+    85 C power-on value with a good CRC), 'missing' (an empty w1_slave, as
+    when a probe drops off the bus) and 'timeout' (the read blocks for
+    hang seconds before answering; latency=True only).
+    '''
+    conversion_time = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+
+    def __init__(self, root, probes=None, noise=0.03, latency=True, bulk=False,\
+                 faults=None, hang=3.):
+        self.root = root
+        if probes is None:
+            probes = {'28-000004a1b2c3': 3.5,
+                      '28-000004a1b2c4': 3.8,
+                      '28-000004a1b2c5': 4.1}
+        self.temperatures = dict(probes)
+        self.noise = noise
+        self.latency = latency
+        self.bulk = bulk
+        self.faults = faults or Faults()
+        self.hang = hang
+        self.bus_lock = threading.Lock()
+        self.running = False
+        self.threads = []
+
+    def path(self, probe, name=None):
+        if name:
+            return os.path.join(self.root, probe, name)
+        return os.path.join(self.root, probe)
+
+    def resolution(self, probe):
+        with open(self.path(probe, 'resolution'), 'r') as FO:
+            return int(FO.read().strip())
+
+    def millidegrees(self, probe):
+        step = 0.0625 * 2**(12 - self.resolution(probe))
+        value = self.temperatures[probe] + random.gauss(0, self.noise)
+        return int(round(round(value / step) * step * 1000))
+
+    def reading(self, probe, fault=None):
+        '''Return w1_slave contents for one conversion of a probe.
+        '''
+        millidegrees = self.millidegrees(probe)
+        if fault == 'missing':
+            return ''
+        if fault == 'reset':
+            millidegrees = 85000
+        raw = '72 01 4b 46 7f ff 0e 10 57'
+        if fault == 'crc':
+            raw = ' '.join(['{:02x}'.format(byte) for byte in bytearray(self.faults.garbage(9))])
+            millidegrees = self.faults.random.randint(-55000, 125000)
+            return '{} : crc={} NO\n{} t={}\n'.format(raw, raw[-2:], raw, millidegrees)
+        return '{} : crc=57 YES\n{} t={}\n'.format(raw, raw, millidegrees)
+
+    def start(self):
+        self.running = True
+        for probe in sorted(self.temperatures.keys()):
+            if not os.path.exists(self.path(probe)):
+                os.makedirs(self.path(probe))
+            if not os.path.exists(self.path(probe, 'resolution')):
+                with open(self.path(probe, 'resolution'), 'w') as FO:
+                    FO.write('12\n')
+            if self.latency:
+                if not os.path.exists(self.path(probe, 'w1_slave')):
+                    os.mkfifo(self.path(probe, 'w1_slave'))
+                thread = threading.Thread(target=self.serve, args=(probe,))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        if self.bulk:
+            master = os.path.join(self.root, 'w1_bus_master1')
+            if not os.path.exists(master):
+                os.makedirs(master)
+            with open(os.path.join(master, 'therm_bulk_read'), 'w') as FO:
+                FO.write('0\n')
+            thread = threading.Thread(target=self.serve_bulk, args=(master,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        if not self.latency:
+            self.update()
+        return self
+
+    def serve_bulk(self, master):
+        '''Watch therm_bulk_read for a trigger and convert every probe.
+        '''
+        file = os.path.join(master, 'therm_bulk_read')
+        while self.running:
+            with open(file, 'r') as FO:
+                request = FO.read().strip()
+            if request != 'trigger':
+                time.sleep(0.001)
+                continue
+            with open(file, 'w') as FO:
+                FO.write('-1\n')
+            with self.bus_lock:
+                sleep(max([self.conversion_time[self.resolution(probe)]\
+                                for probe in self.temperatures] + [0]))
+                for probe in self.temperatures:
+                    fault = self.faults.next()
+                    value = '' if fault in ['crc', 'missing'] else\
+                            '85000\n' if fault == 'reset' else '{}\n'.format(self.millidegrees(probe))
+                    with open(self.path(probe, 'temperature')+'.tmp', 'w') as FO:
+                        FO.write(value)
+                    os.rename(self.path(probe, 'temperature')+'.tmp', self.path(probe, 'temperature'))
+            with open(file, 'w') as FO:
+                FO.write('1\n')
+
+    def update(self):
+        '''Rewrite every w1_slave with a new reading (latency=False only).
+        '''
+        for probe in self.temperatures.keys():
+            with open(self.path(probe, 'w1_slave'), 'w') as FO:
+                FO.write(self.reading(probe, self.faults.next()))
+
+    def open_writer(self, fifo):
+        '''Open the write end of a pipe if a reader has it open, otherwise
+        return None.
+        '''
+        try:
+            return os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return None
+            raise
+
+    def pending(self, fd):
+        '''Bytes written to a pipe and not yet read.
+        '''
+        return struct.unpack('i', fcntl.ioctl(fd, termios.FIONREAD, b'\0'*4))[0]
+
+    def serve(self, probe):
+        fifo = self.path(probe, 'w1_slave')
+        while self.running:
+            fd = self.open_writer(fifo)
+            if fd is None:
+                time.sleep(0.001)
+                continue
+            fault = self.faults.next()
+            with self.bus_lock:
+                sleep(self.conversion_time[self.resolution(probe)])
+                if fault == 'timeout':
+                    sleep(self.hang)
+                contents = self.reading(probe, fault)
+            try:
+                os.write(fd, contents.encode())
+                ## Hold the pipe open until the reader has taken the whole
+                ## reading, so closing it hands the reader the end of file
+                ## and the next reader to open the pipe gets a new conversion
+                end = time.time() + 1.
+                while self.running and self.pending(fd) and time.time() < end:
+                    time.sleep(0.0005)
+            except OSError:
+                pass
+            os.close(fd)
+            ## Let the reader close the pipe before looking for the next one
+            time.sleep(0.001)
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(1.)
+        self.threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,86 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import shutil
+import tempfile
+import unittest
+
+import DS18B20
+from simulator.faults import Faults
+from simulator.w1 import FakeW1
+
+
+Probe = '28-000004a1b2c3'
+
+
+##-------------------------------------------------------------------------
+## Probes on a Fake 1-Wire sysfs Tree
+##-------------------------------------------------------------------------
+class TestDS18B20(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.faults = Faults(seed=1)
+        self.w1 = FakeW1(self.root, probes={Probe: 3.5}, noise=0., latency=False,\
+                         faults=self.faults).start()
+        self.path = os.path.join(self.root, Probe)
+
+    def tearDown(self):
+        self.w1.stop()
+        shutil.rmtree(self.root)
+
+    def test_devices(self):
+        self.assertEqual(DS18B20.devices(self.root), [self.path])
+
+    def test_set_resolution(self):
+        self.assertEqual(DS18B20.get_resolution(self.path), 12)
+        self.assertTrue(DS18B20.set_resolution(self.path, 10))
+        self.assertEqual(DS18B20.get_resolution(self.path), 10)
+
+    def test_set_resolution_skips_matching_write(self):
+        ## Each write wears the probe's EEPROM, so an unchanged resolution
+        ## must leave the attribute untouched
+        file = os.path.join(self.path, 'resolution')
+        os.utime(file, (0, 0))
+        self.assertTrue(DS18B20.set_resolution(self.path, 12))
+        self.assertEqual(os.stat(file).st_mtime, 0)
+
+    def test_read_device(self):
+        self.assertEqual(DS18B20.read_device(self.path), 3.5)
+
+    def test_read_device_quantized(self):
+        DS18B20.set_resolution(self.path, 9)
+        self.w1.temperatures[Probe] = 3.3
+        self.w1.update()
+        self.assertEqual(DS18B20.read_device(self.path), 3.5)
+
+    def test_read_device_rejects_power_on_reset(self):
+        self.faults.force('reset')
+        self.w1.update()
+        self.assertIsNone(DS18B20.read_device(self.path))
+
+    def test_read_device_rejects_bad_crc(self):
+        self.faults.force('crc')
+        self.w1.update()
+        self.assertIsNone(DS18B20.read_device(self.path))
+
+    def test_read_device_missing(self):
+        self.faults.force('missing')
+        self.w1.update()
+        self.assertIsNone(DS18B20.read_device(self.path))
+
+    def test_read_temperature(self):
+        file = os.path.join(self.path, 'temperature')
+        self.assertIsNone(DS18B20.read_temperature(self.path))
+        with open(file, 'w') as FO:
+            FO.write('3500\n')
+        self.assertEqual(DS18B20.read_temperature(self.path), 3.5)
+        with open(file, 'w') as FO:
+            FO.write('{}\n'.format(DS18B20.PowerOnReset))
+        self.assertIsNone(DS18B20.read_temperature(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
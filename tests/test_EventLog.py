@@ -0,0 +1,67 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import shutil
+import tempfile
+import unittest
+
+import EventLog
+
+
+##-------------------------------------------------------------------------
+## Event Log
+##-------------------------------------------------------------------------
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'relay.log')
+        self.log = EventLog.EventLog(self.path)
+        for timestamp, state in [(100, 'off'), (150, 'off'), (200, 'on'), (300, 'off')]:
+            self.log.record(timestamp, state)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_changes_recorded(self):
+        self.assertEqual(len(self.log), 3)
+        self.assertEqual(self.log.transitions(), [(100, 'unknown', 'off'), (200, 'off', 'on'),\
+                                                  (300, 'on', 'off')])
+
+    def test_state_at(self):
+        self.assertEqual(self.log.state_at(50), 'unknown')
+        self.assertEqual(self.log.state_at(100), 'off')
+        self.assertEqual(self.log.state_at(199), 'off')
+        self.assertEqual(self.log.state_at(200), 'on')
+        self.assertEqual(self.log.state_at(1000), 'off')
+        self.assertIsNone(EventLog.EventLog(os.path.join(self.directory, 'empty.log')).state_at(0))
+
+    def test_steps(self):
+        self.assertEqual(self.log.steps(150, 350), ([150, 200, 300, 350], ['off', 'on', 'off', 'off']))
+        self.assertEqual(self.log.steps(200, 250), ([200, 250], ['on', 'on']))
+        self.assertEqual(self.log.durations(150, 350), {'off': 100, 'on': 100})
+
+    def test_reread(self):
+        log = EventLog.EventLog(self.path)
+        self.assertEqual(log.transitions(), self.log.transitions())
+        self.log.record(400, 'on')
+        log.refresh()
+        self.assertEqual(log.current(), 'on')
+
+    def test_malformed_lines_skipped(self):
+        with open(self.path, 'a') as FO:
+            FO.write('# comment\nnot a line\nx off on\n400 off on\n')
+        log = EventLog.EventLog(self.path)
+        self.assertEqual(len(log), 4)
+        self.assertEqual(log.current(), 'on')
+
+    def test_clock_step_back(self):
+        self.assertTrue(self.log.record(250, 'on'))
+        self.assertEqual(self.log.transitions(300), [(300, 'on', 'off'), (300, 'off', 'on')])
+        self.assertEqual(self.log.current(), 'on')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import Filters
+
+
+##-------------------------------------------------------------------------
+## Rolling Median and Hampel Filter
+##-------------------------------------------------------------------------
+class TestRollingMedian(unittest.TestCase):
+    def test_against_sort(self):
+        generator = random.Random(2)
+        for window in [1, 2, 5, 8]:
+            rolling = Filters.RollingMedian(window)
+            values = []
+            for i in range(200):
+                value = generator.choice([generator.gauss(0, 1), float(generator.randint(0, 3))])
+                rolling.push(value)
+                values = (values + [value])[-window:]
+                ordered = sorted(values)
+                n = len(ordered)
+                median = ordered[n//2] if n % 2 else (ordered[n//2-1] + ordered[n//2]) / 2.
+                deviations = sorted([abs(v - median) for v in values])
+                mad = deviations[n//2] if n % 2 else (deviations[n//2-1] + deviations[n//2]) / 2.
+                self.assertAlmostEqual(rolling.median(), median)
+                self.assertAlmostEqual(rolling.mad(), mad)
+
+
+class TestHampelFilter(unittest.TestCase):
+    def test_spike_replaced(self):
+        hampel = Filters.HampelFilter(window=5, threshold=3.)
+        for value in [4.0, 4.1, 3.9, 4.0]:
+            self.assertEqual(hampel.push(value), (value, False))
+        self.assertEqual(hampel.push(85.0), (4.0, True))
+
+    def test_step_passed(self):
+        hampel = Filters.HampelFilter(window=5, threshold=3., min_sigma=0.25)
+        for value in [4.0] * 5:
+            hampel.push(value)
+        results = [hampel.push(10.0) for i in range(3)]
+        self.assertEqual(results[0], (4.0, True))
+        self.assertEqual(results[-1], (10.0, False))
+
+    def test_min_sigma(self):
+        ## With a window of equal values only min_sigma keeps noise from
+        ## being rejected
+        strict = Filters.HampelFilter(window=5, values=[4.0] * 5)
+        floored = Filters.HampelFilter(window=5, values=[4.0] * 5, min_sigma=0.25)
+        self.assertEqual(strict.push(4.25), (4.25, False))
+        self.assertEqual(floored.push(4.5), (4.5, False))
+        self.assertEqual(floored.push(6.0), (4.0, True))
+
+
+class TestChannelFilters(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.directory, 'filters.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fahrenheit_follows_celsius(self):
+        filters = Filters.ChannelFilters()
+        for value in [4.0, 4.1, 3.9, 4.0, 30.0]:
+            filtered = filters.apply('keg', {'temperature_C': value,\
+                                             'temperature_F': value*9./5.+32.})
+        self.assertEqual(filtered['temperature_C'], 4.0)
+        self.assertAlmostEqual(filtered['temperature_F'], 39.2)
+
+    def test_non_numeric_passed(self):
+        filters = Filters.ChannelFilters()
+        filtered = filters.apply('keg', {'temperature_C': None, 'temperature_F': None,\
+                                         'status': 'ok', 'relay': True})
+        self.assertEqual(filtered, {'temperature_C': None, 'temperature_F': None,\
+                                    'status': 'ok', 'relay': True})
+        self.assertEqual(filters.filters, {})
+
+    def test_state_saved(self):
+        filters = Filters.ChannelFilters(state_file=self.state_file)
+        for value in [4.0, 4.1, 3.9, 4.0]:
+            filters.apply('keg', {'temperature_C': value})
+        filters.save()
+        restored = Filters.ChannelFilters(state_file=self.state_file)
+        self.assertEqual(restored.apply('keg', {'temperature_C': 30.0}), {'temperature_C': 4.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
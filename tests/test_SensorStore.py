@@ -0,0 +1,79 @@
+#!/usr/env/python
+
+from __future__ import division, print_function
+
+## Import General Tools
+import os
+import shutil
+import tempfile
+import unittest
+
+import SensorStore
+
+
+##-------------------------------------------------------------------------
+## Sensor Store
+##-------------------------------------------------------------------------
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'sensors.db')
+        self.store = SensorStore.Store(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_write_cycle(self):
+        self.store.write_cycle({'kegerator': [{'timestamp': 2, 'temperature_C': 4.0},\
+                                              {'timestamp': 1, 'temperature_C': 3.5}],\
+                                'humidity': [{'timestamp': 1, 'humidity': 40.0, 'status': 'ok'}]})
+        self.assertEqual(self.store.streams(), ['humidity', 'kegerator'])
+        self.assertEqual(self.store.stream_columns('humidity'), ['timestamp', 'humidity', 'status'])
+        self.assertEqual(self.store.latest('kegerator'), {'timestamp': 2, 'temperature_C': 4.0})
+        self.assertEqual(self.store.last_timestamp('humidity'), 1)
+
+    def test_columns_added(self):
+        self.store.write('kegerator', {'timestamp': 1, 'temperature_C': 3.5})
+        self.store.write('kegerator', {'timestamp': 2, 'temperature_C': 4.0, 'relay': True})
+        data = self.store.read_range('kegerator')
+        self.assertEqual(data, {'timestamp': [1, 2], 'temperature_C': [3.5, 4.0], 'relay': [None, 1]})
+
+    def test_same_timestamp_replaces(self):
+        self.store.write('kegerator', {'timestamp': 1, 'temperature_C': 3.5})
+        self.store.write('kegerator', {'timestamp': 1, 'temperature_C': 4.0})
+        self.assertEqual(self.store.read_range('kegerator')['temperature_C'], [4.0])
+
+    def test_failed_cycle_rolled_back(self):
+        self.store.write('kegerator', {'timestamp': 1, 'temperature_C': 3.5})
+        with self.assertRaises(Exception):
+            self.store.write_cycle({'kegerator': [{'timestamp': 2, 'temperature_C': 4.0, 'relay': 1}],\
+                                    'humidity': [{'timestamp': 2, 'humidity': [40.0]}]})
+        self.assertEqual(self.store.streams(), ['kegerator'])
+        self.assertEqual(self.store.read_range('kegerator'), {'timestamp': [1], 'temperature_C': [3.5]})
+        ## The cached columns went with the rollback, so the next write adds
+        ## the column again
+        self.store.write('kegerator', {'timestamp': 3, 'temperature_C': 4.5, 'relay': 0})
+        self.assertEqual(self.store.read_range('kegerator', start=3)['relay'], [0])
+
+    def test_read_range(self):
+        self.store.write_cycle({'kegerator': [{'timestamp': t, 'temperature_C': t/10., 'relay': t % 2}\
+                                              for t in range(10)]})
+        data = self.store.read_range('kegerator', start=3, end=7, columns=['relay'])
+        self.assertEqual(data, {'timestamp': [3, 4, 5, 6], 'relay': [1, 0, 1, 0]})
+        data = self.store.read_range('kegerator', start=3, limit=2)
+        self.assertEqual(data['timestamp'], [3, 4])
+        self.assertEqual(self.store.read_range('missing', columns=['relay']),\
+                         {'timestamp': [], 'relay': []})
+
+    def test_readonly(self):
+        self.store.write('kegerator', {'timestamp': 1, 'temperature_C': 3.5})
+        reader = SensorStore.Store(self.path, readonly=True)
+        try:
+            self.assertEqual(reader.latest('kegerator'), {'timestamp': 1, 'temperature_C': 3.5})
+        finally:
+            reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()